@@ -0,0 +1,10 @@
+# gunicorn.conf.py — lido automaticamente pelo gunicorn (Procfile: gunicorn odutech:app)
+
+
+def post_worker_init(worker):
+    """Aquece o worker (conexões, templates, consultas) antes de ele aceitar requests."""
+    from odutech.saude import aquecer
+    try:
+        aquecer()
+    except Exception as e:  # o worker sobe mesmo assim; /readyz segue respondendo 503
+        worker.log.exception(f"Falha no aquecimento: {e}")
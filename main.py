@@ -3,13 +3,15 @@ from flask_bcrypt import generate_password_hash
 
 # ==== MODELO DO USUÁRIO ====
 try:
-    from odutech.models import Usuario
+    from odutech.models import Usuario, atualizar_schema
 except Exception:
-    from models import Usuario
+    from models import Usuario, atualizar_schema
 
 # ==== IMPORTS CLI ====
 import argparse
 import getpass
+import os
+import time
 
 # =============================================================================
 # UTILITÁRIOS PARA USUÁRIOS (CLI)
@@ -58,6 +60,41 @@ def run_cli_tools():
     parser = argparse.ArgumentParser(description="Gerenciar usuários do sistema")
     parser.add_argument("--add-user", action="store_true", help="Adicionar novo usuário")
     parser.add_argument("--list-users", action="store_true", help="Listar usuários existentes")
+    parser.add_argument("--rebuild-linhagem", action="store_true",
+                        help="Resolver campos rituais e reconstruir a closure table da linhagem")
+    parser.add_argument("--find-duplicates", action="store_true",
+                        help="Listar clientes que parecem cadastrados em dobro (nada é alterado)")
+    parser.add_argument("--merge-duplicates", action="store_true",
+                        help="Mesclar os clientes duplicados certos (mesmo nome, nascimento e inicial da mãe)")
+    parser.add_argument("--merge-group", metavar="ID,ID,...",
+                        help="Mesclar um grupo conferido (o primeiro id é o principal); exige --email")
+    parser.add_argument("--split-shards", action="store_true",
+                        help="Copiar os dados de cada usuário do banco principal para o seu shard (SHARD_DIR)")
+    parser.add_argument("--force", action="store_true",
+                        help="Com --split-shards: recriar shards que já têm dados; com --index-documents: reindexar todos")
+    parser.add_argument("--index-documents", action="store_true",
+                        help="Extrair o texto dos documentos ainda não indexados para a busca (--force: todos)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Com --index-documents: extrações em paralelo")
+    parser.add_argument("--link-executors", action="store_true",
+                        help="Vincular atendimentos antigos à tabela de executores (em cada shard)")
+    parser.add_argument("--archive", action="store_true",
+                        help="Mover atendimentos de meses fechados para o arquivo (ver --months)")
+    parser.add_argument("--months", type=int,
+                        help="Com --archive: meses mantidos na tabela quente (padrão: ARQUIVO_MESES, 12)")
+    parser.add_argument("--backup", action="store_true",
+                        help="Backup online do banco (e shards) + snapshot incremental dos uploads em BACKUP_DIR")
+    parser.add_argument("--verify-backup", nargs="?", const="", metavar="NOME",
+                        help="Verificar um snapshot (padrão: o mais recente)")
+    parser.add_argument("--restore-backup", metavar="NOME", help="Restaurar um snapshot em --target")
+    parser.add_argument("--target", help="Com --restore-backup: diretório vazio de destino")
+    parser.add_argument("--slow-queries", action="store_true",
+                        help="Resumo do log de consultas lentas (CONSULTAS_LENTAS=1) por tempo total")
+    parser.add_argument("--top", type=int, default=10, help="Com --slow-queries: quantas consultas mostrar")
+    parser.add_argument("--bench-compression", action="store_true",
+                        help="Medir bytes e tempo por rota sem e com compressão/minificação")
+    parser.add_argument("--email", help="Com --bench-compression: usuário usado nas páginas (padrão: o primeiro); "
+                                        "com --merge-group: dono dos clientes")
     args, _ = parser.parse_known_args()
 
     if args.add_user:
@@ -82,8 +119,163 @@ def run_cli_tools():
             print("ℹ️  Nenhum usuário cadastrado.")
         else:
             print("👥 Usuários existentes:")
-            for u, e in usuarios:
-                print(f" - {u:<20} {e}")
+            if app.config['SHARDING']:
+                from odutech.shards import listar_usuarios
+                for info in listar_usuarios():
+                    shard = (f"{info['bytes'] / 1024:>8.0f} KB  {info['clientes']} clientes, "
+                             f"{info['atendimentos']} atendimentos, {info['produtos']} produtos"
+                             if info['existe'] else "sem shard")
+                    print(f" - {info['username']:<20} {info['email']:<30} {shard}")
+            else:
+                for u, e in usuarios:
+                    print(f" - {u:<20} {e}")
+        return
+
+    if args.find_duplicates or args.merge_duplicates:
+        from odutech.duplicados import mesclar_todos
+        relatorio = mesclar_todos(aplicar=args.merge_duplicates)
+        if not relatorio:
+            print("✅ Nenhum cliente duplicado encontrado.")
+        for usuario, certos, parecidos in relatorio:
+            print(f"👥 {usuario.username} ({usuario.email}): {len(certos)} grupo(s) certo(s)"
+                  + (" mesclado(s)" if args.merge_duplicates else "") + f", {len(parecidos)} para conferir")
+            for titulo, grupos in (("certo", certos), ("conferir", parecidos)):
+                for principal, *duplicados in grupos:
+                    print(f"   [{titulo}] #{principal[0]} {principal[1]} ({principal[2]:%d/%m/%Y}) <- "
+                          + ", ".join(f"#{i} {nome}" for i, nome, _ in duplicados))
+        if any(certos for _, certos, _ in relatorio) and not args.merge_duplicates:
+            print("ℹ️  Use --merge-duplicates para mesclar os grupos certos.")
+        if any(parecidos for _, _, parecidos in relatorio):
+            print("ℹ️  Grupos para conferir não são mesclados sozinhos: use --merge-group ID,ID,... --email ...")
+        return
+
+    if args.merge_group:
+        from odutech.duplicados import mesclar_grupo
+        usuario = Usuario.query.filter_by(email=args.email or '').first()
+        if not usuario:
+            print("❌ Informe o dono dos clientes com --email.")
+            return
+        try:
+            ids = [int(i) for i in args.merge_group.split(',') if i.strip()]
+            mesclados = mesclar_grupo(usuario.id, ids)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+        print(f"✅ #{ids[0]} <- " + ", ".join(f"#{i} {nome}" for i, nome in mesclados))
+        return
+
+    if args.split_shards:
+        from odutech.shards import dividir_banco
+        print(f"🗂️  Dividindo o banco em shards por usuário em {app.config['SHARD_DIR']}")
+        for usuario, copiadas in dividir_banco(substituir=args.force):
+            if copiadas is None:
+                print(f" - {usuario.username:<20} já tem dados (use --force para recriar)")
+            else:
+                print(f" - {usuario.username:<20} " + ", ".join(f"{t}={n}" for t, n in copiadas.items() if n))
+        if not app.config['SHARDING']:
+            print("ℹ️  Defina SHARDING=1 para passar a usar os shards.")
+        return
+
+    if args.archive:
+        from odutech import arquivo
+        print(f"🗄️  Arquivando atendimentos anteriores a {arquivo.data_corte(args.months):%d/%m/%Y}...")
+        for usuario, movidos, restantes in arquivo.arquivar(meses=args.months):
+            print(f"   {usuario.username:<20} {movidos} arquivado(s), {restantes} na tabela quente")
+        return
+
+    if args.backup or args.verify_backup is not None or args.restore_backup:
+        from odutech import backup
+        pasta = backup.diretorio_backups()
+        try:
+            if args.backup:
+                inicio = time.perf_counter()
+                manifesto = backup.criar_backup()
+                print(f"💾 Snapshot {manifesto['nome']} em {pasta} ({time.perf_counter() - inicio:.1f}s)")
+                for rel, info in manifesto['bancos'].items():
+                    print(f"   - {rel:<30} {info['tamanho'] / 1024:>10.0f} KB")
+                print(f"   - uploads: {len(manifesto['uploads'])} arquivo(s), {manifesto['uploads_novos']} novo(s)/alterado(s) "
+                      f"({manifesto['uploads_bytes_novos'] / 1024:.0f} KB copiados)")
+            elif args.restore_backup:
+                alvo = args.target or os.path.join(pasta, f"restauracao-{args.restore_backup}")
+                total = backup.restaurar(args.restore_backup, alvo)
+                print(f"♻️  Snapshot {args.restore_backup} restaurado em {alvo}: "
+                      f"{total['bancos']} banco(s), {total['uploads']} arquivo(s) de upload.")
+                print("ℹ️  Pare o app e copie banco/ e uploads/ para os caminhos de produção.")
+            else:
+                snapshots = backup.listar_snapshots()
+                nome = args.verify_backup or (snapshots[-1] if snapshots else None)
+                if not nome:
+                    print(f"ℹ️  Nenhum snapshot em {pasta}.")
+                    return
+                problemas = backup.verificar(nome)
+                if problemas:
+                    print(f"❌ Snapshot {nome}: {len(problemas)} problema(s)")
+                    for p in problemas:
+                        print(f"   - {p}")
+                else:
+                    print(f"✅ Snapshot {nome} íntegro.")
+        except backup.ErroBackup as e:
+            print(f"❌ {e}")
+        return
+
+    if args.index_documents:
+        from odutech.textos import indexar_pendentes, PdfReader
+        if PdfReader is None:
+            print("⚠️  Pacote pypdf não instalado: PDFs ficarão sem texto.")
+        relatorio = indexar_pendentes(workers=args.workers, refazer=args.force)
+        if not relatorio:
+            print("✅ Nenhum documento pendente.")
+        for usuario, contagem in relatorio:
+            print(f"📄 {usuario.username:<20} " + ", ".join(f"{s}={n}" for s, n in sorted(contagem.items())))
+        return
+
+    if args.link_executors:
+        from odutech.executores import vincular_pendentes
+        relatorio = vincular_pendentes()
+        if not relatorio:
+            print("✅ Nenhum atendimento sem executor vinculado.")
+        for usuario, vinculados in relatorio:
+            print(f"🧑 {usuario.username:<20} {vinculados} atendimento(s) vinculado(s)")
+        return
+
+    if args.slow_queries:
+        from odutech import consultas_lentas
+        arquivo = app.config['CONSULTAS_LENTAS_ARQUIVO']
+        consultas = consultas_lentas.resumo(top=args.top)
+        if not consultas:
+            print(f"ℹ️  Nenhuma consulta lenta em {arquivo}"
+                  + ("." if app.config['CONSULTAS_LENTAS'] else " (defina CONSULTAS_LENTAS=1 para registrar)."))
+            return
+        print(f"🐢 Consultas lentas (≥ {app.config['CONSULTAS_LENTAS_MS']:g} ms) em {arquivo}, por tempo total")
+        for n, c in enumerate(consultas, 1):
+            print(f"\n{n:>2}. {c['total_ms']:>10.0f} ms no total  {c['vezes']}x  "
+                  f"médio {c['medio_ms']:.0f} ms  máx {c['max_ms']:.0f} ms  (última: {c['ultima']})")
+            print(f"    {c['sql'][:300]}")
+            print("    endpoints: " + ", ".join(f"{e} ({v})" for e, v in c['endpoints'][:3]))
+            if c['scan']:
+                print("    ⚠️  SCAN em tabela grande: " + ", ".join(f"{t} (~{l:,} linhas)" for t, l in c['scan'].items()))
+            for detalhe in c['plano'] or ():
+                print(f"      plano: {detalhe}")
+        return
+
+    if args.bench_compression:
+        from odutech.compressao import benchmark
+        usuario = (Usuario.query.filter_by(email=args.email).first() if args.email
+                   else Usuario.query.order_by(Usuario.id).first())
+        if not usuario:
+            print("❌ Usuário não encontrado.")
+            return
+        print(f"📦 Páginas de {usuario.username} (mediana de 5 requisições)")
+        print(f"{'rota':<32} {'antes':>10} {'ms':>7}   {'depois':>10} {'ms':>7}  {'redução':>7}")
+        for rota, b_antes, ms_antes, b_depois, ms_depois, cod in benchmark(usuario):
+            reducao = (1 - b_depois / b_antes) * 100 if b_antes else 0
+            print(f"{rota:<32} {b_antes:>10,} {ms_antes:>7.1f}   {b_depois:>10,} {ms_depois:>7.1f}  {reducao:>6.1f}%  ({cod})")
+        return
+
+    if args.rebuild_linhagem:
+        from odutech.linhagem import reconstruir_linhagem
+        total = reconstruir_linhagem()
+        print(f"🌳 Linhagem reconstruída para {total} cliente(s).")
         return
 
 # =============================================================================
@@ -92,8 +284,8 @@ def run_cli_tools():
 
 if __name__ == "__main__":
     with app.app_context():
-        # Criar banco de dados
-        database.create_all()
+        # Criar banco de dados (e colunas/índices novos em bancos existentes)
+        atualizar_schema()
         print("✅ Banco de dados criado com sucesso!")
 
         # Garantir o admin padrão
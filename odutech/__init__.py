@@ -29,6 +29,11 @@ if DB_URL.startswith('sqlite:///'):
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     print(f"[init] Usando banco SQLite em: {db_path}")
 
+# Um arquivo SQLite por usuário (SHARDING=1) → odutech/shards.py
+app.config['SHARDING'] = os.getenv('SHARDING') == '1'
+app.config['SHARD_DIR'] = os.getenv('SHARD_DIR') or os.path.join(
+    os.path.dirname(db_path) if DB_URL.startswith('sqlite:///') else app.instance_path, 'shards')
+
 # =========================
 # Uploads persistentes
 # =========================
@@ -65,7 +70,10 @@ except Exception as e:
 # =========================
 # Extensões Flask
 # =========================
-database = SQLAlchemy(app)
+from odutech.shards import SessaoRoteada  # noqa: E402
+from odutech import consultas_lentas  # noqa: E402  (CONSULTAS_LENTAS=1: antes de qualquer engine)
+
+database = SQLAlchemy(app, session_options={'class_': SessaoRoteada})
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 csrf = CSRFProtect(app)
@@ -79,8 +87,8 @@ login_manager.login_message = 'Por favor, faça login para acessar esta página.
 if os.getenv('AUTO_DB_CREATE') == '1':
     try:
         with app.app_context():
-            from odutech.models import Usuario  # evita import circular
-            database.create_all()
+            from odutech.models import Usuario, atualizar_schema  # evita import circular
+            atualizar_schema()
             if not Usuario.query.first():
                 from flask_bcrypt import generate_password_hash
                 admin = Usuario(
@@ -99,3 +107,6 @@ if os.getenv('AUTO_DB_CREATE') == '1':
 # Importar rotas
 # =========================
 from odutech import routes  # noqa
+from odutech import api  # noqa
+from odutech import compressao  # noqa
+from odutech import saude  # noqa
@@ -0,0 +1,141 @@
+# odutech/analise_produtos.py
+"""
+Desempenho dos produtos e alerta de estoque baixo (produtos_desempenho e /api/produtos/desempenho).
+
+Uma única consulta: os atendimentos do usuário agrupados por produto em LEFT JOIN com Produto.
+O histórico inteiro é atendimento + atendimento_arquivo (odutech/arquivo.py): cada tabela é
+agrupada no próprio índice covering (ix_atendimento_usuario_produto /
+ix_atendimento_arquivo_usuario_produto, já na ordem do GROUP BY) e os dois parciais são
+somados por produto. Unidades, receita e vendas contam só a janela escolhida; a última venda
+é de todo o histórico.
+
+Velocidade = unidades na janela / dias da janela (ou desde o cadastro, se o produto é mais
+novo). Com ela, o estoque atual vira "dura N dias" e o produto é marcado como sem estoque,
+crítico (≤ DIAS_CRITICO) ou baixo (≤ alerta).
+
+O resultado fica em memória por usuário, com a versão dos dados (ContadorSync, que toda
+gravação em produtos/atendimentos incrementa): a primeira gravação seguinte invalida.
+"""
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func, case, union_all
+
+from odutech import database
+from odutech.models import Produto, Atendimento, AtendimentoArquivo, ContadorSync
+
+JANELAS = (30, 60, 90, 180, 365)
+DIAS_CRITICO = 7
+ORDEM_STATUS = {'sem_estoque': 0, 'critico': 1, 'baixo': 2, 'ok': 3, 'parado': 4}
+
+_cache = {}  # id_usuario -> {'versao': int, 'relatorios': {(janela, alerta, dia): dict}}
+_cache_lock = threading.Lock()
+
+
+def versao_dados(id_usuario: int) -> int:
+    valor = database.session.query(ContadorSync.valor).filter(ContadorSync.id_usuario == id_usuario).scalar()
+    return valor or 0
+
+
+def _por_produto(tabela, id_usuario: int, inicio: datetime):
+    a = tabela.c
+    na_janela = a.data_atendimento >= inicio
+    return (select(a.id_produto.label('id_produto'),
+                   func.sum(case((na_janela, a.quantidade_produto), else_=0)).label('unidades'),
+                   func.sum(case((na_janela, a.valor_total), else_=0.0)).label('receita'),
+                   func.sum(case((na_janela, 1), else_=0)).label('vendas'),
+                   func.max(a.data_atendimento).label('ultima_venda'))
+            .where(a.id_usuario == id_usuario, a.id_produto.isnot(None))
+            .group_by(a.id_produto))
+
+
+def _linhas(id_usuario: int, inicio: datetime):
+    parciais = union_all(*(_por_produto(t, id_usuario, inicio)
+                           for t in (Atendimento.__table__, AtendimentoArquivo.__table__))).subquery()
+    vendas = (select(parciais.c.id_produto,
+                     func.sum(parciais.c.unidades).label('unidades'),
+                     func.sum(parciais.c.receita).label('receita'),
+                     func.sum(parciais.c.vendas).label('vendas'),
+                     func.max(parciais.c.ultima_venda).label('ultima_venda'))
+              .group_by(parciais.c.id_produto)
+              .subquery())
+    stmt = (select(Produto.id, Produto.nome, Produto.preco, Produto.quantidade_estoque, Produto.data_cadastro,
+                   vendas.c.unidades, vendas.c.receita, vendas.c.vendas, vendas.c.ultima_venda)
+            .outerjoin(vendas, vendas.c.id_produto == Produto.id)
+            .where(Produto.id_usuario == id_usuario))
+    return database.session.execute(stmt).all()
+
+
+def _status(estoque: int, velocidade: float, dias_restantes, alerta: int) -> str:
+    if estoque <= 0:
+        return 'sem_estoque'
+    if velocidade <= 0:
+        return 'parado'
+    if dias_restantes <= DIAS_CRITICO:
+        return 'critico'
+    if dias_restantes <= alerta:
+        return 'baixo'
+    return 'ok'
+
+
+def calcular(id_usuario: int, janela: int = 90, alerta: int = 30) -> dict:
+    hoje = date.today()
+    inicio = datetime.combine(hoje - timedelta(days=janela - 1), datetime.min.time())
+    produtos = []
+    for p in _linhas(id_usuario, inicio):
+        unidades = int(p.unidades or 0)
+        desde_cadastro = (hoje - p.data_cadastro.date()).days + 1 if p.data_cadastro else janela
+        dias = max(1, min(janela, desde_cadastro))
+        velocidade = unidades / dias
+        estoque = p.quantidade_estoque or 0
+        dias_restantes = estoque / velocidade if velocidade > 0 and estoque > 0 else None
+        produtos.append({
+            'id': p.id,
+            'nome': p.nome,
+            'preco': p.preco or 0.0,
+            'estoque': estoque,
+            'unidades': unidades,
+            'receita': float(p.receita or 0.0),
+            'vendas': int(p.vendas or 0),
+            'ultima_venda': p.ultima_venda,
+            'velocidade': velocidade,
+            'dias_restantes': dias_restantes,
+            'ruptura': hoje + timedelta(days=int(dias_restantes)) if dias_restantes is not None else None,
+            'status': _status(estoque, velocidade, dias_restantes, alerta),
+        })
+    produtos.sort(key=lambda p: (ORDEM_STATUS[p['status']],
+                                 p['dias_restantes'] if p['dias_restantes'] is not None else 0,
+                                 -p['receita'], p['nome']))
+
+    por_status = {s: 0 for s in ORDEM_STATUS}
+    for p in produtos:
+        por_status[p['status']] += 1
+    return {
+        'janela': janela,
+        'alerta': alerta,
+        'inicio': inicio.date(),
+        'produtos': produtos,
+        'por_status': por_status,
+        'totais': {'receita': sum(p['receita'] for p in produtos),
+                   'unidades': sum(p['unidades'] for p in produtos),
+                   'valor_estoque': sum(p['estoque'] * p['preco'] for p in produtos if p['estoque'] > 0)},
+        'gerado_em': datetime.now(),
+    }
+
+
+def desempenho(id_usuario: int, janela: int = 90, alerta: int = 30) -> dict:
+    """calcular() com cache por usuário até a próxima gravação (ou a virada do dia)."""
+    versao = versao_dados(id_usuario)
+    chave = (janela, alerta, date.today())
+    with _cache_lock:
+        entrada = _cache.get(id_usuario)
+        if entrada and entrada['versao'] == versao and chave in entrada['relatorios']:
+            return entrada['relatorios'][chave]
+
+    resultado = calcular(id_usuario, janela, alerta)
+    with _cache_lock:
+        entrada = _cache.get(id_usuario)
+        if not entrada or entrada['versao'] != versao:
+            entrada = _cache[id_usuario] = {'versao': versao, 'relatorios': {}}
+        entrada['relatorios'][chave] = resultado
+    return resultado
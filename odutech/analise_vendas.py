@@ -0,0 +1,223 @@
+# odutech/analise_vendas.py
+"""
+Análises de vendas vetorizadas (NumPy) para relatorios_vendas e /api/relatorios/vendas.
+
+Busca apenas as colunas (data_atendimento, valor_total, tipo_atendimento, forma_pagamento,
+id_produto) do período como arrays compactos e faz todas as agregações com
+np.bincount/np.unique/np.cumsum, sem instanciar objetos Atendimento.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select, func, cast, String
+
+from odutech import database, arquivo
+from odutech.models import Atendimento, Produto, normalizar
+
+GRANULARIDADES = ('dia', 'semana', 'mes')
+TIPOS_RELATORIO = ['ebó', 'gbory', 'obrigacao', 'obrigação', 'buzios', 'outro']
+
+
+def _um_ano_antes(d: date) -> date:
+    try:
+        return d.replace(year=d.year - 1)
+    except ValueError:  # 29/02
+        return d.replace(year=d.year - 1, day=28)
+
+
+def carregar(id_usuario: int, inicio: date = None, fim: date = None, tipo: str = None) -> dict:
+    """
+    Colunas do período [inicio, fim] (datas inclusivas) como arrays NumPy.
+    Consulta Core no índice (id_usuario, data_atendimento), com o arquivo só se o período chegar
+    nele; a data vem como texto 'AAAA-MM-DD' e é convertida de uma vez pelo NumPy, sem criar um
+    datetime Python por linha.
+    """
+    de = datetime.combine(inicio, datetime.min.time()) if inicio else None
+    ate = datetime.combine(fim + timedelta(days=1), datetime.min.time()) if fim else None
+    a = arquivo.fonte(id_usuario, de, ate)
+    stmt = (select(func.substr(cast(a.c.data_atendimento, String), 1, 10),
+                   a.c.valor_total, a.c.tipo_atendimento, a.c.forma_pagamento, a.c.id_produto)
+            .where(a.c.id_usuario == id_usuario))
+    if de:
+        stmt = stmt.where(a.c.data_atendimento >= de)
+    if ate:
+        stmt = stmt.where(a.c.data_atendimento < ate)
+    if tipo:
+        stmt = stmt.where(a.c.tipo_atendimento == tipo)
+
+    return _colunas(database.session.connection(bind_arguments={'mapper': Atendimento}).execute(stmt).all())
+
+
+def _colunas(linhas) -> dict:
+    datas, valores, tipos, formas, produtos = zip(*linhas) if linhas else ((), (), (), (), ())
+    return {
+        'dia': np.array(datas, dtype='datetime64[D]'),
+        'valor': np.nan_to_num(np.array(valores, dtype=np.float64)),
+        'tipo': np.array([t or '' for t in tipos], dtype=object),
+        'forma': np.array([f or '' for f in formas], dtype=object),
+        'produto': np.array([p or 0 for p in produtos], dtype=np.int64),
+    }
+
+
+def limites(id_usuario: int, inicio: date = None, fim: date = None, tipo: str = None):
+    """Primeira e última data com atendimento no filtro (None, None se vazio)."""
+    extremos = []
+    # min/max em cada tabela (busca direta no índice), não sobre a união
+    for modelo in (arquivo.MODELOS if arquivo.alcanca_arquivo(id_usuario, inicio) else arquivo.MODELOS[:1]):
+        query = database.session.query(func.min(modelo.data_atendimento), func.max(modelo.data_atendimento)) \
+            .filter(modelo.id_usuario == id_usuario)
+        if tipo:
+            query = query.filter(modelo.tipo_atendimento == tipo)
+        extremos.extend(d for d in query.one() if d is not None)
+    if not extremos:
+        return None, None
+    menor, maior = min(extremos), max(extremos)
+    return max(inicio or menor.date(), menor.date()), min(fim or maior.date(), maior.date())
+
+
+def carregar_por_ano(id_usuario: int, inicio: date = None, fim: date = None, tipo: str = None, progresso=None) -> dict:
+    """
+    Igual a carregar(), mas em fatias anuais (históricos grandes); chama progresso(fração)
+    ao fim de cada fatia.
+    """
+    ini, fim_real = limites(id_usuario, inicio, fim, tipo)
+    if ini is None or fim_real < ini:
+        return _colunas([])
+    partes = []
+    anos = list(range(ini.year, fim_real.year + 1))
+    for n, ano in enumerate(anos, start=1):
+        partes.append(carregar(id_usuario, max(ini, date(ano, 1, 1)), min(fim_real, date(ano, 12, 31)), tipo))
+        if progresso:
+            progresso(n / len(anos))
+    return {k: np.concatenate([p[k] for p in partes]) for k in partes[0]}
+
+
+def _chaves(dias, granularidade: str):
+    """Início do balde de cada data: o próprio dia, a segunda-feira da semana ou o mês."""
+    if granularidade == 'mes':
+        return dias.astype('datetime64[M]')
+    if granularidade == 'semana':
+        # 1970-01-01 foi quinta-feira: (dias + 3) % 7 == 0 nas segundas
+        return dias - ((dias.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    return dias
+
+
+def _passo(granularidade: str):
+    return {'dia': np.timedelta64(1, 'D'), 'semana': np.timedelta64(7, 'D'), 'mes': np.timedelta64(1, 'M')}[granularidade]
+
+
+def serie(dados: dict, granularidade: str = 'dia', inicio: date = None, fim: date = None):
+    """
+    Receita e contagem por balde, incluindo baldes vazios entre inicio e fim.
+    Retorna (eixo datetime64, receita float64, contagem int64).
+    """
+    dias = dados['dia']
+    lo = np.datetime64(inicio, 'D') if inicio else (dias.min() if dias.size else None)
+    hi = np.datetime64(fim, 'D') if fim else (dias.max() if dias.size else None)
+    if lo is None or hi is None or hi < lo:
+        return np.array([], dtype='datetime64[D]'), np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    lo, hi = _chaves(np.array([lo, hi]), granularidade)
+    passo = _passo(granularidade)
+    eixo = np.arange(lo, hi + passo, passo)
+    idx = ((_chaves(dias, granularidade) - lo) // passo).astype(np.int64)
+    dentro = (idx >= 0) & (idx < eixo.size)
+    receita = np.bincount(idx[dentro], weights=dados['valor'][dentro], minlength=eixo.size)
+    contagem = np.bincount(idx[dentro], minlength=eixo.size)
+    return eixo, receita, contagem
+
+
+def media_movel(valores, janela: int):
+    """Média móvel simples; os primeiros pontos usam a janela parcial disponível."""
+    valores = np.asarray(valores, dtype=np.float64)
+    if valores.size == 0 or janela <= 1:
+        return valores.copy()
+    acumulado = np.concatenate(([0.0], np.cumsum(valores)))
+    janela = min(janela, valores.size)
+    saida = np.empty_like(valores)
+    saida[janela - 1:] = (acumulado[janela:] - acumulado[:-janela]) / janela
+    saida[:janela - 1] = acumulado[1:janela] / np.arange(1, janela)
+    return saida
+
+
+def agrupar(categorias, valores):
+    """(categoria, quantidade, soma) por valor distinto, ordenado pela soma."""
+    if categorias.size == 0:
+        return []
+    unicos, inverso = np.unique(categorias, return_inverse=True)
+    quantidades = np.bincount(inverso, minlength=unicos.size)
+    somas = np.bincount(inverso, weights=valores, minlength=unicos.size)
+    ordem = np.argsort(-somas, kind='stable')
+    return [(unicos[i], int(quantidades[i]), float(somas[i])) for i in ordem]
+
+
+def estatisticas_por_tipo(dados: dict) -> dict:
+    """Mesmo formato do dicionário 'estatisticas' do template (tipos comparados sem acento/caixa)."""
+    grupos = {}
+    for tipo, qtd, soma in agrupar(dados['tipo'], dados['valor']):
+        chave = normalizar(tipo)
+        q, s = grupos.get(chave, (0, 0.0))
+        grupos[chave] = (q + qtd, s + soma)
+    return {t: {'quantidade': grupos.get(normalizar(t), (0, 0.0))[0],
+                'valor_total': grupos.get(normalizar(t), (0, 0.0))[1]}
+            for t in TIPOS_RELATORIO}
+
+
+def _rotulo(periodo, granularidade: str) -> str:
+    return str(periodo.astype('datetime64[M]' if granularidade == 'mes' else 'datetime64[D]'))
+
+
+def resumo(id_usuario: int, inicio: date = None, fim: date = None, tipo: str = None,
+           granularidade: str = 'dia', janela: int = 7, dados: dict = None) -> dict:
+    """Tudo que a página de relatórios e a API precisam, em tipos serializáveis em JSON."""
+    if granularidade not in GRANULARIDADES:
+        granularidade = 'dia'
+    dados = dados if dados is not None else carregar(id_usuario, inicio, fim, tipo)
+    total = float(dados['valor'].sum())
+    quantidade = int(dados['valor'].size)
+
+    eixo, receita, contagem = serie(dados, granularidade, inicio, fim)
+    mm = media_movel(receita, janela)
+
+    ini_atual = inicio or (dados['dia'].min().astype(date) if quantidade else None)
+    fim_atual = fim or (dados['dia'].max().astype(date) if quantidade else None)
+    dias_periodo = (fim_atual - ini_atual).days + 1 if ini_atual and fim_atual else 0
+
+    # Comparativo com o mesmo período do ano anterior (mensal)
+    anual = None
+    if ini_atual and fim_atual:
+        ini_ant, fim_ant = _um_ano_antes(ini_atual), _um_ano_antes(fim_atual)
+        anterior = carregar(id_usuario, ini_ant, fim_ant, tipo)
+        eixo_a, receita_a, _ = serie(dados, 'mes', ini_atual, fim_atual)
+        _, receita_b, _ = serie(anterior, 'mes', ini_ant, fim_ant)
+        total_ant = float(anterior['valor'].sum())
+        anual = {
+            'periodo_anterior': [ini_ant.isoformat(), fim_ant.isoformat()],
+            'receita_atual': total,
+            'receita_anterior': total_ant,
+            'variacao_pct': ((total - total_ant) / total_ant * 100) if total_ant else None,
+            'mensal': [{'mes': _rotulo(m, 'mes'), 'atual': float(a), 'anterior': float(b)}
+                       for m, a, b in zip(eixo_a, receita_a, receita_b)],
+        }
+
+    produtos = agrupar(dados['produto'][dados['produto'] > 0], dados['valor'][dados['produto'] > 0])[:10]
+    nomes = dict(database.session.query(Produto.id, Produto.nome)
+                 .filter(Produto.id.in_([int(p) for p, _, _ in produtos])).all()) if produtos else {}
+
+    return {
+        'filtros': {'data_inicio': inicio.isoformat() if inicio else None,
+                    'data_fim': fim.isoformat() if fim else None,
+                    'tipo': tipo or None, 'granularidade': granularidade, 'janela': janela},
+        'totais': {'receita': total, 'atendimentos': quantidade,
+                   'ticket_medio': total / quantidade if quantidade else 0.0,
+                   'atendimentos_por_dia': quantidade / dias_periodo if dias_periodo else 0.0},
+        'serie': [{'periodo': _rotulo(p, granularidade), 'receita': float(r), 'atendimentos': int(c),
+                   'media_movel': float(m)} for p, r, c, m in zip(eixo, receita, contagem, mm)],
+        'pagamentos': [{'forma': f or 'nao_informado', 'atendimentos': q, 'receita': s,
+                        'percentual': (s / total * 100) if total else 0.0}
+                       for f, q, s in agrupar(dados['forma'], dados['valor'])],
+        'tipos': [{'tipo': t, 'atendimentos': q, 'receita': s} for t, q, s in agrupar(dados['tipo'], dados['valor'])],
+        'produtos': [{'id_produto': int(p), 'nome': nomes.get(int(p)), 'atendimentos': q, 'receita': s}
+                     for p, q, s in produtos],
+        'comparativo_anual': anual,
+    }
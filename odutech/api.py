@@ -0,0 +1,482 @@
+# odutech/api.py
+"""
+API JSON (/api/v1) para o app do tablet da recepção, ao lado das rotas HTML.
+
+Autenticação: POST /api/v1/token com {"email", "senha", "nome"} devolve um token; as demais
+chamadas enviam "Authorization: Bearer <token>" (sem cookie de sessão e sem CSRF).
+
+Leitura:  GET /api/v1/<recurso>?campos=id,nome&apos_id=0&limite=500  (recurso = clientes,
+          produtos ou atendimentos). Só as colunas pedidas são lidas do banco, sem instanciar
+          objetos do ORM; paginação por id (use "proximo" como apos_id da próxima página).
+
+Escrita:  POST /api/v1/<recurso> com {"itens": [...]}, ou POST /api/v1/lote com
+          {"clientes": [...], "produtos": [...], "atendimentos": [...]} (nesta ordem).
+          Item com "id" = atualização parcial (campos ausentes mantêm o valor atual); sem "id" =
+          criação. Cada item passa pelo mesmo Form das telas (FormCliente, FormProduto,
+          FormAtendimento). O lote inteiro é uma transação: se um item falhar, nada é gravado.
+          Itens criados podem levar um "ref" do app; atendimentos do mesmo lote apontam para
+          eles com "cliente_ref"/"produto_ref" no lugar de id_cliente/id_produto (refs são texto
+          ou número; outro tipo devolve 400).
+          Cliente novo com possível cadastro em dobro (duplicados.possiveis_duplicados) é recusado
+          com 409, como na tela, a menos que o item traga "confirmar_duplicado": true; na edição,
+          os ids parecidos voltam em "possiveis_duplicados".
+          A resposta traz o id de cada item; ?campos=... (ou ?campos_<recurso>=... no /lote)
+          acrescenta outros campos.
+          Produto existente com "quantidade_estoque" exige "estoque_original" (o saldo que o app
+          leu): o ajuste gravado é novo - original, como na tela, e vendas feitas nesse meio-tempo
+          continuam valendo.
+
+Sincronização: GET /api/v1/sync?since=<seq> devolve só o que mudou depois de <seq> (linhas
+          criadas/alteradas e exclusões), usando a sequência por usuário de models.proximo_seq.
+          Repita com since=<seq devolvido> enquanto "mais" for true.
+"""
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import wraps
+
+from flask import request, g
+from flask_login import current_user
+from werkzeug.datastructures import MultiDict
+
+from odutech import app, database, bcrypt, csrf, login_manager
+from odutech.models import Usuario, Cliente, Produto, Atendimento, ClienteDocumento, Exclusao, TokenApi
+from odutech.forms import FormCliente, FormProduto, FormAtendimento
+from odutech.estoque import movimentar, baixar_atendimento, estornar_atendimento, EstoqueInsuficiente
+from odutech.duplicados import cliente_gravado
+
+try:
+    import orjson
+except ImportError:  # serializador padrão, mais lento
+    orjson = None
+
+app.config.setdefault('API_LOTE_MAXIMO', 2000)    # itens por requisição de escrita
+app.config.setdefault('API_LIMITE_LEITURA', 1000)  # linhas por página de leitura
+app.config.setdefault('API_LIMITE_SYNC', 500)      # alterações por tabela em cada chamada de /sync
+
+_USO_TOKEN_INTERVALO = timedelta(hours=1)  # frequência de gravação de TokenApi.ultimo_uso
+
+# recurso -> (modelo, form, campos legíveis)
+RECURSOS = {
+    'clientes': (Cliente, FormCliente, (
+        'id', 'nome', 'data_nascimento', 'nome_mae', 'data_iniciacao', 'email', 'telefone', 'endereco',
+        'observacoes', 'orunko', 'orixa', 'ajunto', 'foto_path', 'data_cadastro', 'atualizado_em')),
+    'produtos': (Produto, FormProduto, (
+        'id', 'nome', 'descricao', 'preco', 'quantidade_estoque', 'data_cadastro', 'atualizado_em')),
+    'atendimentos': (Atendimento, FormAtendimento, (
+        'id', 'data_atendimento', 'id_cliente', 'id_produto', 'quantidade_produto', 'executor', 'procedimentos',
+        'valor_total', 'forma_pagamento', 'tipo_atendimento', 'detalhes', 'atualizado_em')),
+}
+_NAO_EDITAVEIS = {'csrf_token', 'botao_confirmacao', 'foto'}
+_CAMPO_ATUAL = {'estoque_original': 'quantidade_estoque'}  # campo do form sem coluna -> coluna que o preenche
+
+
+# ==============================
+# JSON
+# ==============================
+def _padrao(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f'{type(valor).__name__} não é serializável')
+
+
+def _json(dados, status: int = 200):
+    if orjson is not None:
+        corpo = orjson.dumps(dados, default=_padrao)
+    else:
+        corpo = json.dumps(dados, default=_padrao, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return app.response_class(corpo, status=status, mimetype='application/json')
+
+
+def _erro(mensagem: str, status: int, **extra):
+    return _json({'erro': mensagem, **extra}, status)
+
+
+# ==============================
+# AUTENTICAÇÃO
+# ==============================
+@login_manager.request_loader
+def _usuario_do_token(req):
+    """Só para /api/v1: o usuário vem do token Bearer, nunca do cookie de sessão."""
+    if not req.path.startswith('/api/v1/'):
+        return None
+    tipo, _, valor = req.headers.get('Authorization', '').partition(' ')
+    if tipo.lower() != 'bearer' or not valor.strip():
+        return None
+    token = TokenApi.query.filter_by(token_hash=TokenApi.hash(valor.strip())).first()
+    if token is None:
+        return None
+    agora = datetime.utcnow()
+    if token.ultimo_uso is None or agora - token.ultimo_uso > _USO_TOKEN_INTERVALO:
+        token.ultimo_uso = agora
+        database.session.commit()
+    g.token_api = token
+    return token.usuario
+
+
+def token_obrigatorio(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # current_user primeiro: é ele que aciona o request_loader
+        if not current_user.is_authenticated or g.get('token_api') is None:
+            return _erro('Token ausente ou inválido.', 401)
+        return view(*args, **kwargs)
+    return csrf.exempt(wrapper)
+
+
+@app.route('/api/v1/token', methods=['POST'])
+@csrf.exempt
+def api_emitir_token():
+    dados = request.get_json(silent=True) or {}
+    usuario = Usuario.query.filter_by(email=(dados.get('email') or '').strip()).first()
+    if not usuario or not bcrypt.check_password_hash(usuario.senha, dados.get('senha') or ''):
+        return _erro('E-mail ou senha inválidos.', 401)
+    token, valor = TokenApi.emitir(usuario, (dados.get('nome') or '')[:80] or None)
+    database.session.commit()
+    return _json({'token': valor, 'id': token.id, 'nome': token.nome}, 201)
+
+
+@app.route('/api/v1/token', methods=['DELETE'])
+@token_obrigatorio
+def api_revogar_token():
+    database.session.delete(g.token_api)
+    database.session.commit()
+    return _json({'revogado': True})
+
+
+# ==============================
+# LEITURA
+# ==============================
+def _campos(validos, parametro: str = 'campos', padrao=None):
+    """?campos=a,b -> tupla validada (sempre com id). None se houver campo desconhecido."""
+    pedidos = [c.strip() for c in request.args.get(parametro, '').split(',') if c.strip()]
+    if not pedidos:
+        return padrao or validos
+    if any(c not in validos for c in pedidos):
+        return None
+    return ('id', *[c for c in dict.fromkeys(pedidos) if c != 'id'])
+
+
+def _serializar(obj, campos) -> dict:
+    return {c: getattr(obj, c) for c in campos}
+
+
+@app.route('/api/v1/<recurso>', methods=['GET'])
+@token_obrigatorio
+def api_listar(recurso):
+    if recurso not in RECURSOS:
+        return _erro('Recurso inexistente.', 404)
+    modelo, _, validos = RECURSOS[recurso]
+    campos = _campos(validos)
+    if campos is None:
+        return _erro('Campo desconhecido.', 400, campos_validos=list(validos))
+
+    apos_id = request.args.get('apos_id', 0, type=int)
+    limite = max(1, min(request.args.get('limite', 500, type=int), app.config['API_LIMITE_LEITURA']))
+    query = (database.session.query(*[getattr(modelo, c) for c in campos])
+             .filter(modelo.id_usuario == current_user.id, modelo.id > apos_id))
+    ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip().isdigit()]
+    if ids:
+        query = query.filter(modelo.id.in_(ids))
+    linhas = query.order_by(modelo.id).limit(limite).all()
+
+    return _json({
+        'itens': [dict(zip(campos, linha)) for linha in linhas],
+        'proximo': linhas[-1][0] if len(linhas) == limite else None,
+    })
+
+
+# ==============================
+# ESCRITA EM LOTE
+# ==============================
+class _ErroLote(Exception):
+    def __init__(self, status: int, mensagem: str, **extra):
+        super().__init__(mensagem)
+        self.status, self.mensagem, self.extra = status, mensagem, extra
+
+
+def _texto(valor) -> str:
+    """Valor JSON/ORM -> texto de formulário, no formato que os campos do WTForms esperam."""
+    if isinstance(valor, (date, datetime)):
+        return valor.strftime('%Y-%m-%d')
+    if isinstance(valor, bool):
+        return 'y' if valor else ''
+    return str(valor)
+
+
+def _ref_valida(ref) -> bool:
+    """ref/cliente_ref/produto_ref: ausente, texto ou inteiro (viram chave de dicionário)."""
+    return ref is None or isinstance(ref, str) or type(ref) is int
+
+
+def _validar(classe_form, valores: dict):
+    dados = MultiDict({k: _texto(v) for k, v in valores.items() if v is not None})
+    form = classe_form(formdata=dados, meta={'csrf': False})
+    if hasattr(form, 'id_cliente'):
+        # a posse do cliente/produto é conferida em _aplicar_atendimento (conjuntos pré-carregados)
+        form.id_cliente.validate_choice = False
+        form.id_produto.validate_choice = False
+    return form
+
+
+class _Duplicado(Exception):
+    def __init__(self, clientes):
+        super().__init__('Possível cadastro duplicado; envie "confirmar_duplicado": true para gravar assim mesmo.')
+        self.ids = [c.id for c in clientes]
+
+
+def _aplicar_cliente(form, cliente, item):
+    """Grava o cliente; devolve (cliente, campos extras da resposta)."""
+    novo = cliente is None
+    chave_anterior = None if novo else cliente.nome_norm
+    if novo:
+        cliente = Cliente(id_usuario=current_user.id)
+        database.session.add(cliente)
+    for campo in ('nome', 'data_nascimento', 'nome_mae', 'data_iniciacao', 'email', 'telefone',
+                  'endereco', 'observacoes'):
+        setattr(cliente, campo, getattr(form, campo).data)
+    database.session.flush()
+    duplicados = cliente_gravado(cliente, chave_anterior)
+    if novo and duplicados and item.get('confirmar_duplicado') is not True:
+        raise _Duplicado(duplicados)
+    return cliente, ({'possiveis_duplicados': [c.id for c in duplicados]} if duplicados else {})
+
+
+def _aplicar_produto(form, produto, item):
+    novo = produto is None
+    if novo:
+        produto = Produto(id_usuario=current_user.id, quantidade_estoque=0)
+        database.session.add(produto)
+    produto.nome = form.nome.data
+    produto.descricao = form.descricao.data
+    produto.preco = float(form.preco.data or 0)
+    database.session.flush()
+    if novo:
+        movimentar(current_user.id, produto.id, int(form.quantidade_estoque.data or 0), 'saldo_inicial')
+    else:
+        movimentar(current_user.id, produto.id,
+                   int(form.quantidade_estoque.data or 0) - int(form.estoque_original.data), 'ajuste')
+    return produto, {}
+
+
+def _aplicar_atendimento(form, atendimento, item):
+    novo = atendimento is None
+    if novo:
+        atendimento = Atendimento(id_usuario=current_user.id)
+        database.session.add(atendimento)
+        anterior = None
+    else:
+        anterior = (atendimento.id_produto, atendimento.quantidade_produto)
+    atendimento.data_atendimento = form.data_atendimento.data
+    atendimento.id_cliente = form.id_cliente.data or None
+    atendimento.id_produto = form.id_produto.data or None
+    atendimento.quantidade_produto = form.quantidade_produto.data or 1
+    atendimento.executor = form.executor.data
+    atendimento.procedimentos = form.procedimentos.data
+    atendimento.valor_total = float(form.valor_total.data or 0)
+    atendimento.forma_pagamento = form.forma_pagamento.data
+    atendimento.tipo_atendimento = form.tipo_atendimento.data
+    atendimento.detalhes = form.detalhes.data
+    database.session.flush()
+    if novo:
+        baixar_atendimento(atendimento)
+    elif anterior != (atendimento.id_produto, atendimento.quantidade_produto):
+        estornar_atendimento(current_user.id, atendimento.id)
+        baixar_atendimento(atendimento)
+    return atendimento, {}
+
+
+_APLICAR = {'clientes': _aplicar_cliente, 'produtos': _aplicar_produto, 'atendimentos': _aplicar_atendimento}
+
+
+def _processar_lote(lotes: dict, campos_resposta: dict) -> list:
+    """
+    Valida e grava os itens (na ordem clientes, produtos, atendimentos) na transação da sessão.
+    Levanta _ErroLote com todos os erros de validação encontrados (400 se algum item estiver
+    malformado, 422 se só houver campos inválidos); o commit fica com quem chama.
+    """
+    refs = {'clientes': {}, 'produtos': {}}
+    ids_validos = {
+        'clientes': {i for (i,) in database.session.query(Cliente.id).filter_by(id_usuario=current_user.id)},
+        'produtos': {i for (i,) in database.session.query(Produto.id).filter_by(id_usuario=current_user.id)},
+    }
+    resultados, erros, malformado = [], [], False
+
+    for recurso in ('clientes', 'produtos', 'atendimentos'):
+        itens = lotes.get(recurso) or []
+        modelo, classe_form, _ = RECURSOS[recurso]
+        editaveis = [f.name for f in classe_form(formdata=None, meta={'csrf': False}) if f.name not in _NAO_EDITAVEIS]
+        existentes = {}
+        ids = [item['id'] for item in itens if isinstance(item, dict) and isinstance(item.get('id'), int)]
+        if ids:
+            existentes = {o.id: o for o in modelo.query.filter(modelo.id_usuario == current_user.id,
+                                                               modelo.id.in_(ids))}
+
+        for indice, item in enumerate(itens):
+            if not isinstance(item, dict):
+                erros.append({'recurso': recurso, 'indice': indice, 'erros': {'item': ['Esperado um objeto.']}})
+                continue
+            chaves_ref = [c for c in ('ref', 'cliente_ref', 'produto_ref') if not _ref_valida(item.get(c))]
+            if chaves_ref:
+                malformado = True
+                erros.append({'recurso': recurso, 'indice': indice,
+                              'erros': {c: ['Referência deve ser texto ou número.'] for c in chaves_ref}})
+                continue
+            obj = None
+            if item.get('id') is not None:
+                obj = existentes.get(item['id']) if isinstance(item['id'], int) else None
+                if obj is None:
+                    erros.append({'recurso': recurso, 'indice': indice, 'erros': {'id': ['Registro não encontrado.']}})
+                    continue
+
+            if (recurso == 'produtos' and obj is not None and 'quantidade_estoque' in item
+                    and type(item.get('estoque_original')) is not int):
+                erros.append({'recurso': recurso, 'indice': indice,
+                              'erros': {'estoque_original': ['Informe o saldo lido antes da alteração.']}})
+                continue
+
+            valores = {c: getattr(obj, _CAMPO_ATUAL.get(c, c)) for c in editaveis} if obj is not None else {}
+            valores.update({k: v for k, v in item.items() if k in editaveis})
+            if recurso == 'atendimentos':
+                for campo, origem in (('id_cliente', 'clientes'), ('id_produto', 'produtos')):
+                    ref = item.get(campo.replace('id_', '') + '_ref')
+                    if ref is not None:
+                        valores[campo] = refs[origem].get(ref, -1)
+
+            form = _validar(classe_form, valores)
+            falhas = {} if form.validate() else dict(form.errors)
+            if recurso == 'atendimentos':
+                if form.id_cliente.data and form.id_cliente.data not in ids_validos['clientes']:
+                    falhas['id_cliente'] = ['Cliente não encontrado.']
+                if form.id_produto.data and form.id_produto.data not in ids_validos['produtos']:
+                    falhas['id_produto'] = ['Produto não encontrado.']
+            if falhas:
+                erros.append({'recurso': recurso, 'indice': indice, 'erros': falhas})
+                continue
+            if erros:
+                continue  # o lote já vai falhar; só coleta os erros restantes
+
+            try:
+                obj, extras = _APLICAR[recurso](form, obj, item)
+            except EstoqueInsuficiente as e:
+                raise _ErroLote(409, str(e), recurso=recurso, indice=indice)
+            except _Duplicado as e:
+                raise _ErroLote(409, str(e), recurso=recurso, indice=indice, possiveis_duplicados=e.ids)
+            if recurso in refs:
+                ids_validos[recurso].add(obj.id)
+                if item.get('ref') is not None:
+                    refs[recurso][item['ref']] = obj.id
+            resultados.append((recurso, indice, item.get('ref'), 'atualizado' if item.get('id') else 'criado',
+                               obj, extras))
+
+    if erros:
+        raise _ErroLote(400 if malformado else 422, 'Há itens inválidos; nada foi gravado.', erros=erros)
+    return [{'recurso': recurso, 'indice': indice, 'ref': ref, 'acao': acao,
+             **_serializar(obj, campos_resposta[recurso]), **extras}
+            for recurso, indice, ref, acao, obj, extras in resultados]
+
+
+def _responder_lote(lotes: dict, parametro=None):
+    """parametro: recurso -> nome do argumento ?campos... que escolhe os campos devolvidos."""
+    total = sum(len(v) for v in lotes.values() if isinstance(v, list))
+    if any(v is not None and not isinstance(v, list) for v in lotes.values()):
+        return _erro('Cada recurso deve ser uma lista de itens.', 400)
+    if total > app.config['API_LOTE_MAXIMO']:
+        return _erro(f"Máximo de {app.config['API_LOTE_MAXIMO']} itens por requisição.", 413)
+
+    campos_resposta = {}
+    for recurso, (_, _, validos) in RECURSOS.items():
+        campos = _campos(validos, (parametro or {}).get(recurso, f'campos_{recurso}'), padrao=('id',))
+        if campos is None:
+            return _erro('Campo desconhecido.', 400, campos_validos=list(validos))
+        campos_resposta[recurso] = campos
+
+    try:
+        resultados = _processar_lote(lotes, campos_resposta)
+        database.session.commit()
+    except _ErroLote as e:
+        database.session.rollback()
+        return _erro(e.mensagem, e.status, **e.extra)
+    except Exception:
+        database.session.rollback()
+        raise
+    return _json({'resultados': resultados}, 200)
+
+
+@app.route('/api/v1/lote', methods=['POST'])
+@token_obrigatorio
+def api_lote():
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict):
+        return _erro('Corpo JSON inválido.', 400)
+    return _responder_lote({r: dados.get(r) for r in RECURSOS if r in dados})
+
+
+@app.route('/api/v1/<recurso>', methods=['POST'])
+@token_obrigatorio
+def api_gravar(recurso):
+    if recurso not in RECURSOS:
+        return _erro('Recurso inexistente.', 404)
+    dados = request.get_json(silent=True)
+    itens = dados.get('itens') if isinstance(dados, dict) else dados
+    if not isinstance(itens, list):
+        return _erro('Envie {"itens": [...]} ou uma lista de itens.', 400)
+    return _responder_lote({recurso: itens}, {recurso: 'campos'})
+
+
+# ==============================
+# DELTA-SYNC
+# ==============================
+_SYNC = {
+    'clientes': (Cliente, RECURSOS['clientes'][2]),
+    'produtos': (Produto, RECURSOS['produtos'][2]),
+    'atendimentos': (Atendimento, RECURSOS['atendimentos'][2]),
+    'documentos': (ClienteDocumento, ('id', 'id_cliente', 'filename_original', 'mimetype', 'size_bytes',
+                                      'uploaded_at', 'atualizado_em')),
+}
+_TABELA_RECURSO = {modelo.__tablename__: recurso for recurso, (modelo, _) in _SYNC.items()}
+
+
+@app.route('/api/v1/sync', methods=['GET'])
+@token_obrigatorio
+def api_sync():
+    """
+    Cada consulta usa o índice (id_usuario, seq) da tabela: o custo acompanha o número de
+    alterações desde `since`, não o tamanho da tabela. Se alguma tabela bater no limite, o
+    corte ("seq" devolvido) é a menor seq entre as tabelas cortadas e tudo acima dela fica
+    para a próxima chamada, para não pular alterações.
+    """
+    desde = request.args.get('since', 0, type=int)
+    limite = app.config['API_LIMITE_SYNC']
+
+    consultas = {recurso: (campos, database.session.query(modelo.seq, *[getattr(modelo, c) for c in campos])
+                           .filter(modelo.id_usuario == current_user.id, modelo.seq > desde)
+                           .order_by(modelo.seq).limit(limite).all())
+                 for recurso, (modelo, campos) in _SYNC.items()}
+    exclusoes = (database.session.query(Exclusao.seq, Exclusao.tabela, Exclusao.id_registro)
+                 .filter(Exclusao.id_usuario == current_user.id, Exclusao.seq > desde)
+                 .order_by(Exclusao.seq).limit(limite).all())
+
+    cortes = [linhas[-1][0] for _, linhas in consultas.values() if len(linhas) == limite]
+    if len(exclusoes) == limite:
+        cortes.append(exclusoes[-1][0])
+    corte = min(cortes) if cortes else None
+
+    def dentro(seq):
+        return corte is None or seq <= corte
+
+    alteracoes = {recurso: [dict(zip(('seq', *campos), linha)) for linha in linhas if dentro(linha[0])]
+                  for recurso, (campos, linhas) in consultas.items()}
+    excluidos = [{'seq': seq, 'recurso': _TABELA_RECURSO.get(tabela, tabela), 'id': id_registro}
+                 for seq, tabela, id_registro in exclusoes if dentro(seq)]
+
+    vistos = [desde, *(itens[-1]['seq'] for itens in alteracoes.values() if itens),
+              *(e['seq'] for e in excluidos[-1:])]
+    return _json({
+        'seq': corte if corte is not None else max(vistos),
+        'mais': corte is not None,
+        'alteracoes': alteracoes,
+        'exclusoes': excluidos,
+    })
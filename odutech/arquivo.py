@@ -0,0 +1,188 @@
+# odutech/arquivo.py
+"""
+Arquivo quente/frio dos atendimentos.
+
+arquivar() (`python main.py --archive`, por exemplo num cron mensal) move, em lotes, os
+atendimentos de meses fechados — anteriores ao primeiro dia do mês de ARQUIVO_MESES meses
+atrás — de `atendimento` para `atendimento_arquivo` (mesmo banco/shard, mesmas colunas e
+ids). A tabela quente e os seus índices ficam com o último ano, por maior que seja o histórico.
+
+Leitura (atendimentos_lista, relatorios_vendas, cliente_detalhes, calendário, resumo):
+- fonte(): tabela Core do período; a união com o arquivo só entra quando o período começa
+  antes (ou na data) do atendimento arquivado mais recente do usuário.
+- listar()/contar()/Paginacao: objetos Atendimento e AtendimentoArquivo na mesma lista, data
+  mais recente primeiro. Se a página inteira é mais nova que o arquivo, só a tabela quente é lida.
+
+Arquivados são só leitura: aparecem em listas e detalhes, sem editar/excluir, e ficam fora da
+API REST/delta-sync. analise_produtos soma as duas tabelas, cada uma no próprio índice por produto
+(a última venda é de todo o histórico).
+"""
+import os
+from datetime import date, datetime
+
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import select, func, literal, union_all
+
+from odutech import app, database
+from odutech.models import Atendimento, AtendimentoArquivo, Usuario, COLUNAS_ATENDIMENTO, atendimentos_com_arquivo
+from odutech.shards import como_usuario
+
+app.config.setdefault('ARQUIVO_MESES', int(os.getenv('ARQUIVO_MESES', '12')))  # meses mantidos na tabela quente
+app.config.setdefault('ARQUIVO_LOTE', 500)                                    # atendimentos por transação
+
+MODELOS = (Atendimento, AtendimentoArquivo)
+
+
+def data_corte(meses: int = None, hoje: date = None) -> datetime:
+    """Primeiro dia do mês de `meses` meses atrás: o que vem antes é período fechado."""
+    meses = app.config['ARQUIVO_MESES'] if meses is None else meses
+    hoje = hoje or date.today()
+    indice = hoje.year * 12 + hoje.month - 1 - meses
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def _datahora(valor):
+    return datetime.combine(valor, datetime.min.time()) if type(valor) is date else valor
+
+
+def mais_recente_arquivado(id_usuario: int):
+    return (database.session.query(func.max(AtendimentoArquivo.data_atendimento))
+            .filter(AtendimentoArquivo.id_usuario == id_usuario).scalar())
+
+
+def alcanca_arquivo(id_usuario: int, inicio=None) -> bool:
+    """O período que começa em `inicio` (None = desde sempre) pode ter atendimentos arquivados?"""
+    limite = mais_recente_arquivado(id_usuario)
+    return limite is not None and (inicio is None or _datahora(inicio) <= limite)
+
+
+def fonte(id_usuario: int, inicio=None, fim=None):
+    """
+    Atendimentos do usuário em [inicio, fim) para consultas Core: Atendimento.__table__ ou, se o
+    período alcança o arquivo, a união das duas tabelas (filtrada por usuário e período em cada
+    lado). As colunas são as de Atendimento; quem consulta repete os próprios filtros.
+    """
+    if not alcanca_arquivo(id_usuario, inicio):
+        return Atendimento.__table__
+    inicio, fim = _datahora(inicio), _datahora(fim)
+
+    def filtro(tabela):
+        criterios = [tabela.c.id_usuario == id_usuario]
+        if inicio:
+            criterios.append(tabela.c.data_atendimento >= inicio)
+        if fim:
+            criterios.append(tabela.c.data_atendimento < fim)
+        return criterios
+    return atendimentos_com_arquivo(filtro)
+
+
+# =========================
+# Listas de objetos
+# =========================
+def _criterios(modelo, id_usuario: int, filtro, inicio, fim):
+    criterios = [modelo.id_usuario == id_usuario]
+    if inicio:
+        criterios.append(modelo.data_atendimento >= _datahora(inicio))
+    if fim:
+        criterios.append(modelo.data_atendimento < _datahora(fim))
+    if filtro:
+        criterios.extend(filtro(modelo))
+    return criterios
+
+
+def _query(modelo, id_usuario, filtro, inicio, fim, opcoes):
+    return (modelo.query.options(*(opcoes(modelo) if opcoes else ())).filter(*_criterios(modelo, id_usuario, filtro, inicio, fim))
+            .order_by(modelo.data_atendimento.desc(), modelo.id.desc()))
+
+
+def listar(id_usuario: int, filtro=None, inicio=None, fim=None, limite: int = 20, offset: int = 0, opcoes=None):
+    """
+    Atendimentos do usuário em [inicio, fim), data mais recente primeiro, quentes e arquivados.
+    filtro(modelo) -> critérios extras escritos para os dois modelos (ex.: modelo.id_cliente == 3);
+    opcoes(modelo) -> opções do ORM (ex.: [joinedload(modelo.produto)]). limite=None: sem limite.
+    """
+    limite_arquivo = mais_recente_arquivado(id_usuario)
+    quentes = _query(Atendimento, id_usuario, filtro, inicio, fim, opcoes).limit(limite).offset(offset).all()
+    if limite_arquivo is None or (inicio is not None and _datahora(inicio) > limite_arquivo) \
+            or (quentes and len(quentes) == limite and quentes[-1].data_atendimento > limite_arquivo):
+        return quentes  # tudo o que vem antes desta página é mais novo que o arquivo
+
+    lados = [select(m.id, m.data_atendimento, literal(n).label('lado'))
+             .where(*_criterios(m, id_usuario, filtro, inicio, fim)) for n, m in enumerate(MODELOS)]
+    uniao = union_all(*lados).subquery()
+    pagina = database.session.execute(
+        select(uniao.c.id, uniao.c.lado)
+        .order_by(uniao.c.data_atendimento.desc(), uniao.c.lado, uniao.c.id.desc())
+        .limit(limite).offset(offset)).all()
+    objetos = {}
+    for n, modelo in enumerate(MODELOS):
+        ids = [i for i, lado in pagina if lado == n]
+        if ids:
+            objetos.update(((n, o.id), o) for o in modelo.query.options(*(opcoes(modelo) if opcoes else ()))
+                           .filter(modelo.id.in_(ids)))
+    return [objetos[(lado, i)] for i, lado in pagina if (lado, i) in objetos]
+
+
+def contar(id_usuario: int, filtro=None, inicio=None, fim=None) -> int:
+    modelos = MODELOS if alcanca_arquivo(id_usuario, inicio) else MODELOS[:1]
+    return sum(database.session.query(func.count(m.id)).filter(*_criterios(m, id_usuario, filtro, inicio, fim)).scalar()
+               for m in modelos)
+
+
+class Paginacao(Pagination):
+    """Pagination do Flask-SQLAlchemy (mesma interface nos templates) sobre listar()/contar()."""
+
+    def _query_items(self):
+        a = self._query_args
+        return listar(a['id_usuario'], a.get('filtro'), a.get('inicio'), a.get('fim'),
+                      limite=self.per_page, offset=self._query_offset, opcoes=a.get('opcoes'))
+
+    def _query_count(self):
+        a = self._query_args
+        return contar(a['id_usuario'], a.get('filtro'), a.get('inicio'), a.get('fim'))
+
+
+def obter(id_usuario: int, id_atendimento: int):
+    """Atendimento (quente ou arquivado) do usuário, ou None."""
+    for modelo in MODELOS:
+        atendimento = modelo.query.filter_by(id=id_atendimento, id_usuario=id_usuario).first()
+        if atendimento is not None:
+            return atendimento
+    return None
+
+
+# =========================
+# Arquivamento (main.py --archive)
+# =========================
+def arquivar(id_usuario: int = None, meses: int = None, lote: int = None):
+    """
+    Move os atendimentos anteriores a data_corte(meses) para o arquivo, `lote` por transação
+    (cópia + exclusão no mesmo commit; leitores nunca veem a linha nos dois lados nem em nenhum).
+    Exclusão via Core: sem tombstone de sync, sem estorno de estoque e sem mexer no ResumoCliente,
+    que já soma o arquivo. Retorna [(usuario, movidos, restantes_na_tabela_quente)].
+    """
+    corte = data_corte(meses)
+    lote = lote or app.config['ARQUIVO_LOTE']
+    a, arq = Atendimento.__table__, AtendimentoArquivo.__table__
+    usuarios = [database.session.get(Usuario, id_usuario)] if id_usuario else Usuario.query.order_by(Usuario.id).all()
+    relatorio = []
+    for usuario in usuarios:
+        movidos = 0
+        with como_usuario(usuario.id):
+            while True:
+                conexao = database.session.connection(bind_arguments={'mapper': Atendimento})
+                ids = [i for (i,) in conexao.execute(
+                    select(a.c.id).where(a.c.id_usuario == usuario.id, a.c.data_atendimento < corte)
+                    .order_by(a.c.data_atendimento).limit(lote))]
+                if not ids:
+                    break
+                conexao.execute(arq.insert().from_select(
+                    COLUNAS_ATENDIMENTO, select(*(a.c[c] for c in COLUNAS_ATENDIMENTO)).where(a.c.id.in_(ids))))
+                conexao.execute(a.delete().where(a.c.id.in_(ids)))
+                database.session.commit()
+                movidos += len(ids)
+            restantes = database.session.query(func.count(Atendimento.id)) \
+                .filter(Atendimento.id_usuario == usuario.id).scalar()
+            database.session.commit()
+        relatorio.append((usuario, movidos, restantes))
+    return relatorio
@@ -0,0 +1,313 @@
+# odutech/backup.py
+"""
+Backups sem parar o sistema: banco SQLite (e shards) + volume de uploads.
+
+Banco: API de backup online do SQLite (sqlite3.Connection.backup) em passos de
+BACKUP_PAGINAS páginas, com uma pausa entre os passos para os escritores avançarem.
+A cópia passa por PRAGMA integrity_check e é gravada comprimida (.db.gz).
+
+Uploads: snapshots incrementais. Cada snapshot tem um manifesto com todos os arquivos
+(tamanho, mtime, sha256 e o snapshot cujo uploads.tar.gz guarda o conteúdo); só entra no
+tar.gz novo o que é novo ou mudou. Tamanho e mtime iguais = não muda; se mudaram, o sha256
+decide (arquivo só "tocado" não é copiado de novo).
+
+    BACKUP_DIR/
+      20261019-120000/
+        manifesto.json
+        banco/comunidade.db.gz
+        banco/shards/usuario_1.db.gz
+        uploads.tar.gz
+
+CLI: `python main.py --backup`, `--verify-backup [NOME]`, `--restore-backup NOME [--target DIR]`.
+A restauração escreve em um diretório separado; trocar os arquivos em produção é manual.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+from odutech import app, database
+
+app.config.setdefault('BACKUP_PAGINAS', 256)     # páginas por passo do backup online
+app.config.setdefault('BACKUP_PAUSA', 0.005)     # segundos entre passos (escritores não ficam bloqueados)
+app.config.setdefault('BACKUP_PAUSA_MAX', 1.0)    # teto da pausa, que dobra a cada recomeço
+app.config.setdefault('BACKUP_REINICIOS', 20)    # recomeços tolerados antes de desistir (ErroBackup)
+
+MANIFESTO = 'manifesto.json'
+PACOTE_UPLOADS = 'uploads.tar.gz'
+
+
+class ErroBackup(Exception):
+    pass
+
+
+def diretorio_backups() -> str:
+    if os.getenv('BACKUP_DIR'):
+        return os.getenv('BACKUP_DIR')
+    base = os.path.dirname(caminho_banco()) if caminho_banco() else app.instance_path
+    return os.path.join(base, 'backups')
+
+
+def caminho_banco():
+    """Arquivo do banco principal (None se não for SQLite em arquivo)."""
+    url = database.engine.url
+    return url.database if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') else None
+
+
+def _bancos():
+    """[(nome relativo no backup, caminho do arquivo)] — banco principal e shards existentes."""
+    bancos = []
+    if caminho_banco():
+        bancos.append((os.path.basename(caminho_banco()), caminho_banco()))
+    pasta = app.config.get('SHARD_DIR')
+    if pasta and os.path.isdir(pasta):
+        for nome in sorted(os.listdir(pasta)):
+            if nome.endswith('.db'):
+                bancos.append((f'shards/{nome}', os.path.join(pasta, nome)))
+    return bancos
+
+
+def _sha256(caminho: str) -> str:
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _integro(caminho: str) -> bool:
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+
+
+# =========================
+# Banco
+# =========================
+class _Reiniciado(Exception):
+    pass
+
+
+def copiar_sqlite(origem: str, destino: str, paginas: int = None, pausa: float = None):
+    """
+    Cópia consistente de um SQLite em uso, em passos de `paginas` (o lock de leitura é solto
+    entre os passos, então escritores nunca esperam mais que um passo). Uma escrita de outra
+    conexão faz o SQLite recomeçar a cópia; a cada passo sem avanço a pausa dobra (até
+    BACKUP_PAUSA_MAX) para a rajada de escritas passar. Depois de BACKUP_REINICIOS passos sem
+    avanço (escrita contínua) desiste com ErroBackup — nunca copia tudo segurando o lock.
+    """
+    paginas = paginas or app.config['BACKUP_PAGINAS']
+    pausa = app.config['BACKUP_PAUSA'] if pausa is None else pausa
+    estado = {'restantes': None, 'reinicios': 0, 'pausa': pausa}
+
+    def progresso(status, restantes, total):
+        if estado['restantes'] is not None and restantes >= estado['restantes']:  # recomeçou ou não andou
+            estado['reinicios'] += 1
+            if estado['reinicios'] > app.config['BACKUP_REINICIOS']:
+                raise _Reiniciado()
+            estado['pausa'] = min(max(estado['pausa'], 0.001) * 2, app.config['BACKUP_PAUSA_MAX'])
+        estado['restantes'] = restantes
+        if restantes:
+            time.sleep(estado['pausa'])
+
+    src = sqlite3.connect(origem, timeout=30)
+    dst = sqlite3.connect(destino)
+    try:
+        src.backup(dst, pages=paginas, progress=progresso)
+    except _Reiniciado:
+        raise ErroBackup(f'{origem}: a cópia recomeçou {estado["reinicios"]} vezes por escritas '
+                         f'contínuas; tente de novo num horário mais calmo.') from None
+    finally:
+        dst.close()
+        src.close()
+    return estado['reinicios']
+
+
+def _backup_banco(origem: str, destino_gz: str) -> dict:
+    os.makedirs(os.path.dirname(destino_gz), exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        copia = os.path.join(tmp, 'copia.db')
+        copiar_sqlite(origem, copia)
+        if not _integro(copia):
+            raise ErroBackup(f'Cópia de {origem} falhou no integrity_check.')
+        with open(copia, 'rb') as f, gzip.open(destino_gz, 'wb', compresslevel=6) as g:
+            shutil.copyfileobj(f, g, 1 << 20)
+        tamanho = os.path.getsize(copia)
+    return {'tamanho': tamanho, 'sha256': _sha256(destino_gz)}
+
+
+# =========================
+# Uploads
+# =========================
+def listar_snapshots(pasta: str = None):
+    pasta = pasta or diretorio_backups()
+    if not os.path.isdir(pasta):
+        return []
+    return sorted(n for n in os.listdir(pasta) if os.path.isfile(os.path.join(pasta, n, MANIFESTO)))
+
+
+def ler_manifesto(nome: str, pasta: str = None) -> dict:
+    caminho = os.path.join(pasta or diretorio_backups(), nome, MANIFESTO)
+    if not os.path.isfile(caminho):
+        raise ErroBackup(f'Snapshot {nome} não encontrado.')
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _arquivos_uploads(raiz: str):
+    for pasta, _, nomes in os.walk(raiz):
+        for nome in sorted(nomes):
+            caminho = os.path.join(pasta, nome)
+            yield os.path.relpath(caminho, raiz).replace(os.sep, '/'), caminho
+
+
+def _snapshot_uploads(raiz: str, destino: str, nome: str, anterior: dict):
+    """Manifesto de uploads do snapshot novo; copia para o tar.gz só o que é novo/alterado."""
+    manifesto, novos, bytes_novos = {}, 0, 0
+    pacote = os.path.join(destino, PACOTE_UPLOADS)
+    with tarfile.open(pacote, 'w:gz') as tar:
+        for rel, caminho in _arquivos_uploads(raiz):
+            st = os.stat(caminho)
+            antes = anterior.get(rel)
+            if antes and antes['tamanho'] == st.st_size and antes['mtime_ns'] == st.st_mtime_ns:
+                manifesto[rel] = antes
+                continue
+            sha = _sha256(caminho)
+            if antes and antes['sha256'] == sha:  # só o mtime mudou
+                manifesto[rel] = dict(antes, mtime_ns=st.st_mtime_ns)
+                continue
+            tar.add(caminho, arcname=rel, recursive=False)
+            manifesto[rel] = {'tamanho': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': sha, 'pacote': nome}
+            novos += 1
+            bytes_novos += st.st_size
+    if not novos:
+        os.remove(pacote)
+    return manifesto, novos, bytes_novos
+
+
+def criar_backup(pasta: str = None) -> dict:
+    """Backup completo do banco + snapshot incremental dos uploads. Retorna o manifesto."""
+    pasta = pasta or diretorio_backups()
+    nome = datetime.now().strftime('%Y%m%d-%H%M%S')
+    destino = os.path.join(pasta, nome)
+    if os.path.exists(destino):
+        raise ErroBackup(f'Snapshot {nome} já existe.')
+    os.makedirs(destino)
+
+    snapshots = listar_snapshots(pasta)
+    anterior = ler_manifesto(snapshots[-1], pasta)['uploads'] if snapshots else {}
+    try:
+        bancos = {rel: _backup_banco(caminho, os.path.join(destino, 'banco', rel + '.gz'))
+                  for rel, caminho in _bancos()}
+        uploads, novos, bytes_novos = _snapshot_uploads(app.config['UPLOADS_ROOT'], destino, nome, anterior)
+    except Exception:
+        shutil.rmtree(destino, ignore_errors=True)
+        raise
+
+    manifesto = {'nome': nome, 'criado_em': datetime.now().isoformat(timespec='seconds'),
+                 'bancos': bancos, 'uploads': uploads,
+                 'uploads_novos': novos, 'uploads_bytes_novos': bytes_novos}
+    with open(os.path.join(destino, MANIFESTO), 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)  # gravado por último: snapshot completo
+    return manifesto
+
+
+# =========================
+# Verificação e restauração
+# =========================
+def _percorrer_uploads(pasta: str, manifesto: dict):
+    """
+    Gera (rel, info, arquivo|None) para cada upload do manifesto, lendo cada uploads.tar.gz
+    uma vez em sequência (tar.gz não tem acesso aleatório barato). arquivo=None: não achado.
+    """
+    por_pacote = {}
+    for rel, info in manifesto['uploads'].items():
+        por_pacote.setdefault(info['pacote'], {})[rel] = info
+    for pacote, esperados in sorted(por_pacote.items()):
+        caminho = os.path.join(pasta, pacote, PACOTE_UPLOADS)
+        if not os.path.isfile(caminho):
+            for rel, info in esperados.items():
+                yield rel, info, None
+            continue
+        with tarfile.open(caminho, 'r|gz') as tar:
+            for membro in tar:
+                info = esperados.pop(membro.name, None)
+                if info is not None and membro.isfile():
+                    yield membro.name, info, tar.extractfile(membro)
+        for rel, info in esperados.items():
+            yield rel, info, None
+
+
+def verificar(nome: str, pasta: str = None) -> list:
+    """Problemas encontrados no snapshot (lista vazia = ok): hashes, integridade e pacotes faltando."""
+    pasta = pasta or diretorio_backups()
+    manifesto = ler_manifesto(nome, pasta)
+    problemas = []
+
+    for rel, info in manifesto['bancos'].items():
+        gz = os.path.join(pasta, nome, 'banco', rel + '.gz')
+        if not os.path.isfile(gz):
+            problemas.append(f'banco {rel}: arquivo ausente')
+            continue
+        if _sha256(gz) != info['sha256']:
+            problemas.append(f'banco {rel}: sha256 diferente')
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            copia = os.path.join(tmp, 'v.db')
+            with gzip.open(gz, 'rb') as g, open(copia, 'wb') as f:
+                shutil.copyfileobj(g, f, 1 << 20)
+            if not _integro(copia):
+                problemas.append(f'banco {rel}: integrity_check falhou')
+
+    try:
+        for rel, info, conteudo in _percorrer_uploads(pasta, manifesto):
+            if conteudo is None:
+                problemas.append(f'uploads/{rel}: ausente do pacote {info["pacote"]}')
+                continue
+            h = hashlib.sha256()
+            for bloco in iter(lambda: conteudo.read(1 << 20), b''):
+                h.update(bloco)
+            if h.hexdigest() != info['sha256']:
+                problemas.append(f'uploads/{rel}: sha256 diferente')
+    except (tarfile.TarError, zlib.error, EOFError, OSError) as e:
+        problemas.append(f'uploads: pacote ilegível ({e})')
+    return problemas
+
+
+def restaurar(nome: str, alvo: str, pasta: str = None) -> dict:
+    """
+    Recria o snapshot em `alvo` (banco/, banco/shards/ e uploads/). O diretório precisa estar
+    vazio ou não existir; nada em produção é sobrescrito.
+    """
+    pasta = pasta or diretorio_backups()
+    manifesto = ler_manifesto(nome, pasta)
+    if os.path.isdir(alvo) and os.listdir(alvo):
+        raise ErroBackup(f'{alvo} não está vazio.')
+    for rel in list(manifesto['bancos']) + list(manifesto['uploads']):
+        if rel.startswith('/') or '..' in rel.split('/'):
+            raise ErroBackup(f'Caminho inválido no manifesto: {rel}')
+
+    for rel in manifesto['bancos']:
+        destino = os.path.join(alvo, 'banco', *rel.split('/'))
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with gzip.open(os.path.join(pasta, nome, 'banco', rel + '.gz'), 'rb') as g, open(destino, 'wb') as f:
+            shutil.copyfileobj(g, f, 1 << 20)
+
+    for rel, info, conteudo in _percorrer_uploads(pasta, manifesto):
+        if conteudo is None:
+            raise ErroBackup(f'uploads/{rel} ausente do pacote {info["pacote"]}.')
+        destino = os.path.join(alvo, 'uploads', *rel.split('/'))
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, 'wb') as f:
+            shutil.copyfileobj(conteudo, f, 1 << 20)
+        os.utime(destino, ns=(info['mtime_ns'], info['mtime_ns']))
+    return {'bancos': len(manifesto['bancos']), 'uploads': len(manifesto['uploads'])}
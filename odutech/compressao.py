@@ -0,0 +1,227 @@
+# odutech/compressao.py
+"""
+Respostas menores para quem usa o sistema pelo celular (dados móveis no terreiro).
+
+- Compressão: after_request escolhe br (se o pacote Brotli estiver instalado) ou gzip pelo
+  Accept-Encoding do navegador, respeitando q=0. Só comprime tipos de texto acima de
+  COMPRESSAO_MIN_BYTES; respostas em streaming (e arquivos) são comprimidas pedaço a pedaço,
+  sem juntar tudo na memória.
+- Minificação: os templates .html perdem indentação, linhas em branco e comentários HTML/CSS
+  quando o Jinja os carrega (uma vez por template; o compilado fica em cache). As quebras de
+  linha são mantidas, então JS inline continua válido; <pre> e <textarea> ficam intactos.
+
+`python main.py --bench-compression` mede bytes e tempo até o último byte por rota, antes e depois.
+"""
+import gzip
+import os
+import re
+import statistics
+import time
+import zlib
+
+from flask import request
+from jinja2.ext import Extension
+
+from odutech import app
+from odutech.shards import como_usuario
+
+try:
+    import brotli
+except ImportError:  # dependência opcional: sem ela, só gzip
+    brotli = None
+
+app.config.setdefault('COMPRESSAO', os.getenv('COMPRESSAO', '1') != '0')
+app.config.setdefault('COMPRESSAO_MIN_BYTES', 500)
+app.config.setdefault('COMPRESSAO_NIVEL_GZIP', 6)
+app.config.setdefault('COMPRESSAO_NIVEL_BROTLI', 5)
+app.config.setdefault('MINIFICAR_HTML', os.getenv('MINIFICAR_HTML', '1') != '0')
+
+TIPOS_COMPRIMIVEIS = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+    'application/json', 'image/svg+xml',
+}
+
+
+# =========================
+# Compressão
+# =========================
+def _qualidades(cabecalho: str) -> dict:
+    """'gzip;q=0.8, br' -> {'gzip': 0.8, 'br': 1.0}"""
+    saida = {}
+    for parte in (cabecalho or '').split(','):
+        nome, _, params = parte.strip().partition(';')
+        if not nome:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        saida[nome.strip().lower()] = q
+    return saida
+
+
+def escolher_codificacao(cabecalho: str):
+    """'br', 'gzip' ou None, preferindo br quando o cliente aceita os dois com o mesmo peso."""
+    aceitas = _qualidades(cabecalho)
+    opcoes = (['br'] if brotli else []) + ['gzip']
+    pesos = [(aceitas.get(c, aceitas.get('*', 0.0)), -i, c) for i, c in enumerate(opcoes)]
+    peso, _, codificacao = max(pesos)
+    return codificacao if peso > 0 else None
+
+
+def _compressor(codificacao: str):
+    """(comprimir, descarregar, finalizar) de um compressor incremental do formato escolhido."""
+    if codificacao == 'br':
+        c = brotli.Compressor(quality=app.config['COMPRESSAO_NIVEL_BROTLI'])
+        return c.process, c.flush, c.finish
+    c = zlib.compressobj(app.config['COMPRESSAO_NIVEL_GZIP'], zlib.DEFLATED, 31)  # 31 = cabeçalho gzip
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def comprimir(dados: bytes, codificacao: str) -> bytes:
+    if codificacao == 'br':
+        return brotli.compress(dados, quality=app.config['COMPRESSAO_NIVEL_BROTLI'])
+    return gzip.compress(dados, compresslevel=app.config['COMPRESSAO_NIVEL_GZIP'])
+
+
+def _em_pedacos(iteravel, codificacao: str):
+    """Comprime um corpo em streaming; cada pedaço é enviado assim que chega (flush)."""
+    processar, descarregar, finalizar = _compressor(codificacao)
+    try:
+        for pedaco in iteravel:
+            if isinstance(pedaco, str):
+                pedaco = pedaco.encode('utf-8')
+            saida = processar(pedaco) + descarregar()
+            if saida:
+                yield saida
+        yield finalizar()
+    finally:
+        if hasattr(iteravel, 'close'):
+            iteravel.close()
+
+
+@app.after_request
+def _comprimir_resposta(response):
+    if not app.config['COMPRESSAO'] or request.method == 'HEAD':
+        return response
+    if response.status_code != 200 or 'Content-Encoding' in response.headers \
+            or response.mimetype not in TIPOS_COMPRIMIVEIS:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    codificacao = escolher_codificacao(request.headers.get('Accept-Encoding', ''))
+    if codificacao is None:
+        return response
+
+    if response.is_streamed or response.direct_passthrough:
+        tamanho = response.content_length
+        if tamanho is not None and tamanho < app.config['COMPRESSAO_MIN_BYTES']:
+            return response
+        corpo = response.response
+        response.direct_passthrough = False
+        response.response = _em_pedacos(corpo, codificacao)
+        response.headers.pop('Content-Length', None)
+    else:
+        dados = response.get_data()
+        if len(dados) < app.config['COMPRESSAO_MIN_BYTES']:
+            return response
+        response.set_data(comprimir(dados, codificacao))
+
+    response.headers['Content-Encoding'] = codificacao
+    etag, fraca = response.get_etag()
+    if etag and not fraca:  # o corpo mudou: a ETag forte não vale mais byte a byte
+        response.set_etag(f'{etag}-{codificacao}')  # (fraca já admite outra codificação: fica igual)
+    return response
+
+
+# =========================
+# Minificação de templates
+# =========================
+_PRESERVAR = re.compile(r'(<(pre|textarea)\b.*?</\2>)', re.S | re.I)
+_COMENTARIO_HTML = re.compile(r'<!--(?!\[if).*?-->', re.S)
+_BLOCO_STYLE = re.compile(r'(<style\b[^>]*>)(.*?)(</style>)', re.S | re.I)
+_COMENTARIO_CSS = re.compile(r'/\*.*?\*/', re.S)
+
+
+def minificar(fonte: str) -> str:
+    """Tira indentação, linhas vazias e comentários; mantém as quebras de linha."""
+    partes = _PRESERVAR.split(fonte)
+    saida = []
+    # split com 2 grupos: [texto, bloco_preservado, nome_tag, texto, ...]
+    for i in range(0, len(partes), 3):
+        texto = _COMENTARIO_HTML.sub(lambda m: m.group(0) if '{%' in m.group(0) or '{{' in m.group(0) else '',
+                                     partes[i])  # comentário com tag Jinja fica (pode abrir/fechar bloco)
+        texto = _BLOCO_STYLE.sub(lambda m: m.group(1) + _COMENTARIO_CSS.sub('', m.group(2)) + m.group(3), texto)
+        saida.append('\n'.join(linha.strip() for linha in texto.split('\n') if linha.strip()))
+        if i + 1 < len(partes):
+            saida.append(partes[i + 1])
+    return '\n'.join(p for p in saida if p)
+
+
+class MinificarHTML(Extension):
+    """Extensão Jinja: minifica a fonte dos templates .html antes de compilar."""
+
+    def preprocess(self, source, name, filename=None):
+        if app.config.get('MINIFICAR_HTML') and name and name.endswith('.html'):
+            return minificar(source)
+        return source
+
+
+app.jinja_env.add_extension(MinificarHTML)
+
+
+# =========================
+# Benchmark (main.py --bench-compression)
+# =========================
+def _rotas_bench(usuario):
+    from flask import url_for
+    from odutech.models import Cliente
+    cliente = Cliente.query.filter_by(id_usuario=usuario.id).order_by(Cliente.id).first()
+    rotas = [url_for('perfil', id_usuario=usuario.id), url_for('clientes'), url_for('atendimentos_lista'),
+             url_for('produtos'), url_for('agenda'), url_for('relatorios_vendas')]
+    if cliente:
+        rotas.insert(1, url_for('cliente_detalhes', id=cliente.id))
+    return rotas
+
+
+def benchmark(usuario, repeticoes: int = 5):
+    """
+    Para cada rota: bytes e mediana do tempo até o último byte (ms) sem compressão/minificação
+    e com. Usa o test client logado como 'usuario'. Retorna [(rota, bytes_antes, ms_antes,
+    bytes_depois, ms_depois, codificacao)].
+    """
+    config_original = {k: app.config[k] for k in ('COMPRESSAO', 'MINIFICAR_HTML')}
+    codificacao = 'br' if brotli else 'gzip'
+    with app.test_request_context(), como_usuario(usuario.id):
+        rotas = _rotas_bench(usuario)
+
+    def medir(cliente, rota, ligado: bool):
+        app.config['COMPRESSAO'] = app.config['MINIFICAR_HTML'] = ligado
+        if app.jinja_env.cache is not None:
+            app.jinja_env.cache.clear()  # recompila os templates com/sem minificação
+        cabecalhos = {'Accept-Encoding': 'br, gzip' if ligado else 'identity'}
+        cliente.get(rota, headers=cabecalhos)  # aquecimento (compila o template)
+        tempos, tamanho = [], 0
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resposta = cliente.get(rota, headers=cabecalhos, buffered=True)
+            tamanho = len(resposta.get_data())
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tamanho, statistics.median(tempos)
+
+    resultado = []
+    try:
+        with app.test_client() as cliente:
+            with cliente.session_transaction() as sessao:
+                sessao['_user_id'] = str(usuario.id)
+                sessao['_fresh'] = True
+            for rota in rotas:
+                resultado.append((rota, *medir(cliente, rota, False), *medir(cliente, rota, True), codificacao))
+    finally:
+        app.config.update(config_original)
+        if app.jinja_env.cache is not None:
+            app.jinja_env.cache.clear()
+    return resultado
@@ -0,0 +1,270 @@
+# odutech/consultas_lentas.py
+"""
+Log de consultas lentas (opcional: CONSULTAS_LENTAS=1).
+
+Listeners before/after_cursor_execute na classe Engine (banco principal e todos os shards)
+medem cada statement. Os que passam de CONSULTAS_LENTAS_MS viram uma linha JSON em
+CONSULTAS_LENTAS_ARQUIVO (RotatingFileHandler, ao lado do banco por padrão) com:
+- o SQL, os parâmetros redigidos (inteiros ficam; textos, números decimais e datas viram só o tipo);
+- o endpoint Flask e o usuário (do shard ativo ou do login já carregado — nunca dispara consulta);
+- o EXPLAIN QUERY PLAN, rodado num cursor à parte da mesma conexão, e `scan`: as tabelas com
+  mais de CONSULTAS_LENTAS_TABELA_GRANDE linhas que o plano percorre inteiras (SCAN).
+
+O plano e o tamanho das tabelas ficam em memória por statement/banco, então uma consulta
+lenta repetida custa só a escrita da linha. O tempo medido é o do execute(): no SQLite ele
+inclui achar a primeira linha, não o fetch do resto. Com vários workers do gunicorn todos
+escrevem no mesmo arquivo (linhas inteiras); a rotação de um pode cortar o início do .1 de outro.
+
+`python main.py --slow-queries [--top N]` resume o arquivo (e os rotacionados) pelas
+consultas de maior tempo total.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from odutech import app
+
+app.config.setdefault('CONSULTAS_LENTAS', os.getenv('CONSULTAS_LENTAS') == '1')
+app.config.setdefault('CONSULTAS_LENTAS_MS', float(os.getenv('CONSULTAS_LENTAS_MS', '200')))
+app.config.setdefault('CONSULTAS_LENTAS_ARQUIVO', os.getenv('CONSULTAS_LENTAS_ARQUIVO') or os.path.join(
+    os.path.dirname(app.config['SHARD_DIR']), 'consultas_lentas.log'))
+app.config.setdefault('CONSULTAS_LENTAS_MAX_BYTES', 5 * 1024 * 1024)  # por arquivo antes de rotacionar
+app.config.setdefault('CONSULTAS_LENTAS_BACKUPS', 3)                  # arquivos .1, .2, ... mantidos
+app.config.setdefault('CONSULTAS_LENTAS_TABELA_GRANDE', 10000)        # linhas para um SCAN ser marcado
+
+_logger = logging.getLogger('odutech.consultas_lentas')
+_logger.propagate = False
+_local = threading.local()  # evita medir o próprio EXPLAIN
+_planos = {}                # (banco, sql) -> plano
+_tamanhos = {}              # (banco, tabela) -> linhas (estimativa por max(rowid))
+_cache_lock = threading.Lock()
+_MAX_CACHE = 500
+
+_SCAN = re.compile(r'^SCAN (\w+)')
+_COM_PLANO = re.compile(r'\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b', re.I)
+_INSERT_VALUES = re.compile(r'\s*INSERT\b[^(]*\([^)]*\)\s*VALUES\b', re.I)  # sem plano útil
+_LISTA_PARAMETROS = re.compile(r'\(\?(?:, \?)+\)')
+
+
+def ativar(arquivo: str = None):
+    """Liga o log (idempotente). Chamado na importação se CONSULTAS_LENTAS=1."""
+    if not any(isinstance(h, RotatingFileHandler) for h in _logger.handlers):
+        arquivo = arquivo or app.config['CONSULTAS_LENTAS_ARQUIVO']
+        os.makedirs(os.path.dirname(os.path.abspath(arquivo)), exist_ok=True)
+        handler = RotatingFileHandler(arquivo, maxBytes=app.config['CONSULTAS_LENTAS_MAX_BYTES'],
+                                      backupCount=app.config['CONSULTAS_LENTAS_BACKUPS'], encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+    if not event.contains(Engine, 'before_cursor_execute', _antes):
+        event.listen(Engine, 'before_cursor_execute', _antes)
+        event.listen(Engine, 'after_cursor_execute', _depois)
+
+
+def desativar():
+    if event.contains(Engine, 'before_cursor_execute', _antes):
+        event.remove(Engine, 'before_cursor_execute', _antes)
+        event.remove(Engine, 'after_cursor_execute', _depois)
+    for handler in list(_logger.handlers):
+        if isinstance(handler, RotatingFileHandler):  # só o nosso (outros podem ter sido pendurados aqui)
+            _logger.removeHandler(handler)
+            handler.close()
+
+
+# =========================
+# Captura
+# =========================
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    # no contexto de execução (um por statement): se o execute falhar, o início vai embora com ele
+    if context is not None:
+        context._consultas_lentas_inicio = time.perf_counter()
+
+
+def _depois(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, '_consultas_lentas_inicio', None)
+    if inicio is None:
+        return
+    ms = (time.perf_counter() - inicio) * 1000
+    if ms < app.config['CONSULTAS_LENTAS_MS'] or getattr(_local, 'ocupado', False):
+        return
+    _local.ocupado = True
+    try:
+        _registrar(conn, statement, parameters, executemany, ms)
+    except Exception as e:  # o log nunca derruba a consulta de quem chamou
+        _logger.warning(json.dumps({'erro': f'consultas_lentas: {e}'[:300]}))
+    finally:
+        _local.ocupado = False
+
+
+def normalizar(statement: str) -> str:
+    """SQL numa linha, com listas de IN de qualquer tamanho iguais: a chave de agrupamento."""
+    return _LISTA_PARAMETROS.sub('(?, ...)', ' '.join(statement.split()))
+
+
+def _redigir(valor):
+    if valor is None or isinstance(valor, (bool, int)):
+        return valor
+    if isinstance(valor, str):
+        return f'<str:{len(valor)}>'
+    if isinstance(valor, bytes):
+        return f'<bytes:{len(valor)}>'
+    return f'<{type(valor).__name__}>'  # float, Decimal, date/datetime...
+
+
+def _parametros(parameters, executemany):
+    if executemany and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return {'linhas': len(parameters),
+                'primeira': _parametros(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {k: _redigir(v) for k, v in parameters.items()}
+    return [_redigir(v) for v in parameters or ()]
+
+
+def _origem():
+    """(endpoint, id_usuario) do request/contexto atual, sem carregar nada do banco."""
+    from odutech.shards import _usuario_ativo
+    endpoint = request.endpoint if has_request_context() else None
+    usuario = _usuario_ativo.get()
+    if usuario is None and has_app_context():
+        login = g.get('_login_user')
+        usuario = getattr(login, 'id', None)
+    return endpoint, usuario
+
+
+def _banco(conn) -> str:
+    return os.path.basename(conn.engine.url.database or '') or conn.engine.url.get_backend_name()
+
+
+def _guardar(cache, chave, valor):
+    with _cache_lock:
+        if len(cache) >= _MAX_CACHE:
+            cache.clear()
+        cache[chave] = valor
+
+
+def _plano(conn, banco, statement, parameters, executemany):
+    chave = (banco, statement)
+    if chave in _planos:
+        return _planos[chave]
+    plano = None
+    if conn.dialect.name == 'sqlite' and _COM_PLANO.match(statement) and not _INSERT_VALUES.match(statement):
+        params = (parameters[0] if parameters else ()) if executemany else parameters
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            plano = [linha[-1] for linha in cursor.execute('EXPLAIN QUERY PLAN ' + statement, params or ())]
+        except Exception:  # ex.: parâmetros em lote que não batem com o statement
+            plano = None
+        finally:
+            cursor.close()
+    _guardar(_planos, chave, plano)
+    return plano
+
+
+def _linhas_tabela(conn, banco, tabela):
+    chave = (banco, tabela)
+    if chave in _tamanhos:
+        return _tamanhos[chave]
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        linhas = cursor.execute(f'SELECT max(rowid) FROM "{tabela}"').fetchone()[0] or 0
+    except Exception:  # alias que não é tabela, WITHOUT ROWID, tabela virtual
+        linhas = None
+    finally:
+        cursor.close()
+    _guardar(_tamanhos, chave, linhas)
+    return linhas
+
+
+def _scans(conn, banco, plano):
+    """Tabelas grandes percorridas inteiras. Aliases do SQLAlchemy (atendimento_1) viram a tabela."""
+    grandes = []
+    for detalhe in plano or ():
+        m = _SCAN.match(detalhe)
+        if not m:
+            continue
+        nome = m.group(1)
+        linhas = _linhas_tabela(conn, banco, nome)
+        if linhas is None and re.search(r'_\d+$', nome):
+            nome = re.sub(r'_\d+$', '', nome)
+            linhas = _linhas_tabela(conn, banco, nome)
+        if linhas is not None and linhas >= app.config['CONSULTAS_LENTAS_TABELA_GRANDE']:
+            grandes.append({'tabela': nome, 'linhas': linhas})
+    return grandes
+
+
+def _registrar(conn, statement, parameters, executemany, ms):
+    banco = _banco(conn)
+    plano = _plano(conn, banco, statement, parameters, executemany)
+    endpoint, usuario = _origem()
+    _logger.info(json.dumps({
+        'quando': datetime.now().isoformat(timespec='seconds'),
+        'ms': round(ms, 2),
+        'banco': banco,
+        'endpoint': endpoint,
+        'usuario': usuario,
+        'sql': normalizar(statement),
+        'parametros': _parametros(parameters, executemany),
+        'plano': plano,
+        'scan': _scans(conn, banco, plano),
+    }, ensure_ascii=False, default=str))
+
+
+# =========================
+# Resumo (main.py --slow-queries)
+# =========================
+def _arquivos(arquivo: str):
+    """O arquivo atual e os rotacionados (.1, .2, ...), do mais antigo para o mais novo."""
+    rotacionados = []
+    n = 1
+    while os.path.exists(f'{arquivo}.{n}'):
+        rotacionados.append(f'{arquivo}.{n}')
+        n += 1
+    return list(reversed(rotacionados)) + ([arquivo] if os.path.exists(arquivo) else [])
+
+
+def resumo(arquivo: str = None, top: int = 10) -> list:
+    """
+    As `top` consultas (SQL normalizado) de maior tempo total: vezes, total/médio/máximo em ms,
+    endpoints mais frequentes, tabelas grandes varridas e o último plano visto.
+    """
+    arquivo = arquivo or app.config['CONSULTAS_LENTAS_ARQUIVO']
+    grupos = {}
+    for caminho in _arquivos(arquivo):
+        with open(caminho, encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    continue
+                if 'sql' not in registro:
+                    continue
+                grupo = grupos.setdefault(registro['sql'], {
+                    'sql': registro['sql'], 'vezes': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'endpoints': defaultdict(int), 'scan': {}, 'plano': None, 'ultima': None})
+                grupo['vezes'] += 1
+                grupo['total_ms'] += registro['ms']
+                grupo['max_ms'] = max(grupo['max_ms'], registro['ms'])
+                grupo['endpoints'][registro.get('endpoint') or '(fora de request)'] += 1
+                for s in registro.get('scan') or ():
+                    grupo['scan'][s['tabela']] = s['linhas']
+                grupo['plano'] = registro.get('plano') or grupo['plano']
+                grupo['ultima'] = registro.get('quando')
+    ordenados = sorted(grupos.values(), key=lambda g: -g['total_ms'])[:top]
+    for grupo in ordenados:
+        grupo['medio_ms'] = grupo['total_ms'] / grupo['vezes']
+        grupo['endpoints'] = sorted(grupo['endpoints'].items(), key=lambda e: -e[1])
+    return ordenados
+
+
+if app.config['CONSULTAS_LENTAS']:
+    ativar()
@@ -0,0 +1,169 @@
+# odutech/duplicados.py
+"""
+Clientes cadastrados em dobro.
+
+Cada Cliente guarda duas chaves de bloqueio (models.chaves_duplicidade), ambas indexadas
+com id_usuario:
+- chave_bloqueio: nome normalizado + nascimento + inicial do nome da mãe;
+- chave_fonetica: nome fonético (models.fonetica) + nascimento.
+No cadastro, possiveis_duplicados() é uma busca por igualdade nesses índices: custo
+constante, independe do número de clientes da casa. cliente_gravado() é o passo comum depois
+de criar ou editar um cliente (telas e API).
+
+O job em lote (`python main.py --find-duplicates` / `--merge-duplicates`) separa dois casos:
+- certos: mesma chave_bloqueio (nome normalizado igual + nascimento + inicial da mãe). São
+  mesclados no cadastro com mais atendimentos (empate: o mais antigo), levando atendimentos,
+  documentos, orixás e vínculos rituais;
+- parecidos: só a chave fonética + inicial da mãe batem (Bruno/Breno, gêmeos com nomes
+  próximos). Nunca são mesclados sozinhos: são listados, e cada grupo só é mesclado com
+  `python main.py --merge-group ID,ID,...` depois de conferido.
+"""
+from sqlalchemy import or_, func
+
+from odutech import database
+from odutech.models import (
+    Usuario, Cliente, Atendimento, AtendimentoArquivo, ClienteDocumento, ResumoCliente, PAPEIS_RITUAIS,
+    chaves_duplicidade, recalcular_resumo
+)
+from odutech.linhagem import atualizar_linhagem, remover_cliente, nome_alterado
+from odutech.shards import como_usuario
+
+# Campos copiados do duplicado quando estão vazios no cadastro principal
+CAMPOS_COMPLEMENTARES = (
+    'data_iniciacao', 'email', 'telefone', 'endereco', 'foto_path',
+    'navalha', 'babakekere', 'iyakekere', 'ojubona', 'padrinho', 'madrinha', 'orunko', 'orixa', 'ajunto',
+)
+
+
+def possiveis_duplicados(id_usuario: int, nome: str, data_nascimento, nome_mae: str,
+                         excluir_id: int = None, limite: int = 5):
+    """Clientes do usuário com a mesma chave de bloqueio ou a mesma chave fonética."""
+    bloqueio, fonetica = chaves_duplicidade(nome, data_nascimento, nome_mae)
+    query = Cliente.query.filter(Cliente.id_usuario == id_usuario,
+                                 or_(Cliente.chave_bloqueio == bloqueio, Cliente.chave_fonetica == fonetica))
+    if excluir_id:
+        query = query.filter(Cliente.id != excluir_id)
+    return query.order_by(Cliente.id).limit(limite).all()
+
+
+def cliente_gravado(cliente: Cliente, chave_anterior: str = None):
+    """
+    Depois do flush de um cliente criado (chave_anterior=None) ou editado (nome_norm de antes):
+    re-resolve as fichas rituais que citam o nome, se ele mudou, e devolve os outros cadastros
+    que parecem ser a mesma pessoa.
+    """
+    if cliente.nome_norm != chave_anterior:
+        nome_alterado(cliente, chave_anterior)
+    return possiveis_duplicados(cliente.id_usuario, cliente.nome, cliente.data_nascimento, cliente.nome_mae,
+                                excluir_id=cliente.id)
+
+
+def encontrar_grupos(id_usuario: int):
+    """
+    (certos, parecidos): listas de clientes (principal primeiro). Em `certos` todos têm a mesma
+    chave_bloqueio; em `parecidos`, a mesma chave fonética e inicial da mãe com nomes diferentes.
+    """
+    chaves = [c for (c,) in database.session.query(Cliente.chave_fonetica)
+              .filter(Cliente.id_usuario == id_usuario, Cliente.chave_fonetica.isnot(None))
+              .group_by(Cliente.chave_fonetica)
+              .having(func.count(Cliente.id) > 1)]
+    if not chaves:
+        return [], []
+
+    atendimentos = dict(database.session.query(Atendimento.id_cliente, func.count(Atendimento.id))
+                        .filter(Atendimento.id_usuario == id_usuario)
+                        .group_by(Atendimento.id_cliente).all())
+    grupos = {}
+    for cliente in (Cliente.query.filter(Cliente.id_usuario == id_usuario, Cliente.chave_fonetica.in_(chaves))
+                    .order_by(Cliente.id)):
+        inicial_mae = (cliente.chave_bloqueio or '').rsplit('|', 1)[-1]
+        grupos.setdefault((cliente.chave_fonetica, inicial_mae), {}) \
+            .setdefault(cliente.chave_bloqueio, []).append(cliente)
+
+    def ordenar(clientes):
+        return sorted(clientes, key=lambda c: (-atendimentos.get(c.id, 0), c.id))
+
+    certos, parecidos = [], []
+    for por_bloqueio in grupos.values():
+        certos += [ordenar(g) for g in por_bloqueio.values() if len(g) > 1]
+        if len(por_bloqueio) > 1:
+            parecidos.append(ordenar([c for g in por_bloqueio.values() for c in g]))
+    return certos, parecidos
+
+
+def mesclar(principal: Cliente, duplicados: list):
+    """Move tudo dos duplicados para o principal e exclui os duplicados (sem commit)."""
+    orixas = [principal.orixas_assentados_raw]
+    for dup in duplicados:
+        for atendimento in Atendimento.query.filter_by(id_cliente=dup.id):
+            atendimento.id_cliente = principal.id
+        arquivados = AtendimentoArquivo.query.filter_by(id_cliente=dup.id) \
+            .update({'id_cliente': principal.id}, synchronize_session=False)
+        if arquivados:  # Core: não passa pelos eventos do ResumoCliente
+            recalcular_resumo(database.session.connection(bind_arguments={'mapper': ResumoCliente}), principal.id)
+        for doc in ClienteDocumento.query.filter_by(id_cliente=dup.id):
+            doc.id_cliente = principal.id
+        for campo in CAMPOS_COMPLEMENTARES:
+            if not getattr(principal, campo) and getattr(dup, campo):
+                setattr(principal, campo, getattr(dup, campo))
+        if dup.observacoes and dup.observacoes not in (principal.observacoes or ''):
+            principal.observacoes = '\n'.join(o for o in (principal.observacoes, dup.observacoes) if o)
+        orixas.append(dup.orixas_assentados_raw)
+
+        # Quem citava o duplicado como navalha/ojubonã/... por outra grafia passa a citar o principal
+        if dup.nome_norm != principal.nome_norm:
+            for papel in PAPEIS_RITUAIS:
+                for citante in Cliente.query.filter(Cliente.id_usuario == principal.id_usuario,
+                                                    getattr(Cliente, f'{papel}_norm') == dup.nome_norm):
+                    setattr(citante, papel, principal.nome)
+        database.session.flush()
+        database.session.expire(dup)  # coleções recarregadas vazias: o cascade não leva o que foi movido
+        remover_cliente(dup)
+        database.session.delete(dup)
+
+    principal.definir_orixas_assentados(', '.join(o for o in orixas if o))
+    database.session.flush()
+    atualizar_linhagem(principal)
+    # sem o duplicado o nome do principal ficou único: quem o cita ganha o vínculo
+    nome_alterado(principal)
+
+
+def mesclar_todos(id_usuario: int = None, aplicar: bool = True):
+    """
+    Procura duplicados de um usuário ou de todos; com aplicar=True mescla só os grupos certos.
+    Retorna [(usuario, certos, parecidos)], cada grupo como [(id, nome, nascimento), ...]
+    (principal primeiro), com os dados já lidos.
+    """
+    usuarios = [database.session.get(Usuario, id_usuario)] if id_usuario else Usuario.query.order_by(Usuario.id).all()
+    relatorio = []
+    for usuario in usuarios:
+        with como_usuario(usuario.id):
+            certos, parecidos = encontrar_grupos(usuario.id)
+            resumo = [[[(c.id, c.nome, c.data_nascimento) for c in grupo] for grupo in grupos]
+                      for grupos in (certos, parecidos)]
+            if aplicar:
+                for principal, *duplicados in certos:
+                    mesclar(principal, duplicados)
+                database.session.commit()
+        if certos or parecidos:
+            relatorio.append((usuario, *resumo))
+    return relatorio
+
+
+def mesclar_grupo(id_usuario: int, ids: list) -> list:
+    """
+    Mescla um grupo conferido à mão (ex.: um dos "parecidos"); ids[0] é o principal.
+    Retorna [(id, nome), ...] dos cadastros mesclados nele.
+    """
+    if len(set(ids)) < 2:
+        raise ValueError('Informe ao menos dois clientes diferentes.')
+    with como_usuario(id_usuario):
+        clientes = {c.id: c for c in Cliente.query.filter(Cliente.id_usuario == id_usuario, Cliente.id.in_(ids))}
+        faltando = [i for i in ids if i not in clientes]
+        if faltando:
+            raise ValueError('Clientes não encontrados para este usuário: ' + ', '.join(f'#{i}' for i in faltando))
+        duplicados = [clientes[i] for i in dict.fromkeys(ids[1:]) if i != ids[0]]
+        mesclados = [(d.id, d.nome) for d in duplicados]
+        mesclar(clientes[ids[0]], duplicados)
+        database.session.commit()
+    return mesclados
@@ -0,0 +1,61 @@
+# odutech/estoque.py
+"""
+Movimentação de estoque segura entre workers do gunicorn.
+
+Nada aqui faz leitura-modificação-escrita de Produto.quantidade_estoque: cada movimento é um
+UPDATE condicional (quantidade_estoque = quantidade_estoque + :delta, e para saídas
+WHERE quantidade_estoque >= :n) mais uma linha em MovimentoEstoque, na transação da sessão.
+O commit/rollback fica com quem chama, junto com o atendimento.
+"""
+from sqlalchemy import update, func
+from odutech import database
+from odutech.models import Produto, MovimentoEstoque, proximo_seq
+
+
+class EstoqueInsuficiente(Exception):
+    pass
+
+
+def movimentar(id_usuario: int, id_produto: int, quantidade: int, motivo: str, id_atendimento: int = None):
+    """Aplica 'quantidade' (+entrada/-saída) ao produto e registra o movimento."""
+    if not id_produto or not quantidade:
+        return
+    # UPDATE direto não passa pelos eventos do ORM: a sequência de sincronização vai junto
+    seq = proximo_seq(database.session.connection(bind_arguments={'mapper': Produto}), id_usuario)
+    stmt = (update(Produto)
+            .where(Produto.id == id_produto, Produto.id_usuario == id_usuario)
+            .values(quantidade_estoque=Produto.quantidade_estoque + quantidade, seq=seq)
+            .execution_options(synchronize_session=False))
+    if quantidade < 0:
+        stmt = stmt.where(Produto.quantidade_estoque >= -quantidade)
+
+    if database.session.execute(stmt).rowcount != 1:
+        if quantidade < 0:
+            raise EstoqueInsuficiente('Estoque insuficiente para o produto selecionado.')
+        return  # produto já excluído: nada a devolver
+
+    database.session.add(MovimentoEstoque(quantidade=quantidade, motivo=motivo, id_usuario=id_usuario,
+                                          id_produto=id_produto, id_atendimento=id_atendimento))
+    produto = database.session.identity_map.get(database.session.identity_key(Produto, id_produto))
+    if produto is not None:
+        database.session.expire(produto, ['quantidade_estoque', 'seq', 'atualizado_em'])
+
+
+def baixar_atendimento(atendimento):
+    """Saída de estoque do produto do atendimento."""
+    movimentar(atendimento.id_usuario, atendimento.id_produto, -(atendimento.quantidade_produto or 1),
+               'venda', atendimento.id)
+
+
+def estornar_atendimento(id_usuario: int, id_atendimento: int):
+    """
+    Devolve ao estoque o saldo que o livro-razão registra para o atendimento (edição/exclusão).
+    Atendimentos anteriores ao livro-razão não têm movimento e, portanto, nada a devolver.
+    """
+    saldos = (database.session.query(MovimentoEstoque.id_produto, func.sum(MovimentoEstoque.quantidade))
+              .filter(MovimentoEstoque.id_usuario == id_usuario, MovimentoEstoque.id_atendimento == id_atendimento)
+              .group_by(MovimentoEstoque.id_produto)
+              .all())
+    for id_produto, saldo in saldos:
+        if saldo:
+            movimentar(id_usuario, id_produto, -saldo, 'estorno', id_atendimento)
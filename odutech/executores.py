@@ -0,0 +1,85 @@
+# odutech/executores.py
+"""
+Executores dos atendimentos: sugestões para o formulário e produtividade por executor.
+
+A dimensão Executor e o vínculo Atendimento.id_executor ficam em models.py (_vincular_executor
+em todo insert/update, vincular_executores no backfill). Aqui:
+
+- nomes(): grafias canônicas do usuário, para o <datalist> de form_atendimento.html.
+- estatisticas(): atendimentos, receita e mix de tipos por executor num período, numa única
+  consulta agrupada sobre o índice ix_atendimento_usuario_data_executor, mais o arquivo se o
+  período chegar nele (/api/executores/estatisticas).
+- vincular_pendentes(): backfill por usuário/shard (main.py --link-executors).
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func
+
+from odutech import database, arquivo
+from odutech.models import Atendimento, Executor, Usuario, vincular_executores
+from odutech.shards import como_usuario
+
+
+def nomes(id_usuario: int) -> list:
+    return [nome for (nome,) in database.session.query(Executor.nome)
+            .filter(Executor.id_usuario == id_usuario).order_by(Executor.chave)]
+
+
+def estatisticas(id_usuario: int, inicio: date = None, fim: date = None) -> dict:
+    """
+    Por executor: atendimentos, receita, ticket médio, participação na receita, primeiro/último
+    atendimento e o mix de tipos. `inicio` e `fim` (inclusive) são opcionais.
+    """
+    de = datetime.combine(inicio, datetime.min.time()) if inicio else None
+    ate = datetime.combine(fim + timedelta(days=1), datetime.min.time()) if fim else None
+    t = arquivo.fonte(id_usuario, de, ate)
+    a = t.c
+    consulta = (select(Executor.id, Executor.nome, a.tipo_atendimento, func.count(),
+                       func.coalesce(func.sum(a.valor_total), 0.0),
+                       func.min(a.data_atendimento), func.max(a.data_atendimento))
+                .select_from(t)
+                .join(Executor, Executor.id == a.id_executor)
+                .where(a.id_usuario == id_usuario)
+                .group_by(a.id_executor, a.tipo_atendimento))
+    if de:
+        consulta = consulta.where(a.data_atendimento >= de)
+    if ate:
+        consulta = consulta.where(a.data_atendimento < ate)
+
+    por_executor = {}
+    for id_executor, nome, tipo, quantidade, receita, primeiro, ultimo in database.session.execute(consulta):
+        e = por_executor.setdefault(id_executor, {'id': id_executor, 'nome': nome, 'atendimentos': 0, 'receita': 0.0,
+                                                  'primeiro': primeiro, 'ultimo': ultimo, 'tipos': {}})
+        e['atendimentos'] += quantidade
+        e['receita'] += receita
+        e['primeiro'] = min(e['primeiro'], primeiro)
+        e['ultimo'] = max(e['ultimo'], ultimo)
+        e['tipos'][tipo] = {'atendimentos': quantidade, 'receita': receita}
+
+    total_atendimentos = sum(e['atendimentos'] for e in por_executor.values())
+    total_receita = sum(e['receita'] for e in por_executor.values())
+    executores = sorted(por_executor.values(), key=lambda e: (-e['receita'], -e['atendimentos'], e['nome']))
+    for e in executores:
+        e['ticket_medio'] = e['receita'] / e['atendimentos']
+        e['participacao'] = e['receita'] / total_receita if total_receita else 0.0
+        for t in e['tipos'].values():
+            t['percentual'] = t['atendimentos'] / e['atendimentos']
+    return {
+        'filtros': {'inicio': inicio, 'fim': fim},
+        'totais': {'atendimentos': total_atendimentos, 'receita': total_receita, 'executores': len(executores)},
+        'executores': executores,
+    }
+
+
+def vincular_pendentes(id_usuario: int = None):
+    """Backfill de Atendimento.id_executor usuário a usuário (cada um no seu shard). Retorna [(usuario, n)]."""
+    usuarios = [database.session.get(Usuario, id_usuario)] if id_usuario else Usuario.query.order_by(Usuario.id).all()
+    relatorio = []
+    for usuario in usuarios:
+        with como_usuario(usuario.id):
+            vinculados = vincular_executores(database.session.connection(bind_arguments={'mapper': Atendimento}),
+                                             usuario.id)
+            database.session.commit()
+        if vinculados:
+            relatorio.append((usuario, vinculados))
+    return relatorio
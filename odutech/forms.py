@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import (
     StringField, PasswordField, SubmitField, TextAreaField,
-    SelectField, DecimalField, IntegerField, DateField
+    SelectField, DecimalField, IntegerField, DateField, HiddenField
 )
 from wtforms.validators import DataRequired, Email, Length, ValidationError, Optional, NumberRange
 from datetime import datetime, date
@@ -58,6 +58,7 @@ class FormProduto(FlaskForm):
     descricao = TextAreaField('Descrição', validators=[Optional()])
     preco = DecimalField('Preço', validators=[DataRequired(), NumberRange(min=0)], places=2)
     quantidade_estoque = IntegerField('Quantidade em Estoque', validators=[DataRequired(), NumberRange(min=0)], default=0)
+    estoque_original = HiddenField()  # saldo exibido ao abrir a edição (ajuste = novo - original)
     botao_confirmacao = SubmitField('Salvar Produto')
 
 
@@ -65,6 +66,7 @@ class FormAtendimento(FlaskForm):
     data_atendimento = DateField('Data do Atendimento', validators=[DataRequired()], default=datetime.now, format='%Y-%m-%d')
     id_cliente = SelectField('Cliente', coerce=int, validators=[DataRequired()])
     id_produto = SelectField('Produto', coerce=int, validators=[DataRequired()])
+    quantidade_produto = IntegerField('Quantidade do Produto', validators=[Optional(), NumberRange(min=1)], default=1)
     executor = StringField('Executor', validators=[DataRequired(), Length(max=100)])
     procedimentos = TextAreaField('Procedimentos', validators=[DataRequired(), Length(max=200)])
     valor_total = DecimalField('Valor Total', validators=[DataRequired(), NumberRange(min=0)], places=2)
@@ -0,0 +1,177 @@
+# odutech/linhagem.py
+"""
+Linhagem de santo: resolve os campos rituais do Cliente (navalha, babakekere, ...)
+para Cliente/Usuario e mantém a closure table LinhagemFechamento.
+
+- "descendentes de X" = LinhagemFechamento.id_ancestral_cliente == X
+- "linhagem de Y"     = LinhagemFechamento.id_descendente == Y
+Ambas são uma consulta indexada; o custo de manutenção fica no salvamento da ficha ritual.
+"""
+from odutech import database
+from odutech.shards import como_usuario
+from odutech.models import Cliente, Usuario, VinculoRitual, LinhagemFechamento, PAPEIS_RITUAIS, chave_texto
+
+
+def _descendentes(id_cliente: int) -> set:
+    return {d for (d,) in database.session.query(LinhagemFechamento.id_descendente)
+            .filter(LinhagemFechamento.id_ancestral_cliente == id_cliente)}
+
+
+def _resolver_nome(texto: str, cliente: Cliente, bloqueados: set, dono: Usuario):
+    """
+    Nome digitado -> ('cliente', id) | ('usuario', id) | None.
+    Só resolve quando há exatamente um cliente com o mesmo nome normalizado (ou o nome do usuário),
+    e nunca para o próprio cliente ou um descendente dele (evita ciclos).
+    """
+    chave = chave_texto(texto)
+    if not chave:
+        return None
+    ids = [cid for (cid,) in database.session.query(Cliente.id)
+           .filter(Cliente.id_usuario == cliente.id_usuario, Cliente.nome_norm == chave[:100])
+           .limit(2)]
+    if len(ids) == 1:
+        return None if ids[0] in bloqueados else ('cliente', ids[0])
+    if not ids and dono and chave_texto(dono.username) == chave:
+        return ('usuario', dono.id)
+    return None
+
+
+def resolver_vinculos(cliente: Cliente):
+    """Recria os VinculoRitual do cliente a partir dos campos de texto."""
+    bloqueados = _descendentes(cliente.id) | {cliente.id}
+    dono = database.session.get(Usuario, cliente.id_usuario)
+
+    VinculoRitual.query.filter_by(id_cliente=cliente.id).delete(synchronize_session='fetch')
+    for papel in PAPEIS_RITUAIS:
+        alvo = _resolver_nome(getattr(cliente, papel), cliente, bloqueados, dono)
+        if alvo is None:
+            continue
+        tipo, id_ref = alvo
+        database.session.add(VinculoRitual(
+            papel=papel,
+            id_usuario=cliente.id_usuario,
+            id_cliente=cliente.id,
+            id_cliente_ref=id_ref if tipo == 'cliente' else None,
+            id_usuario_ref=id_ref if tipo == 'usuario' else None,
+        ))
+    database.session.flush()
+
+
+def _recalcular(ids: set, id_usuario: int):
+    """
+    Refaz as linhas de fechamento dos clientes em 'ids'. Todo descendente de um nó de 'ids'
+    precisa estar em 'ids'; os ancestrais de fora do conjunto são lidos do fechamento atual.
+    """
+    if not ids:
+        return
+    ids = list(ids)
+    LinhagemFechamento.query.filter(LinhagemFechamento.id_descendente.in_(ids)) \
+        .delete(synchronize_session=False)
+
+    pais = {i: [] for i in ids}
+    for v in VinculoRitual.query.filter(VinculoRitual.id_cliente.in_(ids)):
+        pais[v.id_cliente].append(('cliente', v.id_cliente_ref) if v.id_cliente_ref else ('usuario', v.id_usuario_ref))
+
+    externos = {ref for lista in pais.values() for tipo, ref in lista if tipo == 'cliente' and ref not in pais}
+    ancestrais_externos = {ref: {} for ref in externos}
+    if externos:
+        for f in LinhagemFechamento.query.filter(LinhagemFechamento.id_descendente.in_(externos)):
+            no = ('cliente', f.id_ancestral_cliente) if f.id_ancestral_cliente else ('usuario', f.id_ancestral_usuario)
+            ancestrais_externos[f.id_descendente][no] = f.profundidade
+
+    memo = {}
+
+    def ancestrais(no_id, visitando=()):
+        if no_id in memo:
+            return memo[no_id]
+        resultado = {}
+        for tipo, ref in pais[no_id]:
+            candidatos = {(tipo, ref): 0}
+            if tipo == 'cliente':
+                if ref in pais:
+                    if ref in visitando:  # ciclo em dados antigos: ignora a aresta
+                        continue
+                    candidatos.update(ancestrais(ref, visitando + (no_id,)))
+                else:
+                    candidatos.update(ancestrais_externos.get(ref, {}))
+            for no, prof in candidatos.items():
+                if no not in resultado or prof + 1 < resultado[no]:
+                    resultado[no] = prof + 1
+        memo[no_id] = resultado
+        return resultado
+
+    linhas = []
+    for i in ids:
+        for (tipo, ref), prof in ancestrais(i).items():
+            if tipo == 'cliente' and ref == i:
+                continue
+            linhas.append({
+                'id_usuario': id_usuario,
+                'id_descendente': i,
+                'id_ancestral_cliente': ref if tipo == 'cliente' else None,
+                'id_ancestral_usuario': ref if tipo == 'usuario' else None,
+                'profundidade': prof,
+            })
+    if linhas:
+        database.session.execute(LinhagemFechamento.__table__.insert(), linhas)
+
+
+def atualizar_linhagem(cliente: Cliente):
+    """Atualização incremental após salvar a ficha ritual: só o cliente e sua subárvore."""
+    resolver_vinculos(cliente)
+    _recalcular(_descendentes(cliente.id) | {cliente.id}, cliente.id_usuario)
+
+
+def nome_alterado(cliente: Cliente, chave_anterior: str = None):
+    """
+    Cliente novo ou renomeado (já com flush, nome_norm atualizado): quem cita o nome antigo ou o
+    novo num campo ritual pode ter ganhado ou perdido o vínculo (a resolução exige nome único).
+    Re-resolve esses clientes e refaz o fechamento das subárvores deles.
+    """
+    chaves = {c for c in (chave_anterior, cliente.nome_norm) if c}
+    if not chaves:
+        return
+    afetados = {i for (i,) in database.session.query(VinculoRitual.id_cliente)
+                .filter(VinculoRitual.id_cliente_ref == cliente.id)}
+    # uma busca por igualdade em cada índice (id_usuario, <papel>_norm); com um OR o SQLite
+    # preferia percorrer todos os clientes do usuário
+    citam = [database.session.query(Cliente.id).filter(Cliente.id_usuario == cliente.id_usuario,
+                                                       getattr(Cliente, f'{papel}_norm').in_(chaves))
+             for papel in PAPEIS_RITUAIS]
+    afetados |= {i for (i,) in citam[0].union(*citam[1:])}
+    afetados.discard(cliente.id)
+    if not afetados:
+        return
+
+    subarvores = set()
+    for c in Cliente.query.filter(Cliente.id.in_(afetados)):
+        resolver_vinculos(c)
+        subarvores |= _descendentes(c.id) | {c.id}
+    _recalcular(subarvores, cliente.id_usuario)
+
+
+def remover_cliente(cliente: Cliente):
+    """Desfaz os vínculos que apontam para um cliente que será excluído."""
+    afetados = _descendentes(cliente.id)
+    VinculoRitual.query.filter_by(id_cliente_ref=cliente.id).delete(synchronize_session='fetch')
+    LinhagemFechamento.query.filter(
+        (LinhagemFechamento.id_descendente == cliente.id) |
+        (LinhagemFechamento.id_ancestral_cliente == cliente.id)
+    ).delete(synchronize_session=False)
+    _recalcular(afetados, cliente.id_usuario)
+
+
+def reconstruir_linhagem(id_usuario: int = None) -> int:
+    """Re-resolve todos os campos rituais e refaz o fechamento do zero (por usuário)."""
+    usuarios = [id_usuario] if id_usuario else [u for (u,) in database.session.query(Usuario.id)]
+    total = 0
+    for uid in usuarios:
+        with como_usuario(uid):
+            LinhagemFechamento.query.filter_by(id_usuario=uid).delete(synchronize_session=False)
+            clientes = Cliente.query.filter_by(id_usuario=uid).all()
+            for cliente in clientes:
+                resolver_vinculos(cliente)
+            _recalcular({c.id for c in clientes}, uid)
+            database.session.commit()
+        total += len(clientes)
+    return total
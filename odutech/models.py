@@ -2,6 +2,70 @@
 from odutech import database, login_manager
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy import inspect, event, select, bindparam, func, case, or_, text, DDL, union_all
+from sqlalchemy.orm import object_session
+import hashlib
+import re
+import secrets
+import unicodedata
+
+def normalizar(s: str) -> str:
+    """Normaliza string: minúscula e sem acentos."""
+    if not s:
+        return ""
+    s = s.lower()
+    return "".join(ch for ch in unicodedata.normalize("NFD", s)
+                   if unicodedata.category(ch) != "Mn")
+
+
+def chave_texto(s: str) -> str:
+    """Chave de comparação: normalizar() + espaços colapsados."""
+    return re.sub(r'\s+', ' ', normalizar(s)).strip()
+
+
+# Campos do Cliente que citam outra pessoa pelo nome (resolvidos em odutech/linhagem.py)
+PAPEIS_RITUAIS = ('navalha', 'babakekere', 'iyakekere', 'ojubona', 'padrinho', 'madrinha')
+
+
+_PARTICULAS = {'da', 'das', 'de', 'do', 'dos', 'e', 'di', 'du'}
+_REGRAS_FONETICAS = [  # (regex, troca), aplicadas em ordem sobre cada palavra já sem acentos
+    (r'ph', 'f'), (r'th', 't'), (r'sch', 'x'), (r'sh', 'x'), (r'ch', 'x'), (r'lh', 'li'), (r'nh', 'ni'),
+    (r'qu(?=[ei])', 'k'), (r'gu(?=[ei])', 'G'), (r'q', 'k'), (r'ck', 'k'),
+    (r'sc(?=[ei])', 's'), (r'xc(?=[ei])', 's'), (r'c(?=[ei])', 's'), (r'c', 'k'), (r'g(?=[ei])', 'j'),
+    (r'y', 'i'), (r'w', 'v'), (r'z', 's'), (r'h', ''),
+    (r'(ao|am|an|om|on)$', 'n'), (r'm$', 'n'), (r'l(?=[^aeiou]|$)', 'u'),
+]
+
+
+def fonetica(s: str) -> str:
+    """
+    Chave fonética simplificada para nomes em português (no espírito do BuscaBR):
+    Luiz/Luis, Thiago/Tiago, Sousa/Souza, Felipe/Filipe, Conceição/Conseição dão a mesma chave.
+    Troca grafias de mesmo som, descarta partículas (da, de, dos...), vogais internas e
+    letras repetidas.
+    """
+    palavras = []
+    for palavra in re.findall(r'[a-z]+', normalizar(s)):
+        if palavra in _PARTICULAS:
+            continue
+        for padrao, troca in _REGRAS_FONETICAS:
+            palavra = re.sub(padrao, troca, palavra)
+        # vogais do meio caem; a final fica (Maria/Mario, Paulo/Paula são pessoas diferentes)
+        palavra = palavra[:1] + re.sub(r'[aeiou]', '', palavra[1:-1]) + palavra[1:][-1:]
+        palavras.append(re.sub(r'(.)\1+', r'\1', palavra.lower()))
+    return ' '.join(p for p in palavras if p)
+
+
+def chaves_duplicidade(nome: str, data_nascimento, nome_mae: str):
+    """
+    (chave de bloqueio, chave fonética) usadas para achar o mesmo cliente cadastrado duas vezes:
+    nome normalizado + nascimento + inicial da mãe, e nome fonético + nascimento.
+    """
+    nascimento = data_nascimento.strftime('%Y%m%d') if data_nascimento else ''
+    inicial_mae = chave_texto(nome_mae)[:1]
+    return (f"{chave_texto(nome)[:100]}|{nascimento}|{inicial_mae}"[:120],
+            f"{fonetica(nome)[:100]}|{nascimento}"[:120])
+
 
 @login_manager.user_loader
 def load_usuario(id_usuario):
@@ -31,6 +95,22 @@ class Cliente(database.Model):
     nome_mae = database.Column(database.String(100), nullable=False)
     data_iniciacao = database.Column(database.Date, nullable=True)
 
+    # Derivados mantidos por _sincronizar_derivados:
+    # nome normalizado (resolução de vínculos rituais) e mês/dia MMDD (agenda de aniversários)
+    nome_norm = database.Column(database.String(100), nullable=True)
+    nascimento_md = database.Column(database.Integer, nullable=True)
+    iniciacao_md = database.Column(database.Integer, nullable=True)
+    # chaves de duplicidade (ver chaves_duplicidade e odutech/duplicados.py)
+    chave_bloqueio = database.Column(database.String(120), nullable=True)
+    chave_fonetica = database.Column(database.String(120), nullable=True)
+    # nomes citados nos campos rituais, normalizados como nome_norm (linhagem.nome_alterado)
+    navalha_norm = database.Column(database.String(100), nullable=True)
+    babakekere_norm = database.Column(database.String(100), nullable=True)
+    iyakekere_norm = database.Column(database.String(100), nullable=True)
+    ojubona_norm = database.Column(database.String(100), nullable=True)
+    padrinho_norm = database.Column(database.String(100), nullable=True)
+    madrinha_norm = database.Column(database.String(100), nullable=True)
+
     # Contato / endereço
     email = database.Column(database.String(120))
     telefone = database.Column(database.String(20))
@@ -53,6 +133,8 @@ class Cliente(database.Model):
     foto_path = database.Column(database.String(255), nullable=True)
 
     data_cadastro = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+    atualizado_em = database.Column(database.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    seq = database.Column(database.Integer, nullable=True)  # sequência de sincronização (ver _registrar_seq)
 
     # FK do usuário dono
     id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
@@ -63,6 +145,24 @@ class Cliente(database.Model):
     # >>> NOVO: documentos do cliente <<<
     documentos = database.relationship('ClienteDocumento', backref='cliente', lazy=True, cascade='all, delete-orphan')
 
+    # Orixás assentados normalizados (espelho indexado de orixas_assentados_raw)
+    orixas_assentados = database.relationship('ClienteOrixa', backref='cliente', lazy=True, cascade='all, delete-orphan')
+
+    # Campos rituais resolvidos para Cliente/Usuario (ver odutech/linhagem.py)
+    vinculos_rituais = database.relationship('VinculoRitual', foreign_keys='VinculoRitual.id_cliente',
+                                             lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        database.Index('ix_cliente_usuario_nascimento_md', 'id_usuario', 'nascimento_md'),
+        database.Index('ix_cliente_usuario_iniciacao_md', 'id_usuario', 'iniciacao_md'),
+        database.Index('ix_cliente_usuario_nome_norm', 'id_usuario', 'nome_norm'),
+        database.Index('ix_cliente_usuario_seq', 'id_usuario', 'seq'),
+        database.Index('ix_cliente_usuario_chave_bloqueio', 'id_usuario', 'chave_bloqueio'),
+        database.Index('ix_cliente_usuario_chave_fonetica', 'id_usuario', 'chave_fonetica'),
+        *(database.Index(f'ix_cliente_usuario_{papel}_norm', 'id_usuario', f'{papel}_norm')
+          for papel in PAPEIS_RITUAIS),
+    )
+
     def __repr__(self):
         return f"Cliente('{self.nome}', '{self.email}')"
 
@@ -75,6 +175,20 @@ class Cliente(database.Model):
             return tempo
         return None
 
+    def definir_orixas_assentados(self, raw):
+        """
+        Grava a lista de orixás assentados na tabela ClienteOrixa e reescreve
+        orixas_assentados_raw com os nomes canônicos (sem duplicatas), na ordem digitada.
+        """
+        orixas = []
+        for item in (raw or '').split(','):
+            orixa = Orixa.obter_ou_criar(item)
+            if orixa and orixa not in orixas:
+                orixas.append(orixa)
+
+        self.orixas_assentados = [ClienteOrixa(orixa=o, id_usuario=self.id_usuario) for o in orixas]
+        self.orixas_assentados_raw = ', '.join(o.nome for o in orixas) or None
+
     def idade_atual(self):
         if self.data_nascimento:
             hoje = datetime.now().date()
@@ -84,6 +198,111 @@ class Cliente(database.Model):
             return idade
         return None
 
+def mes_dia(d):
+    """Data -> inteiro MMDD (ex.: 29/02 -> 229), ou None."""
+    return d.month * 100 + d.day if d else None
+
+
+@event.listens_for(Cliente, 'before_insert')
+@event.listens_for(Cliente, 'before_update')
+def _sincronizar_derivados(mapper, connection, cliente):
+    cliente.nome_norm = chave_texto(cliente.nome)[:100]
+    cliente.nascimento_md = mes_dia(cliente.data_nascimento)
+    cliente.iniciacao_md = mes_dia(cliente.data_iniciacao)
+    cliente.chave_bloqueio, cliente.chave_fonetica = chaves_duplicidade(
+        cliente.nome, cliente.data_nascimento, cliente.nome_mae)
+    _normalizar_rituais(cliente)
+
+
+def _normalizar_rituais(cliente):
+    for papel in PAPEIS_RITUAIS:
+        setattr(cliente, f'{papel}_norm', chave_texto(getattr(cliente, papel))[:100] or None)
+
+
+class Orixa(database.Model):
+    """Dimensão canônica de orixás (chave = nome sem acento/caixa/espaços extras)."""
+    id = database.Column(database.Integer, primary_key=True)
+    chave = database.Column(database.String(80), nullable=False, unique=True, index=True)
+    nome = database.Column(database.String(80), nullable=False)
+
+    # Grafia preferida para as chaves conhecidas; as demais usam o nome digitado em "Title Case"
+    NOMES_CANONICOS = {
+        'exu': 'Exu', 'ogum': 'Ogum', 'oxossi': 'Oxóssi', 'ossaim': 'Ossaim', 'ossain': 'Ossain',
+        'omolu': 'Omolu', 'obaluaie': 'Obaluaiê', 'oxumare': 'Oxumarê', 'xango': 'Xangô',
+        'iansa': 'Iansã', 'oya': 'Oyá', 'oxum': 'Oxum', 'iemanja': 'Iemanjá', 'yemanja': 'Yemanjá',
+        'nana': 'Nanã', 'oba': 'Obá', 'ewa': 'Ewá', 'logunede': 'Logunedé', 'oxala': 'Oxalá',
+        'oxaguia': 'Oxaguiã', 'oxalufa': 'Oxalufã', 'ibeji': 'Ibeji', 'iroko': 'Iroko', 'ifa': 'Ifá',
+        'orunmila': 'Orunmilá',
+    }
+
+    def __repr__(self):
+        return f"Orixa('{self.nome}')"
+
+    @staticmethod
+    def chave_de(nome: str) -> str:
+        return chave_texto(nome)
+
+    @classmethod
+    def obter_ou_criar(cls, nome: str):
+        chave = cls.chave_de(nome)
+        if not chave:
+            return None
+        orixa = cls.query.filter_by(chave=chave).first()
+        if orixa is None:
+            exibicao = cls.NOMES_CANONICOS.get(chave) or re.sub(r'\s+', ' ', nome).strip().title()
+            orixa = cls(chave=chave, nome=exibicao[:80])
+            database.session.add(orixa)
+        return orixa
+
+
+class ClienteOrixa(database.Model):
+    """Associação cliente x orixá assentado."""
+    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), primary_key=True)
+    id_orixa = database.Column(database.Integer, database.ForeignKey('orixa.id'), primary_key=True)
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+
+    orixa = database.relationship('Orixa', lazy='joined')
+
+    __table_args__ = (
+        database.Index('ix_cliente_orixa_usuario_orixa', 'id_usuario', 'id_orixa'),
+    )
+
+
+class VinculoRitual(database.Model):
+    """
+    Aresta direta da linhagem: o campo ritual 'papel' do cliente resolvido para
+    outro Cliente ou para o Usuario (zelador da casa). O texto livre continua no Cliente.
+    """
+    id = database.Column(database.Integer, primary_key=True)
+    papel = database.Column(database.String(20), nullable=False)
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=False, index=True)
+    id_cliente_ref = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=True, index=True)
+    id_usuario_ref = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=True)
+
+    __table_args__ = (
+        database.UniqueConstraint('id_cliente', 'papel', name='uq_vinculo_ritual_cliente_papel'),
+    )
+
+
+class LinhagemFechamento(database.Model):
+    """
+    Closure table da linhagem: um registro por par (ancestral, descendente) com a menor profundidade.
+    O ancestral é um Cliente (id_ancestral_cliente) ou o Usuario (id_ancestral_usuario).
+    """
+    id = database.Column(database.Integer, primary_key=True)
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    id_descendente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=False, index=True)
+    id_ancestral_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=True)
+    id_ancestral_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=True)
+    profundidade = database.Column(database.Integer, nullable=False)
+
+    __table_args__ = (
+        database.Index('ix_linhagem_ancestral_cliente', 'id_ancestral_cliente', 'profundidade'),
+        database.Index('ix_linhagem_ancestral_usuario', 'id_ancestral_usuario', 'profundidade'),
+    )
+
+
 class Produto(database.Model):
     id = database.Column(database.Integer, primary_key=True)
     nome = database.Column(database.String(100), nullable=False)
@@ -91,11 +310,17 @@ class Produto(database.Model):
     preco = database.Column(database.Float, nullable=False, default=0.0)
     quantidade_estoque = database.Column(database.Integer, nullable=False, default=0)
     data_cadastro = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+    atualizado_em = database.Column(database.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    seq = database.Column(database.Integer, nullable=True)  # sequência de sincronização (ver _registrar_seq)
 
     id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
 
     atendimentos = database.relationship('Atendimento', backref='produto', lazy=True)
 
+    __table_args__ = (
+        database.Index('ix_produto_usuario_seq', 'id_usuario', 'seq'),
+    )
+
     def __repr__(self):
         return f"Produto('{self.nome}', 'R$ {self.preco:.2f}')"
 
@@ -108,14 +333,187 @@ class Atendimento(database.Model):
     forma_pagamento = database.Column(database.String(50))
     tipo_atendimento = database.Column(database.String(50), nullable=False)
     detalhes = database.Column(database.Text)
+    atualizado_em = database.Column(database.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    seq = database.Column(database.Integer, nullable=True)  # sequência de sincronização (ver _registrar_seq)
 
     id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
-    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=False)
+    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=False, index=True)
     id_produto = database.Column(database.Integer, database.ForeignKey('produto.id'), nullable=True)
+    quantidade_produto = database.Column(database.Integer, nullable=False, default=1, server_default='1')
+    id_executor = database.Column(database.Integer, database.ForeignKey('executor.id'), nullable=True)  # ver _vincular_executor
+
+    __table_args__ = (
+        database.Index('ix_atendimento_usuario_data', 'id_usuario', 'data_atendimento'),
+        database.Index('ix_atendimento_usuario_seq', 'id_usuario', 'seq'),
+        # cobre o GROUP BY por produto de analise_produtos (sem ler a tabela)
+        database.Index('ix_atendimento_usuario_produto', 'id_usuario', 'id_produto', 'data_atendimento',
+                       'quantidade_produto', 'valor_total'),
+        # cobre as estatísticas por executor (executores.estatisticas): faixa de datas + GROUP BY
+        database.Index('ix_atendimento_usuario_data_executor', 'id_usuario', 'data_atendimento', 'id_executor',
+                       'tipo_atendimento', 'valor_total'),
+    )
+
+    arquivado = False  # ver AtendimentoArquivo
 
     def __repr__(self):
         return f"Atendimento('{self.procedimentos}', '{self.data_atendimento.strftime('%d/%m/%Y')}', 'R$ {self.valor_total:.2f}')"
 
+
+class Executor(database.Model):
+    """
+    Dimensão de executores do usuário. Atendimento.executor continua com o texto digitado;
+    grafias que só diferem em acento/caixa/espaços (mesma chave_texto) apontam para o mesmo Executor.
+    """
+    id = database.Column(database.Integer, primary_key=True)
+    chave = database.Column(database.String(100), nullable=False)
+    nome = database.Column(database.String(100), nullable=False)
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+
+    __table_args__ = (
+        database.UniqueConstraint('id_usuario', 'chave', name='uq_executor_usuario_chave'),
+    )
+
+    def __repr__(self):
+        return f"Executor('{self.nome}')"
+
+
+def id_executor(connection, id_usuario: int, nome: str):
+    """id do Executor com a mesma chave de `nome` (criado se ainda não existir), ou None."""
+    chave = chave_texto(nome)[:100]
+    if not chave or id_usuario is None:
+        return None
+    tabela = Executor.__table__
+    existente = connection.execute(select(tabela.c.id)
+                                   .where(tabela.c.id_usuario == id_usuario, tabela.c.chave == chave)).scalar()
+    if existente is not None:
+        return existente
+    return connection.execute(tabela.insert().values(
+        id_usuario=id_usuario, chave=chave, nome=re.sub(r'\s+', ' ', nome).strip()[:100])).inserted_primary_key[0]
+
+
+@event.listens_for(Atendimento, 'before_insert')
+@event.listens_for(Atendimento, 'before_update')
+def _vincular_executor(mapper, connection, atendimento):
+    if atendimento.id_executor is None or inspect(atendimento).attrs.executor.history.has_changes():
+        atendimento.id_executor = id_executor(connection, atendimento.id_usuario, atendimento.executor)
+
+
+def _grafia_pobre(nome: str):
+    """Desempate entre grafias igualmente usadas: prefere caixa mista e com acentos."""
+    return (nome.isupper() or nome.islower(), -sum(1 for ch in nome if ord(ch) > 127))
+
+
+def vincular_executores(connection, id_usuario: int = None) -> int:
+    """
+    Backfill de Atendimento.id_executor. As grafias distintas são agrupadas por chave_texto;
+    o nome do Executor novo é a grafia mais usada do grupo. Um UPDATE por grafia (não por linha).
+    Retorna quantos atendimentos foram vinculados.
+    """
+    a = Atendimento.__table__
+    consulta = (select(a.c.id_usuario, a.c.executor, func.count())
+                .where(a.c.id_executor.is_(None))
+                .group_by(a.c.id_usuario, a.c.executor))
+    if id_usuario is not None:
+        consulta = consulta.where(a.c.id_usuario == id_usuario)
+    grupos = {}
+    for usuario, grafia, quantidade in connection.execute(consulta):
+        grupos.setdefault((usuario, chave_texto(grafia)[:100]), []).append((quantidade, grafia))
+    if not grupos:
+        return 0
+
+    tabela = Executor.__table__
+    ids = {(e.id_usuario, e.chave): e.id for e in connection.execute(
+        select(tabela.c.id, tabela.c.id_usuario, tabela.c.chave)
+        .where(tabela.c.id_usuario.in_({u for u, _ in grupos})))}
+    atualizacoes, total = [], 0
+    for (usuario, chave), grafias in grupos.items():
+        if not chave:
+            continue
+        if (usuario, chave) not in ids:
+            preferida = min(grafias, key=lambda g: (-g[0], _grafia_pobre(g[1]), g[1]))[1]
+            ids[(usuario, chave)] = connection.execute(tabela.insert().values(
+                id_usuario=usuario, chave=chave, nome=re.sub(r'\s+', ' ', preferida).strip()[:100])).inserted_primary_key[0]
+        for quantidade, grafia in grafias:
+            atualizacoes.append({'b_usuario': usuario, 'b_grafia': grafia, 'b_executor': ids[(usuario, chave)]})
+            total += quantidade
+    connection.execute(a.update()
+                       .where(a.c.id_usuario == bindparam('b_usuario'), a.c.executor == bindparam('b_grafia'),
+                              a.c.id_executor.is_(None))
+                       .values(id_executor=bindparam('b_executor'),
+                               atualizado_em=a.c.atualizado_em),  # não é edição do usuário: sem onupdate
+                       atualizacoes)
+    return total
+
+class MovimentoEstoque(database.Model):
+    """
+    Livro-razão de estoque (somente inclusão). A soma de 'quantidade' por produto
+    reproduz Produto.quantidade_estoque; ver odutech/estoque.py.
+    """
+    id = database.Column(database.Integer, primary_key=True)
+    quantidade = database.Column(database.Integer, nullable=False)  # + entrada / - saída
+    motivo = database.Column(database.String(20), nullable=False)   # saldo_inicial, ajuste, venda, estorno
+    criado_em = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    # sem FK em produto/atendimento: o histórico sobrevive à exclusão deles
+    id_produto = database.Column(database.Integer, nullable=False, index=True)
+    id_atendimento = database.Column(database.Integer, nullable=True, index=True)
+
+    def __repr__(self):
+        return f"MovimentoEstoque(produto={self.id_produto}, {self.quantidade:+d}, '{self.motivo}')"
+
+
+class TarefaRelatorio(database.Model):
+    """
+    Snapshot de relatório gerado em segundo plano (odutech/tarefas.py).
+    'chave' identifica filtros + versão dos dados: mesma chave = mesmo resultado.
+    """
+    id = database.Column(database.Integer, primary_key=True)
+    chave = database.Column(database.String(64), nullable=False, index=True)
+    status = database.Column(database.String(20), nullable=False, default='pendente')  # pendente, executando, concluido, erro
+    progresso = database.Column(database.Integer, nullable=False, default=0)
+    parametros = database.Column(database.Text, nullable=False)  # JSON
+    resultado = database.Column(database.Text, nullable=True)    # JSON
+    erro = database.Column(database.Text, nullable=True)
+    criado_em = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+    atualizado_em = database.Column(database.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+
+    def __repr__(self):
+        return f"TarefaRelatorio({self.id}, '{self.status}', {self.progresso}%)"
+
+
+class TokenApi(database.Model):
+    """
+    Token de acesso à API JSON (/api/v1, odutech/api.py). Só o SHA-256 do token é guardado;
+    o valor em texto aparece uma única vez, na resposta de POST /api/v1/token.
+    """
+    id = database.Column(database.Integer, primary_key=True)
+    nome = database.Column(database.String(80), nullable=True)  # ex.: "tablet recepção"
+    token_hash = database.Column(database.String(64), nullable=False, unique=True)
+    criado_em = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_uso = database.Column(database.DateTime, nullable=True)
+
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False, index=True)
+    usuario = database.relationship('Usuario')
+
+    @staticmethod
+    def hash(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def emitir(cls, usuario, nome: str = None):
+        """Cria o token e retorna (TokenApi, valor em texto)."""
+        valor = secrets.token_urlsafe(32)
+        token = cls(nome=nome, token_hash=cls.hash(valor), id_usuario=usuario.id)
+        database.session.add(token)
+        return token, valor
+
+    def __repr__(self):
+        return f"TokenApi({self.id}, '{self.nome}', usuario={self.id_usuario})"
+
+
 # >>> NOVA TABELA: documentos anexados ao cliente <<<
 class ClienteDocumento(database.Model):
     id = database.Column(database.Integer, primary_key=True)
@@ -124,9 +522,423 @@ class ClienteDocumento(database.Model):
     mimetype = database.Column(database.String(120), nullable=True)
     size_bytes = database.Column(database.Integer, nullable=True)
     uploaded_at = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+    atualizado_em = database.Column(database.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    seq = database.Column(database.Integer, nullable=True)  # sequência de sincronização (ver _registrar_seq)
 
     id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
-    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=False)
+    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=False, index=True)
+
+    __table_args__ = (
+        database.Index('ix_cliente_documento_usuario_seq', 'id_usuario', 'seq'),
+    )
 
     def __repr__(self):
         return f"ClienteDocumento('{self.filename_original}', cliente={self.id_cliente})"
+
+
+# =========================
+# Texto dos documentos (busca full-text, odutech/textos.py)
+# =========================
+class DocumentoTexto(database.Model):
+    """
+    Estado da extração de texto de um ClienteDocumento. O texto em si fica na tabela FTS5
+    documento_busca (rowid = id do documento); separado do documento para que indexar não
+    mexa em seq/atualizado_em de ClienteDocumento (delta-sync).
+    """
+    id_documento = database.Column(database.Integer, database.ForeignKey('cliente_documento.id'), primary_key=True)
+    status = database.Column(database.String(20), nullable=False, default='pendente')  # pendente|indexado|vazio|sem_extrator|erro
+    caracteres = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    erro = database.Column(database.String(500), nullable=True)
+    atualizado_em = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False, index=True)
+
+
+# Índice full-text por documento. `usuario` é um token indexado ('u<id>', usuario_fts()) que
+# textos.buscar() põe no MATCH: sem shards o índice é de todos, e a busca só percorre os
+# documentos do usuário em vez de casar os termos em todos e filtrar depois.
+event.listen(DocumentoTexto.__table__, 'after_create', DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS documento_busca USING fts5("
+    "texto, usuario, tokenize='unicode61 remove_diacritics 2')").execute_if(dialect='sqlite'))
+
+
+def usuario_fts(id_usuario: int) -> str:
+    return f'u{int(id_usuario)}'
+
+
+@event.listens_for(ClienteDocumento, 'after_delete')
+def _excluir_texto_documento(mapper, connection, doc):
+    connection.execute(DocumentoTexto.__table__.delete().where(DocumentoTexto.id_documento == doc.id))
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DELETE FROM documento_busca WHERE rowid = :id'), {'id': doc.id})
+
+
+# =========================
+# Sequência de sincronização (delta-sync, /api/v1/sync)
+# =========================
+class ContadorSync(database.Model):
+    """Último número de sequência entregue por usuário (um contador para todas as tabelas sincronizadas)."""
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), primary_key=True)
+    valor = database.Column(database.Integer, nullable=False, default=0)
+
+
+class Exclusao(database.Model):
+    """Tombstone: registro de uma exclusão, para que clientes com cópia local também apaguem."""
+    id = database.Column(database.Integer, primary_key=True)
+    seq = database.Column(database.Integer, nullable=False)
+    tabela = database.Column(database.String(40), nullable=False)
+    id_registro = database.Column(database.Integer, nullable=False)
+    excluido_em = database.Column(database.DateTime, nullable=False, default=datetime.utcnow)
+
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+
+    __table_args__ = (
+        database.Index('ix_exclusao_usuario_seq', 'id_usuario', 'seq'),
+    )
+
+    def __repr__(self):
+        return f"Exclusao({self.tabela}#{self.id_registro}, seq={self.seq})"
+
+
+MODELOS_SINCRONIZADOS = (Cliente, Produto, Atendimento, ClienteDocumento)
+
+
+def proximo_seq(connection, id_usuario: int, quantidade: int = 1) -> int:
+    """
+    Reserva `quantidade` números da sequência do usuário e retorna o último.
+    O UPDATE segura o lock de escrita do SQLite até o commit, então a ordem dos números
+    acompanha a ordem dos commits e um cliente nunca "pula" uma alteração ainda não gravada.
+    """
+    contador = ContadorSync.__table__
+    resultado = connection.execute(contador.update()
+                                   .where(contador.c.id_usuario == id_usuario)
+                                   .values(valor=contador.c.valor + quantidade))
+    if resultado.rowcount == 0:
+        connection.execute(contador.insert().values(id_usuario=id_usuario, valor=quantidade))
+    return connection.execute(select(contador.c.valor)
+                              .where(contador.c.id_usuario == id_usuario)).scalar()
+
+
+def _registrar_seq(mapper, connection, alvo):
+    sessao = object_session(alvo)
+    if sessao is not None and alvo.seq is not None \
+            and not sessao.is_modified(alvo, include_collections=False):
+        return  # marcado como sujo, mas sem mudança real de coluna
+    if alvo.id_usuario is not None:
+        alvo.seq = proximo_seq(connection, alvo.id_usuario)
+
+
+def _registrar_exclusao(mapper, connection, alvo):
+    if alvo.id_usuario is None:
+        return
+    connection.execute(Exclusao.__table__.insert().values(
+        seq=proximo_seq(connection, alvo.id_usuario), tabela=mapper.local_table.name,
+        id_registro=alvo.id, id_usuario=alvo.id_usuario, excluido_em=datetime.utcnow()))
+
+
+for _modelo in MODELOS_SINCRONIZADOS:
+    event.listen(_modelo, 'before_insert', _registrar_seq)
+    event.listen(_modelo, 'before_update', _registrar_seq)
+    event.listen(_modelo, 'after_delete', _registrar_exclusao)
+
+
+# =========================
+# Arquivo de atendimentos (períodos fechados, odutech/arquivo.py)
+# =========================
+class AtendimentoArquivo(database.Model):
+    """
+    Atendimentos de meses fechados tirados da tabela quente por arquivo.arquivar(), com as
+    mesmas colunas e os mesmos ids de Atendimento (somente leitura). Mantê-las iguais: a cópia
+    usa COLUNAS_ATENDIMENTO.
+    """
+    __tablename__ = 'atendimento_arquivo'
+    id = database.Column(database.Integer, primary_key=True, autoincrement=False)
+    data_atendimento = database.Column(database.DateTime, nullable=False)
+    executor = database.Column(database.String(100), nullable=False)
+    procedimentos = database.Column(database.String(200), nullable=False)
+    valor_total = database.Column(database.Float, nullable=False, default=0.0)
+    forma_pagamento = database.Column(database.String(50))
+    tipo_atendimento = database.Column(database.String(50), nullable=False)
+    detalhes = database.Column(database.Text)
+    atualizado_em = database.Column(database.DateTime, nullable=True)
+    seq = database.Column(database.Integer, nullable=True)
+
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), nullable=False)
+    id_produto = database.Column(database.Integer, database.ForeignKey('produto.id'), nullable=True)
+    quantidade_produto = database.Column(database.Integer, nullable=False, default=1, server_default='1')
+    id_executor = database.Column(database.Integer, database.ForeignKey('executor.id'), nullable=True)
+
+    cliente = database.relationship('Cliente', viewonly=True)
+    produto = database.relationship('Produto', viewonly=True)
+
+    __table_args__ = (
+        database.Index('ix_atendimento_arquivo_usuario_data', 'id_usuario', 'data_atendimento'),
+        database.Index('ix_atendimento_arquivo_cliente_data', 'id_cliente', 'data_atendimento'),
+        # mesmo covering de ix_atendimento_usuario_produto, para o histórico de analise_produtos
+        database.Index('ix_atendimento_arquivo_usuario_produto', 'id_usuario', 'id_produto', 'data_atendimento',
+                       'quantidade_produto', 'valor_total'),
+    )
+
+    arquivado = True
+
+    def __repr__(self):
+        return f"AtendimentoArquivo('{self.procedimentos}', '{self.data_atendimento.strftime('%d/%m/%Y')}')"
+
+
+COLUNAS_ATENDIMENTO = tuple(c.name for c in Atendimento.__table__.columns)
+
+
+def atendimentos_com_arquivo(filtro=None, nome: str = 'atendimento'):
+    """
+    atendimento UNION ALL atendimento_arquivo como subquery com as colunas de Atendimento.
+    filtro(tabela) -> critérios aplicados dentro de cada lado, para cada um usar o próprio índice.
+    """
+    lados = []
+    for tabela in (Atendimento.__table__, AtendimentoArquivo.__table__):
+        lado = select(*(tabela.c[c] for c in COLUNAS_ATENDIMENTO))
+        lados.append(lado.where(*filtro(tabela)) if filtro else lado)
+    return union_all(*lados).subquery(nome)
+
+
+@event.listens_for(Atendimento, 'before_insert')
+def _id_apos_arquivo(mapper, connection, atendimento):
+    """
+    SQLite dá a uma linha nova max(rowid)+1 da tabela quente; se os maiores ids já foram para o
+    arquivo, o id se repetiria nos dois lados. Registrado depois de _registrar_seq: o UPDATE do
+    contador já segura o lock de escrita, então ler os máximos aqui não disputa com outro insert.
+    """
+    if atendimento.id is not None or connection.dialect.name != 'sqlite':
+        return
+    arquivado = connection.execute(select(func.max(AtendimentoArquivo.__table__.c.id))).scalar()
+    if arquivado is None:
+        return
+    quente = connection.execute(select(func.max(Atendimento.__table__.c.id))).scalar() or 0
+    if arquivado >= quente:
+        sessao = object_session(atendimento)  # o flush chama before_insert de todo o lote antes dos INSERTs
+        neste_flush = [o.id for o in (sessao.new if sessao is not None else ())
+                       if isinstance(o, Atendimento) and o.id is not None]
+        atendimento.id = max([arquivado, *neste_flush]) + 1
+
+
+# =========================
+# Resumo por cliente (topo de cliente_detalhes)
+# =========================
+class ResumoCliente(database.Model):
+    """
+    Agregados do cliente mantidos a cada gravação de Atendimento/ClienteDocumento, para a ficha
+    não precisar somar o histórico inteiro. Inclusões são incrementais; edições e exclusões de
+    atendimento recalculam o cliente pelo índice em atendimento.id_cliente.
+    """
+    id_cliente = database.Column(database.Integer, database.ForeignKey('cliente.id'), primary_key=True)
+    total_atendimentos = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    valor_total = database.Column(database.Float, nullable=False, default=0.0, server_default='0')
+    ultimo_atendimento = database.Column(database.DateTime, nullable=True)
+    ultimo_tipo = database.Column(database.String(50), nullable=True)
+    total_documentos = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    atualizado_em = database.Column(database.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    id_usuario = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+
+    @property
+    def ticket_medio(self) -> float:
+        return self.valor_total / self.total_atendimentos if self.total_atendimentos else 0.0
+
+    def __repr__(self):
+        return f"ResumoCliente(cliente={self.id_cliente}, {self.total_atendimentos} atendimento(s))"
+
+
+Cliente.resumo = database.relationship(ResumoCliente, uselist=False, lazy=True, viewonly=True)
+
+
+def recalcular_resumo(connection, id_cliente: int, id_usuario: int = None):
+    """Recalcula o resumo do cliente do zero; com id_usuario, cria a linha se não existir."""
+    a = atendimentos_com_arquivo(lambda t: [t.c.id_cliente == id_cliente])
+    d, r = ClienteDocumento.__table__, ResumoCliente.__table__
+    total, soma, ultimo = connection.execute(
+        select(func.count(), func.coalesce(func.sum(a.c.valor_total), 0.0), func.max(a.c.data_atendimento))
+        .where(a.c.id_cliente == id_cliente)).one()
+    tipo = connection.execute(select(a.c.tipo_atendimento).where(a.c.id_cliente == id_cliente)
+                              .order_by(a.c.data_atendimento.desc(), a.c.id.desc()).limit(1)).scalar()
+    documentos = connection.execute(select(func.count()).select_from(d).where(d.c.id_cliente == id_cliente)).scalar()
+    valores = dict(total_atendimentos=total, valor_total=soma, ultimo_atendimento=ultimo, ultimo_tipo=tipo,
+                   total_documentos=documentos, atualizado_em=datetime.utcnow())
+    if connection.execute(r.update().where(r.c.id_cliente == id_cliente).values(**valores)).rowcount == 0 \
+            and id_usuario is not None:
+        connection.execute(r.insert().values(id_cliente=id_cliente, id_usuario=id_usuario, **valores))
+
+
+@event.listens_for(Cliente, 'after_insert')
+def _criar_resumo(mapper, connection, cliente):
+    connection.execute(ResumoCliente.__table__.insert().values(
+        id_cliente=cliente.id, id_usuario=cliente.id_usuario, atualizado_em=datetime.utcnow()))
+
+
+@event.listens_for(Cliente, 'after_delete')
+def _excluir_resumo(mapper, connection, cliente):
+    r = ResumoCliente.__table__
+    connection.execute(r.delete().where(r.c.id_cliente == cliente.id))
+
+
+@event.listens_for(Atendimento, 'after_insert')
+def _resumo_novo_atendimento(mapper, connection, atendimento):
+    r = ResumoCliente.__table__
+    mais_recente = or_(r.c.ultimo_atendimento.is_(None), r.c.ultimo_atendimento <= atendimento.data_atendimento)
+    connection.execute(r.update().where(r.c.id_cliente == atendimento.id_cliente).values(
+        total_atendimentos=r.c.total_atendimentos + 1,
+        valor_total=r.c.valor_total + (atendimento.valor_total or 0.0),
+        ultimo_tipo=case((mais_recente, atendimento.tipo_atendimento), else_=r.c.ultimo_tipo),
+        ultimo_atendimento=case((mais_recente, atendimento.data_atendimento), else_=r.c.ultimo_atendimento),
+        atualizado_em=datetime.utcnow()))
+
+
+@event.listens_for(Atendimento, 'after_update')
+def _resumo_atendimento_editado(mapper, connection, atendimento):
+    estado = inspect(atendimento)
+    campos = ('id_cliente', 'valor_total', 'data_atendimento', 'tipo_atendimento')
+    if not any(estado.attrs[c].history.has_changes() for c in campos):
+        return
+    for id_cliente in {atendimento.id_cliente, *estado.attrs.id_cliente.history.deleted} - {None}:
+        recalcular_resumo(connection, id_cliente)
+
+
+@event.listens_for(Atendimento, 'after_delete')
+def _resumo_atendimento_excluido(mapper, connection, atendimento):
+    recalcular_resumo(connection, atendimento.id_cliente)
+
+
+def _somar_documentos(connection, id_cliente: int, delta: int):
+    r = ResumoCliente.__table__
+    connection.execute(r.update().where(r.c.id_cliente == id_cliente)
+                       .values(total_documentos=r.c.total_documentos + delta, atualizado_em=datetime.utcnow()))
+
+
+@event.listens_for(ClienteDocumento, 'after_insert')
+def _resumo_documento_novo(mapper, connection, doc):
+    _somar_documentos(connection, doc.id_cliente, 1)
+
+
+@event.listens_for(ClienteDocumento, 'after_delete')
+def _resumo_documento_excluido(mapper, connection, doc):
+    _somar_documentos(connection, doc.id_cliente, -1)
+
+
+@event.listens_for(ClienteDocumento, 'after_update')
+def _resumo_documento_movido(mapper, connection, doc):
+    anterior = inspect(doc).attrs.id_cliente.history.deleted
+    if anterior and anterior[0] != doc.id_cliente:
+        _somar_documentos(connection, anterior[0], -1)
+        _somar_documentos(connection, doc.id_cliente, 1)
+
+
+# =========================
+# Atualização incremental do schema
+# =========================
+def atualizar_schema():
+    """
+    Cria tabelas novas e acrescenta colunas/índices que faltam em tabelas já existentes.
+    O create_all() sozinho não altera tabelas antigas (ex.: /data/comunidade.db em produção).
+    """
+    atualizar_tabelas(database.engine, database.metadata.sorted_tables)
+    preencher_derivados()
+
+
+def atualizar_tabelas(engine, tabelas):
+    """create_all + colunas/índices que faltam, restrito a `tabelas` (usado também nos shards)."""
+    database.metadata.create_all(engine, tables=tabelas)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for tabela in tabelas:
+            existentes = {c['name'] for c in inspector.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in existentes:
+                    continue
+                tipo = coluna.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE "{tabela.name}" ADD COLUMN "{coluna.name}" {tipo}'
+                if coluna.server_default is not None:
+                    padrao = coluna.server_default.arg
+                    ddl += f" DEFAULT '{padrao}'" if isinstance(padrao, str) else f" DEFAULT {padrao.text}"
+                conn.exec_driver_sql(ddl)
+                print(f"[schema] Coluna adicionada: {tabela.name}.{coluna.name}")
+            for indice in tabela.indexes:
+                indice.create(conn, checkfirst=True)
+
+
+def preencher_derivados():
+    """Backfill das colunas derivadas em linhas gravadas antes de elas existirem."""
+    pendentes = Cliente.query.filter(
+        Cliente.nome_norm.is_(None) |
+        ((Cliente.nascimento_md.is_(None)) & (Cliente.data_nascimento.isnot(None))) |
+        ((Cliente.iniciacao_md.is_(None)) & (Cliente.data_iniciacao.isnot(None))) |
+        Cliente.chave_fonetica.is_(None) |
+        or_(*(getattr(Cliente, p).isnot(None) & (getattr(Cliente, p) != '') & getattr(Cliente, f'{p}_norm').is_(None)
+              for p in PAPEIS_RITUAIS))
+    ).all()
+    for cliente in pendentes:
+        cliente.nome_norm = chave_texto(cliente.nome)[:100]
+        cliente.nascimento_md = mes_dia(cliente.data_nascimento)
+        cliente.iniciacao_md = mes_dia(cliente.data_iniciacao)
+        cliente.chave_bloqueio, cliente.chave_fonetica = chaves_duplicidade(
+            cliente.nome, cliente.data_nascimento, cliente.nome_mae)
+        _normalizar_rituais(cliente)
+    if pendentes:
+        database.session.commit()
+        print(f"[schema] Campos derivados preenchidos para {len(pendentes)} cliente(s).")
+
+    # Orixás assentados digitados antes da tabela ClienteOrixa
+    sem_orixas = Cliente.query.filter(
+        Cliente.orixas_assentados_raw.isnot(None),
+        Cliente.orixas_assentados_raw != '',
+        ~Cliente.orixas_assentados.any()
+    ).all()
+    for cliente in sem_orixas:
+        cliente.definir_orixas_assentados(cliente.orixas_assentados_raw)
+    if sem_orixas:
+        database.session.commit()
+        print(f"[schema] Orixás assentados normalizados para {len(sem_orixas)} cliente(s).")
+
+    # Linhas gravadas antes da sequência de sincronização
+    for modelo in MODELOS_SINCRONIZADOS:
+        sem_seq = (database.session.query(modelo.id_usuario, modelo.id)
+                   .filter(modelo.seq.is_(None)).order_by(modelo.id_usuario, modelo.id).all())
+        por_usuario = {}
+        for id_usuario, id_registro in sem_seq:
+            por_usuario.setdefault(id_usuario, []).append(id_registro)
+        conexao = database.session.connection(bind_arguments={'mapper': modelo})
+        for id_usuario, ids in por_usuario.items():
+            inicio = proximo_seq(conexao, id_usuario, len(ids)) - len(ids) + 1
+            conexao.execute(modelo.__table__.update()
+                            .where(modelo.__table__.c.id == bindparam('b_id'))
+                            .values(seq=bindparam('b_seq')),
+                            [{'b_id': i, 'b_seq': inicio + n} for n, i in enumerate(ids)])
+        if sem_seq:
+            database.session.commit()
+            print(f"[schema] Sequência de sincronização preenchida para {len(sem_seq)} linha(s) de {modelo.__tablename__}.")
+
+    # Clientes cadastrados antes do ResumoCliente
+    sem_resumo = (database.session.query(Cliente.id, Cliente.id_usuario)
+                  .outerjoin(ResumoCliente, ResumoCliente.id_cliente == Cliente.id)
+                  .filter(ResumoCliente.id_cliente.is_(None)).all())
+    if sem_resumo:
+        conexao = database.session.connection(bind_arguments={'mapper': ResumoCliente})
+        for id_cliente, id_usuario in sem_resumo:
+            recalcular_resumo(conexao, id_cliente, id_usuario)
+        database.session.commit()
+        print(f"[schema] Resumo calculado para {len(sem_resumo)} cliente(s).")
+
+    # Saldo de produtos cadastrados antes do livro-razão de estoque
+    sem_movimento = Produto.query.filter(
+        Produto.quantidade_estoque != 0,
+        ~database.exists().where(MovimentoEstoque.id_produto == Produto.id)
+    ).all()
+    for produto in sem_movimento:
+        database.session.add(MovimentoEstoque(quantidade=produto.quantidade_estoque, motivo='saldo_inicial',
+                                              id_usuario=produto.id_usuario, id_produto=produto.id))
+    if sem_movimento:
+        database.session.commit()
+        print(f"[schema] Saldo inicial de estoque registrado para {len(sem_movimento)} produto(s).")
+
+    # Executores digitados antes da tabela Executor
+    vinculados = vincular_executores(database.session.connection(bind_arguments={'mapper': Atendimento}))
+    if vinculados:
+        database.session.commit()
+        print(f"[schema] Executor vinculado em {vinculados} atendimento(s).")
@@ -1,16 +1,27 @@
 # odutech/routes.py
-from flask import render_template, redirect, url_for, flash, request, send_from_directory, abort
+from flask import (
+    render_template, redirect, url_for, flash, request, send_from_directory, abort, make_response, session, jsonify
+)
 from odutech import app, database, bcrypt
-from odutech.models import Usuario, Atendimento, Cliente, Produto, ClienteDocumento
+from odutech.models import (
+    Usuario, Atendimento, Cliente, Produto, ClienteDocumento, Orixa, ClienteOrixa, LinhagemFechamento, TarefaRelatorio,
+    ResumoCliente, mes_dia, recalcular_resumo, normalizar as _norm
+)
+from odutech.linhagem import atualizar_linhagem, remover_cliente
+from odutech.duplicados import possiveis_duplicados, cliente_gravado
+from odutech import analise_vendas, analise_produtos, arquivo, executores, tarefas, textos
+from odutech.estoque import movimentar, baixar_atendimento, estornar_atendimento, EstoqueInsuficiente
 from odutech.forms import (
     FormLogin, FormCliente, FormProduto, FormAtendimento, FormClienteRituais, FormClienteDocumento
 )
 from flask_login import login_user, logout_user, login_required, current_user
-from datetime import datetime
-from sqlalchemy import or_
+from datetime import datetime, date, timedelta
+from sqlalchemy import or_, func
+from sqlalchemy.orm import joinedload
 from flask_wtf.csrf import CSRFError
 import calendar
-import unicodedata
+import hashlib
+import time
 import os
 import uuid
 from werkzeug.utils import secure_filename
@@ -19,15 +30,6 @@ from werkzeug.utils import secure_filename
 # ==============================
 # UTILS
 # ==============================
-def _norm(s: str) -> str:
-    """Normaliza string: minúscula e sem acentos."""
-    if not s:
-        return ""
-    s = s.lower()
-    return "".join(ch for ch in unicodedata.normalize("NFD", s)
-                   if unicodedata.category(ch) != "Mn")
-
-
 def _cliente_docs_dir(user_id: int, cliente_id: int) -> str:
     """Diretório físico para documentos do cliente dentro de static/uploads/docs/uX/cY."""
     base = app.config['UPLOAD_DOCS_FOLDER']  # .../static/uploads/docs
@@ -64,6 +66,35 @@ def _save_photo(file_storage, cliente_id: int) -> str:
     return rel_path
 
 
+def _etag_versao(*partes) -> str:
+    """
+    ETag das páginas de detalhe a partir das versões (atualizado_em/contagens) das linhas exibidas.
+    Inclui usuário, dia (idade/tempo de iniciação) e a janela do token CSRF embutido nos formulários,
+    para que uma página em cache nunca carregue um token já expirado.
+    """
+    limite_csrf = app.config.get('WTF_CSRF_TIME_LIMIT', 3600) or 0
+    janela_csrf = int(time.time() // max(limite_csrf // 2, 1)) if limite_csrf else 0
+    base = [current_user.id, date.today().isoformat(), session.get('csrf_token', ''), janela_csrf, *partes]
+    return hashlib.sha1('|'.join(str(p) for p in base).encode('utf-8')).hexdigest()
+
+
+def _resposta_304(etag: str):
+    """Retorna um 304 se o navegador já tem esta versão (e não há mensagens flash pendentes)."""
+    if session.get('_flashes') or not request.if_none_match.contains_weak(etag):
+        return None
+    resp = app.response_class(status=304)
+    resp.set_etag(etag, weak=True)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+def _com_etag(html: str, etag: str):
+    resp = make_response(html)
+    resp.set_etag(etag, weak=True)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
 # ==============================
 # HANDLERS GLOBAIS
 # ==============================
@@ -158,6 +189,7 @@ def perfil(id_usuario):
 def clientes():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
+    orixa = request.args.get('orixa', '')
 
     query = Cliente.query.filter_by(id_usuario=current_user.id)
 
@@ -170,9 +202,14 @@ def clientes():
             )
         )
 
+    if orixa:
+        query = (query.join(ClienteOrixa, ClienteOrixa.id_cliente == Cliente.id)
+                 .join(Orixa, Orixa.id == ClienteOrixa.id_orixa)
+                 .filter(ClienteOrixa.id_usuario == current_user.id, Orixa.chave == Orixa.chave_de(orixa)))
+
     clientes_pag = query.order_by(Cliente.nome.asc()).paginate(page=page, per_page=10)
 
-    return render_template('clientes.html', clientes=clientes_pag, search=search, now=datetime.now())
+    return render_template('clientes.html', clientes=clientes_pag, search=search, orixa=orixa, now=datetime.now())
 
 
 @app.route('/cliente/novo', methods=['GET', 'POST'])
@@ -180,6 +217,13 @@ def clientes():
 def novo_cliente():
     form = FormCliente()
     if form.validate_on_submit():
+        # Busca por igualdade nas chaves de bloqueio indexadas (odutech/duplicados.py)
+        if not request.form.get('confirmar_duplicado'):
+            duplicados = possiveis_duplicados(current_user.id, form.nome.data, form.data_nascimento.data,
+                                              form.nome_mae.data)
+            if duplicados:
+                return render_template('form_cliente.html', form=form, title='Novo Cliente',
+                                       duplicados=duplicados, now=datetime.now())
         try:
             cliente = Cliente(
                 nome=form.nome.data,
@@ -193,6 +237,8 @@ def novo_cliente():
                 id_usuario=current_user.id
             )
             database.session.add(cliente)
+            database.session.flush()
+            cliente_gravado(cliente)  # fichas rituais que já citavam este nome
             database.session.commit()
 
             # Foto (se enviada)
@@ -222,6 +268,7 @@ def editar_cliente(id):
 
     if form.validate_on_submit():
         try:
+            chave_anterior = cliente.nome_norm
             cliente.nome = form.nome.data
             cliente.data_nascimento = form.data_nascimento.data
             cliente.nome_mae = form.nome_mae.data
@@ -239,8 +286,13 @@ def editar_cliente(id):
                 except Exception as e:
                     flash(f'Falha ao atualizar a foto: {e}', 'warning')
 
+            database.session.flush()
+            duplicados = cliente_gravado(cliente, chave_anterior)
             database.session.commit()
             flash('Cliente atualizado com sucesso!', 'success')
+            if duplicados:
+                flash('Atenção: parece haver outro cadastro desta pessoa: '
+                      + ', '.join(f'{c.nome} (#{c.id})' for c in duplicados), 'warning')
             return redirect(url_for('clientes'))
         except Exception as e:
             database.session.rollback()
@@ -258,10 +310,11 @@ def excluir_cliente(id):
 
     cliente = Cliente.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
 
-    if Atendimento.query.filter_by(id_cliente=id).count() > 0:
+    if arquivo.contar(current_user.id, lambda m: [m.id_cliente == id]) > 0:
         flash('Não é possível excluir um cliente com atendimentos.', 'danger')
         return redirect(url_for('clientes'))
 
+    remover_cliente(cliente)
     database.session.delete(cliente)
     database.session.commit()
     flash('Cliente excluído com sucesso!', 'success')
@@ -273,26 +326,93 @@ def excluir_cliente(id):
 @login_required
 def cliente_detalhes(id):
     cliente = Cliente.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
-    atendimentos = Atendimento.query.filter_by(id_cliente=id).order_by(Atendimento.data_atendimento.desc()).all()
 
-    # Documentos do cliente
-    documentos = (ClienteDocumento.query
-                  .filter_by(id_cliente=id, id_usuario=current_user.id)
-                  .order_by(ClienteDocumento.uploaded_at.desc())
-                  .all())
+    # Versões baratas (índices em id_cliente) antes de carregar histórico e documentos
+    versao_atend = (database.session.query(func.count(Atendimento.id),
+                                           func.max(Atendimento.atualizado_em),
+                                           func.max(Produto.atualizado_em))
+                    .outerjoin(Produto, Atendimento.id_produto == Produto.id)
+                    .filter(Atendimento.id_cliente == id)
+                    .one())
+    versao_docs = (database.session.query(func.count(ClienteDocumento.id),
+                                          func.max(ClienteDocumento.atualizado_em))
+                   .filter(ClienteDocumento.id_cliente == id, ClienteDocumento.id_usuario == current_user.id)
+                   .one())
+    etag = _etag_versao('cliente', cliente.id, cliente.atualizado_em, *versao_atend, *versao_docs)
+    nao_modificado = _resposta_304(etag)
+    if nao_modificado:
+        return nao_modificado
 
     form_rituais = FormClienteRituais(obj=cliente)  # útil se quiser embutir edição na mesma página
     form_doc = FormClienteDocumento()
 
-    return render_template(
+    return _com_etag(render_template(
         'cliente_detalhes.html',
         cliente=cliente,
-        atendimentos=atendimentos,
-        documentos=documentos,
+        resumo=_resumo_cliente(cliente),
         form=form_rituais,
         form_doc=form_doc,
-        now=datetime.now()
-    )
+        now=datetime.now(),
+        **_pagina_atendimentos_cliente(cliente.id, 1),
+        **_pagina_documentos_cliente(cliente.id, 1)
+    ), etag)
+
+
+HISTORICO_POR_PAGINA = 20
+
+
+def _resumo_cliente(cliente):
+    """ResumoCliente do cliente; recalculado na hora se ainda não existir (ex.: banco antigo)."""
+    if cliente.resumo is None:
+        recalcular_resumo(database.session.connection(bind_arguments={'mapper': ResumoCliente}),
+                          cliente.id, cliente.id_usuario)
+        database.session.commit()
+        database.session.expire(cliente, ['resumo'])
+    return cliente.resumo
+
+
+def _pagina(query, page: int):
+    """Uma página sem COUNT(*): busca uma linha a mais só para saber se há próxima."""
+    page = max(page, 1)
+    itens = query.limit(HISTORICO_POR_PAGINA + 1).offset((page - 1) * HISTORICO_POR_PAGINA).all()
+    return itens[:HISTORICO_POR_PAGINA], (page + 1 if len(itens) > HISTORICO_POR_PAGINA else None)
+
+
+def _pagina_atendimentos_cliente(id_cliente: int, page: int) -> dict:
+    """Como _pagina(), mas com os atendimentos arquivados do cliente depois dos quentes (arquivo.listar)."""
+    page = max(page, 1)
+    itens = arquivo.listar(current_user.id, lambda m: [m.id_cliente == id_cliente],
+                           limite=HISTORICO_POR_PAGINA + 1, offset=(page - 1) * HISTORICO_POR_PAGINA,
+                           opcoes=lambda m: [joinedload(m.produto)])
+    proxima = page + 1 if len(itens) > HISTORICO_POR_PAGINA else None
+    return {'atendimentos': itens[:HISTORICO_POR_PAGINA], 'pagina_atendimentos': page, 'proxima_atendimentos': proxima}
+
+
+def _pagina_documentos_cliente(id_cliente: int, page: int) -> dict:
+    itens, proxima = _pagina(ClienteDocumento.query
+                             .filter_by(id_cliente=id_cliente, id_usuario=current_user.id)
+                             .order_by(ClienteDocumento.uploaded_at.desc(), ClienteDocumento.id.desc()), page)
+    return {'documentos': itens, 'pagina_documentos': page, 'proxima_documentos': proxima}
+
+
+@app.route('/cliente/<int:id>/historico')
+@login_required
+def cliente_historico(id):
+    """Próxima página do histórico de atendimentos (linhas da tabela, para o "Carregar mais")."""
+    cliente = Cliente.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
+    page = request.args.get('page', 1, type=int)
+    return render_template('_cliente_atendimentos.html', cliente=cliente,
+                           **_pagina_atendimentos_cliente(cliente.id, page))
+
+
+@app.route('/cliente/<int:id>/documentos')
+@login_required
+def cliente_documentos(id):
+    """Próxima página da lista de documentos (linhas da tabela, para o "Carregar mais")."""
+    cliente = Cliente.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
+    page = request.args.get('page', 1, type=int)
+    return render_template('_cliente_documentos.html', cliente=cliente,
+                           **_pagina_documentos_cliente(cliente.id, page))
 
 
 @app.route('/cliente/<int:id>/novo-atendimento')
@@ -322,8 +442,9 @@ def cliente_rituais(id):
             if hasattr(form, 'orunko'):
                 cliente.orunko = form.orunko.data
             if hasattr(form, 'orixas_assentados_raw'):
-                cliente.orixas_assentados_raw = form.orixas_assentados_raw.data
+                cliente.definir_orixas_assentados(form.orixas_assentados_raw.data)
 
+            atualizar_linhagem(cliente)
             database.session.commit()
             flash('Ficha ritual salva com sucesso!', 'success')
             return redirect(url_for('cliente_detalhes', id=cliente.id))
@@ -341,20 +462,9 @@ def cliente_upload_documento(id):
     form_doc = FormClienteDocumento()
 
     if not form_doc.validate_on_submit():
-        atendimentos = Atendimento.query.filter_by(id_cliente=id).order_by(Atendimento.data_atendimento.desc()).all()
-        documentos = (ClienteDocumento.query
-                      .filter_by(id_cliente=id, id_usuario=current_user.id)
-                      .order_by(ClienteDocumento.uploaded_at.desc())
-                      .all())
-        form_rituais = FormClienteRituais(obj=cliente)
-        flash('Verifique o arquivo selecionado.', 'warning')
-        return render_template('cliente_detalhes.html',
-                               cliente=cliente,
-                               atendimentos=atendimentos,
-                               documentos=documentos,
-                               form=form_rituais,
-                               form_doc=form_doc,
-                               now=datetime.now())
+        erros = [e for lista in form_doc.errors.values() for e in lista]
+        flash(f"Verifique o arquivo selecionado: {erros[0]}" if erros else 'Verifique o arquivo selecionado.', 'warning')
+        return redirect(url_for('cliente_detalhes', id=cliente.id))
 
     f = form_doc.arquivo.data
     filename_orig = secure_filename(f.filename or '')
@@ -379,6 +489,7 @@ def cliente_upload_documento(id):
     )
     database.session.add(doc)
     database.session.commit()
+    textos.agendar(doc)  # extração do texto para a busca, fora do request
     flash('Documento anexado com sucesso!', 'success')
     return redirect(url_for('cliente_detalhes', id=cliente.id))
 
@@ -421,6 +532,192 @@ def cliente_excluir_documento(doc_id):
     return redirect(url_for('cliente_detalhes', id=id_cliente))
 
 
+BUSCA_POR_PAGINA = 20
+
+
+@app.route('/documentos/busca')
+@login_required
+def documentos_busca():
+    q = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    resultados = textos.buscar(current_user.id, q, limite=BUSCA_POR_PAGINA + 1,
+                               offset=(page - 1) * BUSCA_POR_PAGINA) if q else []
+    return render_template('documentos_busca.html', q=q, page=page,
+                           resultados=resultados[:BUSCA_POR_PAGINA],
+                           tem_mais=len(resultados) > BUSCA_POR_PAGINA, now=datetime.now())
+
+
+@app.route('/api/documentos/busca')
+@login_required
+def api_documentos_busca():
+    q = request.args.get('q', '').strip()
+    limite = max(1, min(request.args.get('limite', BUSCA_POR_PAGINA, type=int) or BUSCA_POR_PAGINA, 100))
+    return jsonify(q=q, resultados=[{
+        'id_documento': r['documento'].id,
+        'id_cliente': r['documento'].id_cliente,
+        'cliente': r['cliente'],
+        'arquivo': r['documento'].filename_original,
+        'trecho': str(r['trecho']),
+        'relevancia': r['relevancia'],
+        'download': url_for('cliente_download_documento', doc_id=r['documento'].id),
+    } for r in textos.buscar(current_user.id, q, limite=limite)])
+
+
+# ==============================
+# ORIXÁS ASSENTADOS
+# ==============================
+@app.route('/api/orixas')
+@login_required
+def api_orixas():
+    """Quantidade de clientes por orixá assentado (GROUP BY no índice id_usuario/id_orixa)."""
+    linhas = (database.session.query(Orixa.chave, Orixa.nome, func.count(ClienteOrixa.id_cliente))
+              .join(ClienteOrixa, ClienteOrixa.id_orixa == Orixa.id)
+              .filter(ClienteOrixa.id_usuario == current_user.id)
+              .group_by(Orixa.id)
+              .order_by(func.count(ClienteOrixa.id_cliente).desc(), Orixa.nome)
+              .all())
+    return jsonify(orixas=[{'chave': chave, 'nome': nome, 'clientes': total} for chave, nome, total in linhas])
+
+
+@app.route('/api/orixas/<chave>')
+@login_required
+def api_orixa_clientes(chave):
+    """Clientes com o orixá informado assentado."""
+    orixa = Orixa.query.filter_by(chave=Orixa.chave_de(chave)).first_or_404()
+    linhas = (database.session.query(Cliente.id, Cliente.nome)
+              .join(ClienteOrixa, ClienteOrixa.id_cliente == Cliente.id)
+              .filter(ClienteOrixa.id_usuario == current_user.id, ClienteOrixa.id_orixa == orixa.id)
+              .order_by(Cliente.nome.asc())
+              .all())
+    return jsonify(orixa={'chave': orixa.chave, 'nome': orixa.nome},
+                   clientes=[{'id': cid, 'nome': nome} for cid, nome in linhas])
+
+
+# ==============================
+# LINHAGEM (closure table)
+# ==============================
+def _linhagem_json(linhas):
+    return [{'id': cid, 'nome': nome, 'profundidade': prof} for cid, nome, prof in linhas]
+
+
+@app.route('/api/cliente/<int:id>/linhagem')
+@login_required
+def api_cliente_linhagem(id):
+    """Ancestrais e descendentes rituais do cliente (uma consulta indexada para cada lado)."""
+    cliente = Cliente.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
+
+    ancestrais = (database.session.query(Cliente.id, Cliente.nome, LinhagemFechamento.profundidade)
+                  .join(LinhagemFechamento, LinhagemFechamento.id_ancestral_cliente == Cliente.id)
+                  .filter(LinhagemFechamento.id_descendente == cliente.id)
+                  .order_by(LinhagemFechamento.profundidade, Cliente.nome)
+                  .all())
+    zelador = (database.session.query(LinhagemFechamento.profundidade)
+               .filter(LinhagemFechamento.id_descendente == cliente.id,
+                       LinhagemFechamento.id_ancestral_usuario == current_user.id)
+               .scalar())
+    descendentes = (database.session.query(Cliente.id, Cliente.nome, LinhagemFechamento.profundidade)
+                    .join(LinhagemFechamento, LinhagemFechamento.id_descendente == Cliente.id)
+                    .filter(LinhagemFechamento.id_ancestral_cliente == cliente.id)
+                    .order_by(LinhagemFechamento.profundidade, Cliente.nome)
+                    .all())
+    return jsonify(
+        cliente={'id': cliente.id, 'nome': cliente.nome},
+        ancestrais=_linhagem_json(ancestrais),
+        zelador={'username': current_user.username, 'profundidade': zelador} if zelador else None,
+        descendentes=_linhagem_json(descendentes),
+    )
+
+
+@app.route('/api/linhagem/casa')
+@login_required
+def api_linhagem_casa():
+    """Todos os descendentes rituais do usuário (zelador da casa)."""
+    descendentes = (database.session.query(Cliente.id, Cliente.nome, LinhagemFechamento.profundidade)
+                    .join(LinhagemFechamento, LinhagemFechamento.id_descendente == Cliente.id)
+                    .filter(LinhagemFechamento.id_ancestral_usuario == current_user.id)
+                    .order_by(LinhagemFechamento.profundidade, Cliente.nome)
+                    .all())
+    return jsonify(descendentes=_linhagem_json(descendentes))
+
+
+# ==============================
+# AGENDA (aniversários e iniciações)
+# ==============================
+def _faixas_mes_dia(inicio: date, dias: int):
+    """
+    Faixas (MMDD inicial, MMDD final) cobrindo [inicio, inicio + dias].
+    Na virada do ano a janela vira duas faixas; em ano não bissexto, 29/02 é comemorado em 28/02.
+    """
+    if dias >= 365:
+        return [(101, 1231)]
+    fim = inicio + timedelta(days=dias)
+    md_ini, md_fim = mes_dia(inicio), mes_dia(fim)
+    if md_fim == 228 and not calendar.isleap(fim.year):
+        md_fim = 229
+    if fim.year > inicio.year:
+        return [(md_ini, 1231), (101, md_fim)]
+    return [(md_ini, md_fim)]
+
+
+def _proxima_ocorrencia(md: int, hoje: date) -> date:
+    mes, dia = divmod(md, 100)
+    for ano in (hoje.year, hoje.year + 1):
+        d = date(ano, mes, 28 if (mes, dia) == (2, 29) and not calendar.isleap(ano) else dia)
+        if d >= hoje:
+            return d
+
+
+def _agenda(dias: int):
+    """Aniversários e aniversários de iniciação dos próximos 'dias' dias, via uma única consulta por faixa."""
+    hoje = date.today()
+    faixas = _faixas_mes_dia(hoje, dias)
+    filtro = or_(*[Cliente.nascimento_md.between(a, b) for a, b in faixas],
+                 *[Cliente.iniciacao_md.between(a, b) for a, b in faixas])
+    linhas = (database.session.query(Cliente.id, Cliente.nome, Cliente.data_nascimento, Cliente.nascimento_md,
+                                     Cliente.data_iniciacao, Cliente.iniciacao_md)
+              .filter(Cliente.id_usuario == current_user.id, filtro)
+              .all())
+
+    eventos = []
+    for c in linhas:
+        for tipo, origem, md in (('nascimento', c.data_nascimento, c.nascimento_md),
+                                 ('iniciacao', c.data_iniciacao, c.iniciacao_md)):
+            if not md:
+                continue
+            quando = _proxima_ocorrencia(md, hoje)
+            faltam = (quando - hoje).days
+            if faltam <= dias:
+                eventos.append({
+                    'id_cliente': c.id,
+                    'nome': c.nome,
+                    'tipo': tipo,
+                    'data': quando,
+                    'anos': quando.year - origem.year,
+                    'faltam_dias': faltam,
+                })
+    eventos.sort(key=lambda e: (e['data'], _norm(e['nome'])))
+    return eventos
+
+
+def _dias_agenda() -> int:
+    return max(1, min(request.args.get('dias', 7, type=int) or 7, 365))
+
+
+@app.route('/agenda')
+@login_required
+def agenda():
+    dias = _dias_agenda()
+    return render_template('agenda.html', eventos=_agenda(dias), dias=dias, now=datetime.now())
+
+
+@app.route('/api/agenda')
+@login_required
+def api_agenda():
+    dias = _dias_agenda()
+    eventos = [dict(e, data=e['data'].isoformat()) for e in _agenda(dias)]
+    return jsonify(dias=dias, eventos=eventos)
+
+
 # ==============================
 # PRODUTOS
 # ==============================
@@ -443,6 +740,42 @@ def produtos():
     return render_template('produtos.html', produtos=produtos_pag, search=search, now=datetime.now())
 
 
+def _parametros_desempenho():
+    janela = request.args.get('janela', 90, type=int)
+    if janela not in analise_produtos.JANELAS:
+        janela = 90
+    alerta = min(max(request.args.get('alerta', 30, type=int), analise_produtos.DIAS_CRITICO + 1), 365)
+    return janela, alerta
+
+
+@app.route('/produtos/desempenho')
+@login_required
+def produtos_desempenho():
+    janela, alerta = _parametros_desempenho()
+    status = request.args.get('status', '')
+    relatorio = analise_produtos.desempenho(current_user.id, janela, alerta)
+    linhas = [p for p in relatorio['produtos'] if p['status'] == status] if status in analise_produtos.ORDEM_STATUS \
+        else relatorio['produtos']
+    return render_template('produtos_desempenho.html', relatorio=relatorio, linhas=linhas, status=status,
+                           janelas=analise_produtos.JANELAS, dias_critico=analise_produtos.DIAS_CRITICO,
+                           now=datetime.now())
+
+
+@app.route('/api/produtos/desempenho')
+@login_required
+def api_produtos_desempenho():
+    janela, alerta = _parametros_desempenho()
+    relatorio = analise_produtos.desempenho(current_user.id, janela, alerta)
+    produtos = [{**p,
+                 'ultima_venda': p['ultima_venda'].isoformat() if p['ultima_venda'] else None,
+                 'ruptura': p['ruptura'].isoformat() if p['ruptura'] else None,
+                 'velocidade': round(p['velocidade'], 4),
+                 'dias_restantes': round(p['dias_restantes'], 1) if p['dias_restantes'] is not None else None}
+                for p in relatorio['produtos']]
+    return jsonify(janela=janela, alerta=alerta, inicio=relatorio['inicio'].isoformat(),
+                   por_status=relatorio['por_status'], totais=relatorio['totais'], produtos=produtos)
+
+
 @app.route('/produto/novo', methods=['GET', 'POST'])
 @login_required
 def novo_produto():
@@ -452,10 +785,12 @@ def novo_produto():
             nome=form.nome.data,
             descricao=form.descricao.data,
             preco=float(form.preco.data or 0),
-            quantidade_estoque=int(form.quantidade_estoque.data or 0),
+            quantidade_estoque=0,
             id_usuario=current_user.id
         )
         database.session.add(produto)
+        database.session.flush()
+        movimentar(current_user.id, produto.id, int(form.quantidade_estoque.data or 0), 'saldo_inicial')
         database.session.commit()
         flash('Produto cadastrado com sucesso!', 'success')
         return redirect(url_for('produtos'))
@@ -471,10 +806,25 @@ def editar_produto(id):
         produto.nome = form.nome.data
         produto.descricao = form.descricao.data
         produto.preco = float(form.preco.data or 0)
-        produto.quantidade_estoque = int(form.quantidade_estoque.data or 0)
-        database.session.commit()
+        # Ajuste manual = o que o usuário mudou em relação ao saldo que ele viu; vendas feitas
+        # enquanto o formulário estava aberto continuam valendo
+        try:
+            original = int(form.estoque_original.data)
+        except (TypeError, ValueError):
+            original = None
+        try:
+            if original is None:
+                raise EstoqueInsuficiente('Formulário sem o saldo original.')
+            movimentar(current_user.id, produto.id, int(form.quantidade_estoque.data or 0) - original, 'ajuste')
+            database.session.commit()
+        except EstoqueInsuficiente:
+            database.session.rollback()
+            flash('O estoque mudou enquanto você editava (vendas registradas). Confira e salve novamente.', 'warning')
+            return redirect(url_for('editar_produto', id=id))
         flash('Produto atualizado com sucesso!', 'success')
         return redirect(url_for('produtos'))
+    if not form.is_submitted():
+        form.estoque_original.data = produto.quantidade_estoque
     return render_template('form_produto.html', form=form, title='Editar Produto', produto=produto, now=datetime.now())
 
 
@@ -511,6 +861,71 @@ def _fill_atendimento_selects(form):
         form.id_produto.choices = produtos_choices
 
 
+def _intervalo_periodo(ano: int, mes: int = None):
+    """
+    [inicio, fim) do ano (ou do mês do ano) como datetimes. Comparar a coluna crua com a faixa
+    usa o índice (id_usuario, data_atendimento); extract('month', ...) forçava varrer tudo.
+    """
+    if mes:
+        inicio = datetime(ano, mes, 1)
+        fim = datetime(ano + 1, 1, 1) if mes == 12 else datetime(ano, mes + 1, 1)
+    else:
+        inicio, fim = datetime(ano, 1, 1), datetime(ano + 1, 1, 1)
+    return inicio, fim
+
+
+def _ano_mes_args():
+    """(ano, mes) da querystring; mês sem ano vale para o ano corrente."""
+    ano = request.args.get('ano', type=int)
+    mes = request.args.get('mes', type=int)
+    if mes is not None and not 1 <= mes <= 12:
+        mes = None
+    if ano is not None and not 1900 <= ano <= 9999:
+        ano = None
+    if mes and not ano:
+        ano = date.today().year
+    return ano, mes
+
+
+def _anos_com_atendimentos():
+    menor, maior = analise_vendas.limites(current_user.id)
+    hoje = date.today().year
+    return list(range(max(maior.year, hoje) if maior else hoje, (menor.year if menor else hoje) - 1, -1))
+
+
+def _calendario_mes(ano: int, mes: int):
+    """Atendimentos e valor por dia do mês (uma consulta agrupada na faixa do índice), em semanas."""
+    inicio, fim = _intervalo_periodo(ano, mes)
+    a = arquivo.fonte(current_user.id, inicio, fim)
+    dia = func.date(a.c.data_atendimento)
+    linhas = (database.session.query(dia, func.count(a.c.id), func.coalesce(func.sum(a.c.valor_total), 0.0))
+              .filter(a.c.id_usuario == current_user.id,
+                      a.c.data_atendimento >= inicio,
+                      a.c.data_atendimento < fim)
+              .group_by(dia)
+              .all())
+    por_dia = {d: (q, float(v)) for d, q, v in linhas}
+    maximo = max((q for q, _ in por_dia.values()), default=0)
+
+    semanas = []
+    for semana in calendar.Calendar().monthdatescalendar(ano, mes):
+        dias = []
+        for d in semana:
+            q, v = por_dia.get(d.isoformat(), (0, 0.0)) if d.month == mes else (0, 0.0)
+            dias.append({'data': d, 'no_mes': d.month == mes, 'atendimentos': q, 'valor': v,
+                         'nivel': -(-q * 4 // maximo) if maximo else 0})  # 0..4, para o mapa de calor
+        semanas.append(dias)
+
+    return {
+        'ano': ano,
+        'mes': mes,
+        'semanas': semanas,
+        'total_atendimentos': sum(q for q, _ in por_dia.values()),
+        'valor_total': sum(v for _, v in por_dia.values()),
+        'maximo_dia': maximo,
+    }
+
+
 @app.route('/atendimentos', methods=['GET'])
 @login_required
 def atendimentos_lista():
@@ -518,26 +933,18 @@ def atendimentos_lista():
     search = request.args.get('search', '')
     mes = request.args.get('mes', '')
 
-    query = Atendimento.query.filter_by(id_usuario=current_user.id)
-
+    filtro = None
     if search:
-        query = query.join(Cliente).filter(
-            or_(
-                Cliente.nome.ilike(f'%{search}%'),
-                Atendimento.procedimentos.ilike(f'%{search}%')
-            )
-        )
+        def filtro(modelo):  # vale para Atendimento e AtendimentoArquivo
+            return [or_(modelo.cliente.has(Cliente.nome.ilike(f'%{search}%')),
+                        modelo.procedimentos.ilike(f'%{search}%'))]
 
-    if mes:
-        try:
-            mes_num = int(mes)
-            query = query.filter(
-                database.extract('month', Atendimento.data_atendimento) == mes_num
-            )
-        except ValueError:
-            pass
+    ano, mes_num = _ano_mes_args()
+    inicio, fim = _intervalo_periodo(ano, mes_num) if ano else (None, None)
 
-    atendimentos_pag = query.order_by(Atendimento.data_atendimento.desc()).paginate(page=page, per_page=10)
+    # Meses/anos antigos (ou a lista sem filtro chegando ao fim) também leem atendimento_arquivo
+    atendimentos_pag = arquivo.Paginacao(page=page, per_page=10, id_usuario=current_user.id,
+                                         filtro=filtro, inicio=inicio, fim=fim)
     total_vendas = sum(a.valor_total or 0 for a in atendimentos_pag.items)
     total_atendimentos = atendimentos_pag.total
     ticket_medio = (total_vendas / total_atendimentos) if total_atendimentos else 0.0
@@ -546,12 +953,41 @@ def atendimentos_lista():
                            atendimentos=atendimentos_pag,
                            search=search,
                            mes=mes,
+                           ano=ano or '',
+                           anos=_anos_com_atendimentos(),
                            total_vendas=total_vendas,
                            total_atendimentos=total_atendimentos,
                            ticket_medio=ticket_medio,
                            now=datetime.now())
 
 
+def _mes_calendario():
+    ano, mes = _ano_mes_args()
+    hoje = date.today()
+    return ano or hoje.year, mes or (hoje.month if not ano or ano == hoje.year else 1)
+
+
+@app.route('/atendimentos/calendario')
+@login_required
+def atendimentos_calendario():
+    ano, mes = _mes_calendario()
+    anterior = (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+    seguinte = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return render_template('atendimentos_calendario.html', cal=_calendario_mes(ano, mes),
+                           anterior=anterior, seguinte=seguinte, now=datetime.now())
+
+
+@app.route('/api/atendimentos/calendario')
+@login_required
+def api_atendimentos_calendario():
+    ano, mes = _mes_calendario()
+    cal = _calendario_mes(ano, mes)
+    dias = [{'data': d['data'].isoformat(), 'atendimentos': d['atendimentos'], 'valor': d['valor'], 'nivel': d['nivel']}
+            for semana in cal['semanas'] for d in semana if d['no_mes']]
+    return jsonify(ano=ano, mes=mes, total_atendimentos=cal['total_atendimentos'],
+                   valor_total=cal['valor_total'], maximo_dia=cal['maximo_dia'], dias=dias)
+
+
 @app.route('/atendimento/novo', methods=['GET', 'POST'])
 @login_required
 def novo_atendimento():
@@ -569,6 +1005,7 @@ def novo_atendimento():
             data_atendimento=form.data_atendimento.data,
             id_cliente=form.id_cliente.data if form.id_cliente.data != 0 else None,
             id_produto=form.id_produto.data if form.id_produto.data != 0 else None,
+            quantidade_produto=form.quantidade_produto.data or 1,
             executor=form.executor.data,
             procedimentos=form.procedimentos.data,
             valor_total=float(form.valor_total.data or 0),
@@ -578,14 +1015,23 @@ def novo_atendimento():
             id_usuario=current_user.id
         )
         database.session.add(atendimento)
-        database.session.commit()
+        try:
+            database.session.flush()
+            baixar_atendimento(atendimento)
+            database.session.commit()
+        except EstoqueInsuficiente as e:
+            database.session.rollback()
+            flash(str(e), 'danger')
+            return render_template('form_atendimento.html', form=form, title='Novo Atendimento',
+                                   executores=executores.nomes(current_user.id), now=datetime.now())
         flash('Atendimento registrado com sucesso!', 'success')
         return redirect(url_for('atendimentos_lista'))
 
     if not form.data_atendimento.data:
         form.data_atendimento.data = datetime.now()
 
-    return render_template('form_atendimento.html', form=form, title='Novo Atendimento', now=datetime.now())
+    return render_template('form_atendimento.html', form=form, title='Novo Atendimento',
+                           executores=executores.nomes(current_user.id), now=datetime.now())
 
 
 @app.route('/atendimento/editar/<int:id>', methods=['GET', 'POST'])
@@ -595,24 +1041,37 @@ def editar_atendimento(id):
     form = FormAtendimento(obj=atendimento)
     _fill_atendimento_selects(form)
 
-    form.id_cliente.data = atendimento.id_cliente or 0
-    form.id_produto.data = atendimento.id_produto or 0
+    if request.method == 'GET':
+        form.id_cliente.data = atendimento.id_cliente or 0
+        form.id_produto.data = atendimento.id_produto or 0
 
     if form.validate_on_submit():
+        produto_anterior, quantidade_anterior = atendimento.id_produto, atendimento.quantidade_produto
+
         atendimento.data_atendimento = form.data_atendimento.data
         atendimento.id_cliente = form.id_cliente.data if form.id_cliente.data != 0 else None
         atendimento.id_produto = form.id_produto.data if form.id_produto.data != 0 else None
+        atendimento.quantidade_produto = form.quantidade_produto.data or 1
         atendimento.executor = form.executor.data
         atendimento.procedimentos = form.procedimentos.data
         atendimento.valor_total = float(form.valor_total.data or 0)
         atendimento.forma_pagamento = form.forma_pagamento.data
         atendimento.tipo_atendimento = form.tipo_atendimento.data
         atendimento.detalhes = form.detalhes.data
-        database.session.commit()
+        try:
+            if (produto_anterior, quantidade_anterior) != (atendimento.id_produto, atendimento.quantidade_produto):
+                estornar_atendimento(current_user.id, atendimento.id)
+                baixar_atendimento(atendimento)
+            database.session.commit()
+        except EstoqueInsuficiente as e:
+            database.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('editar_atendimento', id=id))
         flash('Atendimento atualizado com sucesso!', 'success')
         return redirect(url_for('atendimentos_lista'))
 
-    return render_template('form_atendimento.html', form=form, title='Editar Atendimento', atendimento=atendimento, now=datetime.now())
+    return render_template('form_atendimento.html', form=form, title='Editar Atendimento', atendimento=atendimento,
+                           executores=executores.nomes(current_user.id), now=datetime.now())
 
 
 @app.route('/atendimento/excluir/<int:id>', methods=['POST', 'GET'])
@@ -623,6 +1082,7 @@ def excluir_atendimento(id):
         return redirect(url_for('atendimentos_lista'))
 
     atendimento = Atendimento.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
+    estornar_atendimento(current_user.id, atendimento.id)
     database.session.delete(atendimento)
     database.session.commit()
     flash('Atendimento excluído com sucesso!', 'success')
@@ -632,56 +1092,132 @@ def excluir_atendimento(id):
 @app.route('/atendimento/<int:id>')
 @login_required
 def detalhes_atendimento(id):
-    atendimento = Atendimento.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
-    return render_template('detalhes_atendimento.html', atendimento=atendimento, now=datetime.now())
+    for modelo in arquivo.MODELOS:  # arquivados também abrem (só leitura)
+        versao = (database.session.query(modelo.atualizado_em, Cliente.atualizado_em, Produto.atualizado_em)
+                  .join(Cliente, modelo.id_cliente == Cliente.id)
+                  .outerjoin(Produto, modelo.id_produto == Produto.id)
+                  .filter(modelo.id == id, modelo.id_usuario == current_user.id)
+                  .first())
+        if versao is not None:
+            break
+    else:
+        abort(404)
+    etag = _etag_versao('atendimento', id, *versao)
+    nao_modificado = _resposta_304(etag)
+    if nao_modificado:
+        return nao_modificado
+
+    atendimento = modelo.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
+    return _com_etag(render_template('detalhes_atendimento.html', atendimento=atendimento, now=datetime.now()), etag)
 
 
 # ==============================
 # RELATÓRIOS
 # ==============================
+def _filtros_relatorio():
+    """Lê data_inicio/data_fim/tipo da query string (datas inválidas são ignoradas)."""
+    def _data(nome):
+        try:
+            return datetime.strptime(request.args.get(nome, ''), '%Y-%m-%d').date()
+        except ValueError:
+            return None
+    return _data('data_inicio'), _data('data_fim'), request.args.get('tipo', '') or None
+
+
+def _relatorio_grande(di, df, tipo) -> bool:
+    """Mais atendimentos que RELATORIO_LIMITE_SINCRONO no período: calcula em segundo plano."""
+    # Período [di, df] inclusivo; o arquivo só é lido se di (ou a falta dela) alcança meses arquivados
+    inicio = datetime.combine(di, datetime.min.time()) if di else None
+    fim = datetime.combine(df + timedelta(days=1), datetime.min.time()) if df else None
+    filtro = (lambda m: [m.tipo_atendimento == tipo]) if tipo else None
+    return arquivo.contar(current_user.id, filtro, inicio, fim) > app.config['RELATORIO_LIMITE_SINCRONO']
+
+
 @app.route('/relatorios/vendas')
 @login_required
 def relatorios_vendas():
     data_inicio = request.args.get('data_inicio', '')
     data_fim = request.args.get('data_fim', '')
     tipo = request.args.get('tipo', '')
+    granularidade = request.args.get('granularidade', 'mes')
+    di, df, _ = _filtros_relatorio()
+
+    contexto = dict(granularidade=granularidade, data_inicio=data_inicio, data_fim=data_fim, tipo=tipo,
+                    tarefa=None, snapshot=None, now=datetime.now())
+
+    # Períodos grandes (ex.: sem datas = histórico inteiro) viram snapshot em segundo plano
+    if _relatorio_grande(di, df, tipo):
+        parametros = {'data_inicio': di.isoformat() if di else None, 'data_fim': df.isoformat() if df else None,
+                      'tipo': tipo or None, 'granularidade': granularidade}
+        tarefa = tarefas.obter_ou_agendar(current_user.id, parametros)
+        if tarefa.status != 'concluido':
+            return render_template('relatorios_vendas.html', **dict(contexto, tarefa=tarefa))
+        snapshot = tarefas.carregar_snapshot(tarefa)
+        analise = snapshot['analise']
+        return render_template('relatorios_vendas.html',
+                               vendas=snapshot['vendas'],
+                               total_vendas=analise['totais']['receita'],
+                               total_atendimentos=analise['totais']['atendimentos'],
+                               estatisticas=snapshot['estatisticas'],
+                               analise=analise,
+                               **dict(contexto, granularidade=analise['filtros']['granularidade'], snapshot=snapshot))
+
+    vendas = tarefas.vendas_recentes(current_user.id, di, df, tipo or None,
+                                     limite=app.config['RELATORIO_VENDAS_DETALHE'])
+
+    dados = analise_vendas.carregar(current_user.id, di, df, tipo or None)
+    analise = analise_vendas.resumo(current_user.id, di, df, tipo or None,
+                                    granularidade=granularidade, janela=3, dados=dados)
 
-    query = Atendimento.query.filter_by(id_usuario=current_user.id)
-
-    if data_inicio:
-        try:
-            di = datetime.strptime(data_inicio, '%Y-%m-%d')
-            query = query.filter(Atendimento.data_atendimento >= di)
-        except ValueError:
-            pass
-
-    if data_fim:
-        try:
-            df = datetime.strptime(data_fim, '%Y-%m-%d')
-            query = query.filter(Atendimento.data_atendimento <= df)
-        except ValueError:
-            pass
+    return render_template('relatorios_vendas.html',
+                           vendas=vendas,
+                           total_vendas=analise['totais']['receita'],
+                           total_atendimentos=analise['totais']['atendimentos'],
+                           estatisticas=analise_vendas.estatisticas_por_tipo(dados),
+                           analise=analise,
+                           **dict(contexto, granularidade=analise['filtros']['granularidade']))
 
-    if tipo:
-        query = query.filter(Atendimento.tipo_atendimento == tipo)
 
-    vendas = query.order_by(Atendimento.data_atendimento.desc()).all()
-    total_vendas = sum(v.valor_total or 0 for v in vendas)
-    total_atendimentos = len(vendas)
+@app.route('/api/relatorios/tarefa/<int:id>')
+@login_required
+def api_relatorio_tarefa(id):
+    """Progresso de um snapshot em segundo plano (consultado pela página de relatórios)."""
+    tarefa = TarefaRelatorio.query.filter_by(id=id, id_usuario=current_user.id).first_or_404()
+    return jsonify(id=tarefa.id, status=tarefa.status, progresso=tarefa.progresso, erro=tarefa.erro)
 
-    estatisticas = {}
-    for t in ['ebó', 'gbory', 'obrigacao', 'obrigação', 'buzios', 'outro']:
-        estatisticas[t] = {
-            'quantidade': len([v for v in vendas if _norm(v.tipo_atendimento) == _norm(t)]),
-            'valor_total': sum(v.valor_total or 0 for v in vendas if _norm(v.tipo_atendimento) == _norm(t))
-        }
 
-    return render_template('relatorios_vendas.html',
-                           vendas=vendas,
-                           total_vendas=total_vendas,
-                           total_atendimentos=total_atendimentos,
-                           estatisticas=estatisticas,
-                           data_inicio=data_inicio,
-                           data_fim=data_fim,
-                           tipo=tipo,
-                           now=datetime.now())
+@app.route('/api/relatorios/vendas')
+@login_required
+def api_relatorios_vendas():
+    """
+    Série/totais do período. Períodos grandes seguem o mesmo caminho da página: a primeira
+    chamada agenda o snapshot e responde 202 com o progresso (poll em /api/relatorios/tarefa/<id>);
+    repetir a chamada depois de concluído devolve a análise do snapshot.
+    """
+    di, df, tipo = _filtros_relatorio()
+    janela = max(1, min(request.args.get('janela', 7, type=int) or 7, 366))
+    granularidade = request.args.get('granularidade', 'dia')
+    if _relatorio_grande(di, df, tipo):
+        parametros = {'data_inicio': di.isoformat() if di else None, 'data_fim': df.isoformat() if df else None,
+                      'tipo': tipo or None, 'granularidade': granularidade, 'janela': janela}
+        tarefa = tarefas.obter_ou_agendar(current_user.id, parametros)
+        if tarefa.status != 'concluido':
+            resp = jsonify(tarefa=tarefa.id, status=tarefa.status, progresso=tarefa.progresso,
+                           url=url_for('api_relatorio_tarefa', id=tarefa.id))
+            resp.status_code = 202
+            resp.headers['Location'] = url_for('api_relatorio_tarefa', id=tarefa.id)
+            return resp
+        return jsonify(tarefas.carregar_snapshot(tarefa)['analise'])
+    return jsonify(analise_vendas.resumo(current_user.id, di, df, tipo, granularidade=granularidade, janela=janela))
+
+
+@app.route('/api/executores/estatisticas')
+@login_required
+def api_executores_estatisticas():
+    """Atendimentos, receita e mix de tipos por executor entre data_inicio e data_fim (opcionais)."""
+    di, df, _ = _filtros_relatorio()
+    resultado = executores.estatisticas(current_user.id, di, df)
+    for e in resultado['executores']:
+        e['primeiro'], e['ultimo'] = e['primeiro'].isoformat(), e['ultimo'].isoformat()
+    resultado['filtros'] = {'data_inicio': di.isoformat() if di else None, 'data_fim': df.isoformat() if df else None}
+    return jsonify(resultado)
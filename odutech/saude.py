@@ -0,0 +1,144 @@
+# odutech/saude.py
+"""
+Aquecimento dos workers e endpoints de saúde.
+
+aquecer() roda em cada worker antes de ele aceitar tráfego (hook post_worker_init em
+gunicorn.conf.py): abre e valida as conexões do pool, compila todos os templates de
+odutech/templates (já minificados, ver compressao.py), configura os mappers e executa as
+consultas principais uma vez, para que o primeiro usuário não pague por isso.
+
+- /healthz: liveness; responde enquanto o processo estiver de pé, sem tocar no banco.
+- /readyz: readiness; 200 só com o worker aquecido, o banco respondendo e o volume de
+  uploads gravável. Caso contrário 503, para a plataforma segurar o tráfego (no Railway,
+  Healthcheck Path = /readyz).
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from odutech import app, database
+
+app.config.setdefault('AQUECER_SHARDS', 20)  # shards (mais recentes) abertos no aquecimento
+
+_estado = {'aquecido': False, 'segundos': None, 'templates': 0}
+_lock = threading.Lock()
+
+
+def _validar_pool(engine):
+    """Abre até pool_size conexões ao mesmo tempo, valida cada uma e devolve todas ao pool."""
+    tamanho = getattr(engine.pool, 'size', lambda: 1)()
+    conexoes = []
+    try:
+        for _ in range(max(1, tamanho)):
+            conn = engine.connect()
+            conexoes.append(conn)
+            conn.execute(text('SELECT 1'))
+    finally:
+        for conn in conexoes:
+            conn.close()
+    return len(conexoes)
+
+
+def _shards_recentes():
+    pasta = app.config.get('SHARD_DIR')
+    if not app.config.get('SHARDING') or not pasta or not os.path.isdir(pasta):
+        return []
+    arquivos = [os.path.join(pasta, n) for n in os.listdir(pasta) if n.startswith('usuario_') and n.endswith('.db')]
+    arquivos.sort(key=os.path.getmtime, reverse=True)
+    return [int(os.path.basename(a)[len('usuario_'):-len('.db')]) for a in arquivos[:app.config['AQUECER_SHARDS']]]
+
+
+def _consultas_principais(id_usuario: int):
+    """As consultas de perfil/clientes/atendimentos/produtos, uma linha cada (compila o SQL em cache)."""
+    from odutech.models import Cliente, Atendimento, Produto, ClienteDocumento, ResumoCliente
+    for modelo, ordem in ((Cliente, Cliente.nome), (Atendimento, Atendimento.data_atendimento.desc()),
+                          (Produto, Produto.nome), (ClienteDocumento, ClienteDocumento.uploaded_at.desc()),
+                          (ResumoCliente, ResumoCliente.id_cliente)):
+        modelo.query.filter_by(id_usuario=id_usuario).order_by(ordem).limit(1).all()
+
+
+def aquecer() -> dict:
+    """Deixa o worker pronto para o primeiro request. Idempotente; retorna o estado."""
+    with _lock:
+        if _estado['aquecido']:
+            return dict(_estado)
+        inicio = time.perf_counter()
+        from odutech.models import Usuario
+        from odutech.shards import como_usuario, engine_do_usuario
+
+        with app.app_context():
+            configure_mappers()
+            _validar_pool(database.engine)
+
+            templates = 0
+            for nome in app.jinja_env.list_templates(extensions=['html']):
+                app.jinja_env.get_template(nome)
+                templates += 1
+
+            usuario = Usuario.query.order_by(Usuario.id).first()
+            if usuario:
+                with como_usuario(usuario.id):
+                    _consultas_principais(usuario.id)
+            for id_usuario in _shards_recentes():
+                _validar_pool(engine_do_usuario(id_usuario))
+            database.session.remove()
+
+        with app.test_client() as cliente:  # caminho completo de um request (url_map, hooks, render)
+            cliente.get('/')
+
+        _estado.update(aquecido=True, templates=templates, segundos=round(time.perf_counter() - inicio, 3))
+        print(f"[aquecer] pid {os.getpid()}: {templates} templates, {_estado['segundos']}s")
+        return dict(_estado)
+
+
+def _banco_ok():
+    try:
+        with database.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        return True, None
+    except Exception as e:
+        return False, str(e)[:200]
+
+
+def _volume_ok():
+    try:
+        with tempfile.NamedTemporaryFile(dir=app.config['UPLOADS_ROOT'], prefix='.readyz-'):
+            pass
+        return True, None
+    except OSError as e:
+        return False, str(e)[:200]
+
+
+@app.route('/healthz')
+def healthz():
+    return jsonify(status='ok')
+
+
+@app.route('/readyz')
+def readyz():
+    if not _estado['aquecido']:  # servidor de desenvolvimento: sem hook do gunicorn
+        try:
+            aquecer()
+        except Exception as e:
+            print(f"[aquecer] Falha: {e}", file=sys.stderr)
+    banco, erro_banco = _banco_ok()
+    volume, erro_volume = _volume_ok()
+    pronto = _estado['aquecido'] and banco and volume
+    corpo = {
+        'status': 'ok' if pronto else 'indisponivel',
+        'aquecido': _estado['aquecido'],
+        'aquecimento_segundos': _estado['segundos'],
+        'banco': banco,
+        'volume_uploads': volume,
+    }
+    if erro_banco:
+        corpo['erro_banco'] = erro_banco
+    if erro_volume:
+        corpo['erro_volume'] = erro_volume
+    return jsonify(corpo), (200 if pronto else 503)
@@ -0,0 +1,202 @@
+# odutech/shards.py
+"""
+Modo opcional de um banco SQLite por usuário (SHARDING=1).
+
+O banco principal (DATABASE_URL) continua guardando as tabelas usuario e token_api — login,
+tokens da API e lista de casas. Todas as outras tabelas vão para SHARD_DIR/usuario_<id>.db.
+A sessão do Flask-SQLAlchemy escolhe o engine em get_bind(): se há um usuário ativo no
+contexto (definido a cada request a partir do current_user, ou com como_usuario() em jobs
+e CLI), consultas a tabelas de dados vão para o arquivo daquele usuário.
+
+Para migrar um comunidade.db existente: `python main.py --split-shards` e depois ligar
+SHARDING=1. O banco principal não é alterado pela divisão (serve de backup).
+"""
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, inspect, select, func, text, Table
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.selectable import Select, Join, CompoundSelect, Subquery
+
+from odutech import app
+
+TABELAS_CENTRAIS = {'usuario', 'token_api'}  # lidas antes de saber o usuário (login, token)
+
+_usuario_ativo = ContextVar('usuario_shard', default=None)
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def ativo() -> bool:
+    return bool(current_app.config.get('SHARDING'))
+
+
+@contextmanager
+def como_usuario(id_usuario: int):
+    """Roteia as consultas deste bloco para o shard de id_usuario (threads, CLI)."""
+    token = _usuario_ativo.set(id_usuario)
+    try:
+        yield
+    finally:
+        _usuario_ativo.reset(token)
+
+
+@app.before_request
+def _rotear_request():
+    if app.config.get('SHARDING') and current_user.is_authenticated:
+        g._token_shard = _usuario_ativo.set(current_user.id)
+
+
+@app.teardown_request
+def _liberar_request(exc=None):
+    token = g.pop('_token_shard', None)
+    if token is not None:
+        _usuario_ativo.reset(token)
+
+
+def tabelas_do_shard():
+    from odutech import database
+    return [t for t in database.metadata.sorted_tables if t.name not in TABELAS_CENTRAIS]
+
+
+def caminho_shard(id_usuario: int) -> str:
+    return os.path.join(current_app.config['SHARD_DIR'], f'usuario_{int(id_usuario)}.db')
+
+
+def engine_do_usuario(id_usuario: int):
+    """Engine do arquivo do usuário; cria o arquivo e o schema na primeira vez."""
+    caminho = caminho_shard(id_usuario)
+    engine = _engines.get(caminho)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(caminho)
+            if engine is None:
+                from odutech.models import atualizar_tabelas  # evita import circular
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                engine = create_engine(f'sqlite:///{caminho}')
+                atualizar_tabelas(engine, tabelas_do_shard())
+                _engines[caminho] = engine
+    return engine
+
+
+def _descartar_engine(caminho: str):
+    with _engines_lock:
+        engine = _engines.pop(caminho, None)
+    if engine is not None:
+        engine.dispose()
+
+
+def _tabela(mapper, clause):
+    if mapper is not None:
+        return inspect(mapper).local_table
+    if isinstance(clause, Table):
+        return clause
+    if isinstance(clause, UpdateBase) and isinstance(clause.table, Table):
+        return clause.table
+    if isinstance(clause, CompoundSelect):  # UNION (ex.: atendimento + atendimento_arquivo)
+        return _tabela(None, clause.selects[0])
+    if isinstance(clause, Select):
+        for origem in clause.get_final_froms():
+            while isinstance(origem, Join):
+                origem = origem.left
+            if isinstance(origem, Subquery):
+                origem = _tabela(None, origem.element)
+            if isinstance(origem, Table):
+                return origem
+    return None
+
+
+class SessaoRoteada(Session):
+    """Session do Flask-SQLAlchemy que manda as tabelas de dados para o shard do usuário ativo."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        id_usuario = _usuario_ativo.get()
+        if bind is None and id_usuario is not None and ativo():
+            tabela = _tabela(mapper, clause)
+            if tabela is not None and tabela.name not in TABELAS_CENTRAIS:
+                return engine_do_usuario(id_usuario)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# =========================
+# Ferramentas administrativas (main.py)
+# =========================
+def dividir_banco(substituir: bool = False, lote: int = 1000):
+    """
+    Copia as linhas de cada usuário do banco principal para o seu shard.
+    Tabelas sem id_usuario (ex.: orixa) são copiadas inteiras para todos.
+    Shards que já têm dados são pulados, a menos que substituir=True.
+    Retorna [(usuario, {tabela: linhas} | None se pulado)].
+    """
+    from odutech import database
+    from odutech.models import Usuario, usuario_fts
+
+    relatorio = []
+    origem = database.engine
+    for usuario in Usuario.query.order_by(Usuario.id).all():
+        caminho = caminho_shard(usuario.id)
+        if os.path.exists(caminho):
+            if not substituir and _linhas_no_shard(caminho):
+                relatorio.append((usuario, None))
+                continue
+            _descartar_engine(caminho)
+            os.remove(caminho)
+
+        destino = engine_do_usuario(usuario.id)
+        copiadas = {}
+        with origem.connect() as src, destino.begin() as dst:
+            for tabela in tabelas_do_shard():
+                stmt = select(tabela)
+                if 'id_usuario' in tabela.c:
+                    stmt = stmt.where(tabela.c.id_usuario == usuario.id)
+                total = 0
+                for linhas in src.execution_options(yield_per=lote).execute(stmt).partitions():
+                    dst.execute(tabela.insert(), [dict(linha._mapping) for linha in linhas])
+                    total += len(linhas)
+                copiadas[tabela.name] = total
+            if 'documento_busca' in inspect(src).get_table_names():  # índice FTS5 (fora do metadata)
+                linhas = src.execute(text('SELECT rowid, texto, usuario FROM documento_busca '
+                                          'WHERE documento_busca MATCH :q'),
+                                     {'q': f'usuario : "{usuario_fts(usuario.id)}"'}).all()
+                if linhas:
+                    dst.execute(text('INSERT INTO documento_busca (rowid, texto, usuario) VALUES (:r, :t, :u)'),
+                                [{'r': r, 't': t, 'u': u} for r, t, u in linhas])
+                copiadas['documento_busca'] = len(linhas)
+        relatorio.append((usuario, copiadas))
+    return relatorio
+
+
+def _linhas_no_shard(caminho: str) -> int:
+    engine = create_engine(f'sqlite:///{caminho}')
+    try:
+        with engine.connect() as conn:
+            nomes = set(inspect(conn).get_table_names())
+            return sum(conn.execute(select(func.count()).select_from(t)).scalar()
+                       for t in tabelas_do_shard() if t.name in nomes)
+    finally:
+        engine.dispose()
+
+
+def listar_usuarios():
+    """Listagem administrativa: cada usuário com o tamanho e as contagens do seu shard."""
+    from odutech.models import Usuario, Cliente, Atendimento, Produto
+
+    saida = []
+    for usuario in Usuario.query.order_by(Usuario.username).all():
+        caminho = caminho_shard(usuario.id)
+        info = {'username': usuario.username, 'email': usuario.email, 'shard': caminho,
+                'existe': os.path.exists(caminho), 'bytes': 0,
+                'clientes': 0, 'atendimentos': 0, 'produtos': 0}
+        if info['existe']:
+            info['bytes'] = os.path.getsize(caminho)
+            with engine_do_usuario(usuario.id).connect() as conn:
+                for chave, modelo in (('clientes', Cliente), ('atendimentos', Atendimento), ('produtos', Produto)):
+                    info[chave] = conn.execute(select(func.count()).select_from(modelo.__table__)
+                                               .where(modelo.__table__.c.id_usuario == usuario.id)).scalar()
+        saida.append(info)
+    return saida
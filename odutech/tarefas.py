@@ -0,0 +1,192 @@
+# odutech/tarefas.py
+"""
+Execução de relatórios pesados em segundo plano.
+
+Cada worker do gunicorn tem um ThreadPoolExecutor pequeno; o estado fica na tabela
+TarefaRelatorio, então qualquer worker consegue mostrar o progresso ou servir o snapshot
+pronto. A chave do snapshot inclui a versão dos atendimentos do período e tipo do relatório
+(versao_dados): criar, editar ou excluir um deles gera uma chave nova; gravações fora do
+filtro não invalidam o snapshot.
+
+Limpeza a cada tarefa nova do usuário: saem os snapshots dos mesmos filtros com versão
+antiga, as tarefas presas em pendente/executando e tudo o que passou de RELATORIO_SNAPSHOT_DIAS.
+"""
+import hashlib
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import func
+
+from odutech import app, database
+from odutech import analise_vendas, arquivo
+from odutech.shards import como_usuario
+from odutech.models import TarefaRelatorio, Cliente
+
+app.config.setdefault('RELATORIO_LIMITE_SINCRONO', 5000)  # linhas; acima disso o relatório vai para segundo plano
+app.config.setdefault('RELATORIO_WORKERS', 2)
+app.config.setdefault('RELATORIO_VENDAS_DETALHE', 200)    # linhas de detalhe (página síncrona e snapshot)
+app.config.setdefault('RELATORIO_SNAPSHOT_DIAS', 7)       # snapshots mais antigos são apagados
+
+_TAREFA_EXPIRADA = timedelta(minutes=15)  # worker reiniciado no meio da execução
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['RELATORIO_WORKERS'],
+                                           thread_name_prefix='relatorio')
+        return _executor
+
+
+def _json_parametros(parametros: dict) -> str:
+    return json.dumps(parametros, sort_keys=True)  # mesmos filtros = mesmo texto (TarefaRelatorio.parametros)
+
+
+def versao_dados(id_usuario: int, parametros: dict) -> str:
+    """
+    Quantidade, maior id e última alteração dos atendimentos no período/tipo dos parâmetros,
+    somando a tabela quente e o arquivo (arquivar não muda a versão). Exclusão muda a
+    quantidade, criação o maior id, edição a última alteração.
+    """
+    inicio, fim = _data(parametros.get('data_inicio')), _data(parametros.get('data_fim'))
+    de = datetime.combine(inicio, datetime.min.time()) if inicio else None
+    ate = datetime.combine(fim + timedelta(days=1), datetime.min.time()) if fim else None
+    total, maiores, ultimas = 0, [], []
+    for modelo in (arquivo.MODELOS if arquivo.alcanca_arquivo(id_usuario, de) else arquivo.MODELOS[:1]):
+        query = (database.session.query(func.count(modelo.id), func.max(modelo.id), func.max(modelo.atualizado_em))
+                 .filter(modelo.id_usuario == id_usuario))
+        if de:
+            query = query.filter(modelo.data_atendimento >= de)
+        if ate:
+            query = query.filter(modelo.data_atendimento < ate)
+        if parametros.get('tipo'):
+            query = query.filter(modelo.tipo_atendimento == parametros['tipo'])
+        n, maior, alterado = query.one()
+        total += n
+        maiores += [maior] if maior is not None else []
+        ultimas += [alterado] if alterado is not None else []
+    return f"{total}:{max(maiores, default=None)}:{max(ultimas, default=None)}"
+
+
+def chave_relatorio(id_usuario: int, parametros: dict) -> str:
+    base = json.dumps({'u': id_usuario, 'p': parametros, 'v': versao_dados(id_usuario, parametros)}, sort_keys=True)
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def _limpar(id_usuario: int, parametros: str, chave: str):
+    """Apaga (sem commit) as tarefas do usuário que não serão mais servidas nem terminadas."""
+    agora = datetime.utcnow()
+    t = TarefaRelatorio
+    TarefaRelatorio.query.filter(
+        t.id_usuario == id_usuario,
+        ((t.parametros == parametros) & (t.chave != chave)) |
+        (t.status.in_(('pendente', 'executando')) &
+         (func.coalesce(t.atualizado_em, t.criado_em) < agora - _TAREFA_EXPIRADA)) |
+        (t.criado_em < agora - timedelta(days=app.config['RELATORIO_SNAPSHOT_DIAS']))
+    ).delete(synchronize_session=False)
+
+
+def obter_ou_agendar(id_usuario: int, parametros: dict) -> TarefaRelatorio:
+    """Snapshot pronto/em andamento para estes filtros, ou uma tarefa nova já enfileirada."""
+    chave = chave_relatorio(id_usuario, parametros)
+    tarefa = (TarefaRelatorio.query.filter_by(id_usuario=id_usuario, chave=chave)
+              .order_by(TarefaRelatorio.id.desc()).first())
+    if tarefa and (tarefa.status == 'concluido' or
+                   (tarefa.status in ('pendente', 'executando') and
+                    datetime.utcnow() - (tarefa.atualizado_em or tarefa.criado_em) < _TAREFA_EXPIRADA)):
+        return tarefa
+
+    _limpar(id_usuario, _json_parametros(parametros), chave)
+    tarefa = TarefaRelatorio(chave=chave, id_usuario=id_usuario, parametros=_json_parametros(parametros))
+    database.session.add(tarefa)
+    database.session.commit()
+    _pool().submit(_executar, tarefa.id, id_usuario)
+    return tarefa
+
+
+def _data(valor):
+    return date.fromisoformat(valor) if valor else None
+
+
+def vendas_recentes(id_usuario: int, inicio: date = None, fim: date = None, tipo: str = None, limite: int = 200):
+    """
+    As `limite` vendas mais recentes do período, já no formato usado pelo template (dicts, sem
+    ORM). Mesma lista no relatório síncrono e no snapshot; o total vem da análise.
+    """
+    de = datetime.combine(inicio, datetime.min.time()) if inicio else None
+    ate = datetime.combine(fim + timedelta(days=1), datetime.min.time()) if fim else None
+    a = arquivo.fonte(id_usuario, de, ate)
+    query = (database.session.query(a.c.data_atendimento, Cliente.nome, a.c.procedimentos,
+                                    a.c.tipo_atendimento, a.c.valor_total, a.c.forma_pagamento)
+             .select_from(a)
+             .outerjoin(Cliente, Cliente.id == a.c.id_cliente)
+             .filter(a.c.id_usuario == id_usuario))
+    if de:
+        query = query.filter(a.c.data_atendimento >= de)
+    if ate:
+        query = query.filter(a.c.data_atendimento < ate)
+    if tipo:
+        query = query.filter(a.c.tipo_atendimento == tipo)
+    return [{'data_atendimento': d, 'cliente': {'nome': nome}, 'procedimentos': proc,
+             'tipo_atendimento': t, 'valor_total': v, 'forma_pagamento': f}
+            for d, nome, proc, t, v, f in query.order_by(a.c.data_atendimento.desc()).limit(limite)]
+
+
+def _executar(id_tarefa: int, id_usuario: int):
+    with app.app_context(), como_usuario(id_usuario):
+        tarefa = database.session.get(TarefaRelatorio, id_tarefa)
+        if tarefa is None:  # apagada por _limpar antes de começar
+            database.session.remove()
+            return
+        try:
+            tarefa.status = 'executando'
+            database.session.commit()
+
+            p = json.loads(tarefa.parametros)
+            inicio, fim, tipo = _data(p.get('data_inicio')), _data(p.get('data_fim')), p.get('tipo')
+
+            def progresso(fracao):
+                tarefa.progresso = int(fracao * 80)
+                database.session.commit()
+
+            dados = analise_vendas.carregar_por_ano(tarefa.id_usuario, inicio, fim, tipo, progresso=progresso)
+            analise = analise_vendas.resumo(tarefa.id_usuario, inicio, fim, tipo,
+                                            granularidade=p.get('granularidade', 'mes'), janela=p.get('janela', 3),
+                                            dados=dados)
+            tarefa.progresso = 90
+            database.session.commit()
+
+            tarefa.resultado = json.dumps({
+                'analise': analise,
+                'estatisticas': analise_vendas.estatisticas_por_tipo(dados),
+                'vendas': [dict(v, data_atendimento=v['data_atendimento'].isoformat())
+                           for v in vendas_recentes(tarefa.id_usuario, inicio, fim, tipo,
+                                                    limite=app.config['RELATORIO_VENDAS_DETALHE'])],
+                'gerado_em': datetime.now().isoformat(timespec='seconds'),
+            })
+            tarefa.status = 'concluido'
+            tarefa.progresso = 100
+            database.session.commit()
+        except Exception as e:
+            database.session.rollback()
+            print(f"[relatorio] Falha na tarefa {id_tarefa}: {e}", file=sys.stderr)
+            tarefa = database.session.get(TarefaRelatorio, id_tarefa)
+            if tarefa:
+                tarefa.status = 'erro'
+                tarefa.erro = str(e)[:1000]
+                database.session.commit()
+        finally:
+            database.session.remove()
+
+
+def carregar_snapshot(tarefa: TarefaRelatorio) -> dict:
+    snapshot = json.loads(tarefa.resultado)
+    for v in snapshot['vendas']:
+        v['data_atendimento'] = datetime.fromisoformat(v['data_atendimento'])
+    return snapshot
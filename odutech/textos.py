@@ -0,0 +1,245 @@
+# odutech/textos.py
+"""
+Texto dos documentos dos clientes e busca full-text.
+
+Depois do upload (cliente_upload_documento), agendar() manda o documento para um pool
+pequeno de threads: o texto do PDF/DOCX/TXT é extraído fora do request e gravado na
+tabela FTS5 documento_busca (rowid = id do documento); o estado fica em DocumentoTexto.
+buscar() consulta o índice com o usuário no próprio MATCH e devolve os documentos em ordem de
+relevância (bm25) com um trecho destacado.
+
+PDF usa o pacote pypdf (opcional: sem ele o documento fica como 'sem_extrator' e pode ser
+reindexado depois); DOCX é lido direto do XML interno, sem dependência.
+
+Documentos já existentes: `python main.py --index-documents` (com --force reprocessa todos,
+por exemplo depois de instalar o pypdf).
+"""
+import os
+import re
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.etree import ElementTree
+
+from markupsafe import escape, Markup
+from sqlalchemy import text
+
+from odutech import app, database
+from odutech.models import ClienteDocumento, DocumentoTexto, Cliente, Usuario, usuario_fts
+from odutech.shards import como_usuario
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # dependência opcional: PDFs ficam 'sem_extrator'
+    PdfReader = None
+
+app.config.setdefault('TEXTO_WORKERS', 1)                  # extrações simultâneas por worker do gunicorn
+app.config.setdefault('TEXTO_MAX_CARACTERES', 200_000)     # por documento
+app.config.setdefault('TEXTO_MAX_PAGINAS_PDF', 200)
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_INICIO, _FIM = '\x02', '\x03'  # marcadores do snippet(), trocados por <mark> depois de escapar
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['TEXTO_WORKERS'], thread_name_prefix='texto')
+        return _executor
+
+
+# =========================
+# Extração
+# =========================
+def _tipo(nome: str, mimetype: str = None) -> str:
+    ext = os.path.splitext(nome or '')[1].lower()
+    if ext == '.pdf' or mimetype == 'application/pdf':
+        return 'pdf'
+    if ext == '.docx' or mimetype == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+        return 'docx'
+    if ext in ('.txt', '.md', '.csv') or (mimetype or '').startswith('text/'):
+        return 'txt'
+    return ''
+
+
+def _texto_pdf(caminho: str) -> str:
+    leitor = PdfReader(caminho)
+    paginas = leitor.pages[:app.config['TEXTO_MAX_PAGINAS_PDF']]
+    return '\n'.join(p.extract_text() or '' for p in paginas)
+
+
+def _texto_docx(caminho: str) -> str:
+    with zipfile.ZipFile(caminho) as z:
+        raiz = ElementTree.fromstring(z.read('word/document.xml'))
+    return '\n'.join(''.join(t.text or '' for t in par.iter(f'{_W}t')) for par in raiz.iter(f'{_W}p'))
+
+
+def _texto_txt(caminho: str) -> str:
+    with open(caminho, 'rb') as f:
+        dados = f.read(app.config['TEXTO_MAX_CARACTERES'] * 4)
+    try:
+        return dados.decode('utf-8')
+    except UnicodeDecodeError:
+        return dados.decode('latin-1')
+
+
+def extrair(caminho: str, nome: str, mimetype: str = None):
+    """
+    (status, texto) de um arquivo; com status 'erro', o texto é a mensagem do erro.
+    Não toca no banco: pode rodar em qualquer thread.
+    """
+    tipo = _tipo(nome, mimetype)
+    if not tipo:
+        return 'sem_extrator', ''
+    if tipo == 'pdf' and PdfReader is None:
+        return 'sem_extrator', ''
+    try:
+        conteudo = {'pdf': _texto_pdf, 'docx': _texto_docx, 'txt': _texto_txt}[tipo](caminho)
+    except Exception as e:  # arquivo corrompido, protegido por senha, ausente...
+        return 'erro', str(e)[:500]
+    conteudo = re.sub(r'[ \t\r\f\v]+', ' ', conteudo)
+    conteudo = re.sub(r'\n\s*\n+', '\n', conteudo).strip()[:app.config['TEXTO_MAX_CARACTERES']]
+    return ('indexado' if conteudo else 'vazio'), conteudo
+
+
+def caminho_documento(doc: ClienteDocumento) -> str:
+    return os.path.join(app.root_path, 'static', doc.filename_stored)
+
+
+def gravar(doc: ClienteDocumento, status: str, conteudo: str):
+    """Atualiza DocumentoTexto e o índice FTS do documento (sem commit)."""
+    registro = database.session.get(DocumentoTexto, doc.id)
+    if registro is None:
+        registro = DocumentoTexto(id_documento=doc.id, id_usuario=doc.id_usuario)
+        database.session.add(registro)
+    registro.status = status
+    registro.erro = conteudo if status == 'erro' else None
+    registro.caracteres = len(conteudo) if status == 'indexado' else 0
+    registro.atualizado_em = datetime.utcnow()
+
+    conn = database.session.connection(bind_arguments={'mapper': DocumentoTexto})
+    conn.execute(text('DELETE FROM documento_busca WHERE rowid = :id'), {'id': doc.id})
+    if status == 'indexado':
+        conn.execute(text('INSERT INTO documento_busca (rowid, texto, usuario) VALUES (:id, :texto, :u)'),
+                     {'id': doc.id, 'texto': conteudo, 'u': usuario_fts(doc.id_usuario)})
+
+
+# =========================
+# Segundo plano (após o upload)
+# =========================
+def agendar(doc: ClienteDocumento):
+    """Marca o documento como pendente e extrai o texto em segundo plano (chamar após o commit)."""
+    if database.session.get(DocumentoTexto, doc.id) is None:
+        database.session.add(DocumentoTexto(id_documento=doc.id, id_usuario=doc.id_usuario))
+        database.session.commit()
+    _pool().submit(_processar, doc.id, doc.id_usuario)
+
+
+def _processar(id_documento: int, id_usuario: int):
+    with app.app_context(), como_usuario(id_usuario):
+        try:
+            doc = database.session.get(ClienteDocumento, id_documento)
+            if doc is None:  # excluído antes de chegar a vez
+                return
+            status, conteudo = extrair(caminho_documento(doc), doc.filename_original, doc.mimetype)
+            gravar(doc, status, conteudo)
+            database.session.commit()
+        except Exception as e:
+            database.session.rollback()
+            print(f"[textos] Falha ao indexar documento {id_documento}: {e}", file=sys.stderr)
+        finally:
+            database.session.remove()
+
+
+# =========================
+# Busca
+# =========================
+def _consulta_fts(termos: str) -> str:
+    """Texto livre -> consulta FTS5 segura: cada palavra entre aspas, prefixo na última."""
+    palavras = re.findall(r'\w+', termos or '')[:12]
+    if not palavras:
+        return ''
+    return ' '.join(f'"{p}"' for p in palavras) + '*'
+
+
+def _trecho(snippet: str) -> Markup:
+    return Markup(str(escape(snippet)).replace(_INICIO, '<mark>').replace(_FIM, '</mark>'))
+
+
+def buscar(id_usuario: int, termos: str, limite: int = 20, offset: int = 0):
+    """Documentos do usuário que batem com os termos, mais relevantes primeiro, com trecho destacado."""
+    consulta = _consulta_fts(termos)
+    if not consulta or database.engine.dialect.name != 'sqlite':
+        return []
+    conn = database.session.connection(bind_arguments={'mapper': DocumentoTexto})
+    # O usuário entra no MATCH (o FTS5 cruza os termos só com os documentos dele); a coluna
+    # usuario tem peso 0 no bm25 e os termos ficam restritos a texto
+    linhas = conn.execute(text(
+        "SELECT rowid, snippet(documento_busca, 0, :ini, :fim, '…', 16), bm25(documento_busca, 1.0, 0.0) "
+        "FROM documento_busca WHERE documento_busca MATCH :q "
+        "ORDER BY bm25(documento_busca, 1.0, 0.0) LIMIT :limite OFFSET :offset"),
+        {'ini': _INICIO, 'fim': _FIM, 'q': f'usuario : "{usuario_fts(id_usuario)}" AND texto : ({consulta})',
+         'limite': limite, 'offset': offset}).all()
+    if not linhas:
+        return []
+
+    docs = {d.id: (d, nome) for d, nome in
+            database.session.query(ClienteDocumento, Cliente.nome)
+            .join(Cliente, Cliente.id == ClienteDocumento.id_cliente)
+            .filter(ClienteDocumento.id.in_([r[0] for r in linhas]), ClienteDocumento.id_usuario == id_usuario)}
+    resultado = []
+    for id_doc, trecho, relevancia in linhas:
+        if id_doc not in docs:
+            continue
+        doc, nome_cliente = docs[id_doc]
+        resultado.append({'documento': doc, 'cliente': nome_cliente, 'trecho': _trecho(trecho),
+                          'relevancia': -relevancia})
+    return resultado
+
+
+# =========================
+# Backfill (main.py --index-documents)
+# =========================
+def _extrair_item(item):
+    id_doc, caminho, nome, mimetype = item
+    return id_doc, extrair(caminho, nome, mimetype)
+
+
+def indexar_pendentes(workers: int = 4, lote: int = 50, refazer: bool = False, id_usuario: int = None):
+    """
+    Extrai o texto dos documentos sem DocumentoTexto (ou de todos, com refazer=True).
+    A extração roda em até `workers` threads, `lote` documentos por vez; a gravação fica
+    na thread principal (SQLite tem um escritor só) com um commit por lote.
+    Retorna [(usuario, {status: quantidade})].
+    """
+    usuarios = [database.session.get(Usuario, id_usuario)] if id_usuario else Usuario.query.order_by(Usuario.id).all()
+    relatorio = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='texto-backfill') as pool:
+        for usuario in usuarios:
+            contagem = {}
+            with como_usuario(usuario.id):
+                query = ClienteDocumento.query.filter(ClienteDocumento.id_usuario == usuario.id)
+                if not refazer:
+                    query = query.outerjoin(DocumentoTexto, DocumentoTexto.id_documento == ClienteDocumento.id) \
+                        .filter((DocumentoTexto.id_documento.is_(None)) | (DocumentoTexto.status == 'pendente'))
+                ultimo = 0
+                while True:
+                    docs = query.filter(ClienteDocumento.id > ultimo).order_by(ClienteDocumento.id).limit(lote).all()
+                    if not docs:
+                        break
+                    ultimo = docs[-1].id
+                    por_id = {d.id: d for d in docs}
+                    itens = [(d.id, caminho_documento(d), d.filename_original, d.mimetype) for d in docs]
+                    for id_doc, (status, conteudo) in pool.map(_extrair_item, itens):
+                        gravar(por_id[id_doc], status, conteudo)
+                        contagem[status] = contagem.get(status, 0) + 1
+                    database.session.commit()
+            if contagem:
+                relatorio.append((usuario, contagem))
+    return relatorio
@@ -0,0 +1,85 @@
+# tests/conftest.py
+"""
+Banco SQLite e uploads em um diretório temporário (definidos antes de importar o odutech),
+CSRF desligado e um cliente HTTP já logado.
+
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+import uuid
+from datetime import date
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix='odutech-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TMP, 'comunidade.db')}"
+os.environ['VOLUME_DIR'] = _TMP
+os.environ.pop('SHARDING', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_bcrypt import generate_password_hash  # noqa: E402
+
+from odutech import app as flask_app, database  # noqa: E402
+from odutech.models import Cliente, Usuario, atualizar_schema  # noqa: E402
+
+flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        atualizar_schema()
+        if not Usuario.query.filter_by(email='teste@exemplo.com').first():
+            database.session.add(Usuario(username='teste', email='teste@exemplo.com',
+                                         senha=generate_password_hash('senha123').decode('utf-8')))
+            database.session.commit()
+    return flask_app
+
+
+@pytest.fixture
+def usuario(app):
+    with app.app_context():
+        return Usuario.query.filter_by(email='teste@exemplo.com').first().id
+
+
+@pytest.fixture
+def usuario_vazio(app):
+    """Id de um usuário novo, sem dados: para testes que olham o conjunto inteiro de um usuário."""
+    with app.app_context():
+        novo = Usuario(username=f'casa {uuid.uuid4().hex[:8]}', email=f'{uuid.uuid4().hex[:8]}@exemplo.com',
+                       senha=generate_password_hash('senha123').decode('utf-8'))
+        database.session.add(novo)
+        database.session.commit()
+        return novo.id
+
+
+@pytest.fixture
+def cliente_http(app):
+    cliente = app.test_client()
+    resp = cliente.post('/', data={'email': 'teste@exemplo.com', 'senha': 'senha123'})
+    assert resp.status_code == 302
+    return cliente
+
+
+@pytest.fixture
+def id_cliente(app, usuario):
+    with app.app_context():
+        cliente = Cliente(nome='Cliente Teste', data_nascimento=date(1990, 1, 1), nome_mae='Mãe', id_usuario=usuario)
+        database.session.add(cliente)
+        database.session.commit()
+        return cliente.id
+
+
+@pytest.fixture
+def api(app):
+    """Cliente HTTP da /api/v1: chamar(metodo, caminho, json=...) já com o token Bearer."""
+    cliente = app.test_client()
+    resp = cliente.post('/api/v1/token', json={'email': 'teste@exemplo.com', 'senha': 'senha123', 'nome': 'testes'})
+    assert resp.status_code == 201
+    cabecalho = {'Authorization': f"Bearer {resp.get_json()['token']}"}
+
+    def chamar(metodo, caminho, **kwargs):
+        return cliente.open(caminho, method=metodo, headers=cabecalho, **kwargs)
+    return chamar
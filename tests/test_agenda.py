@@ -0,0 +1,50 @@
+# tests/test_agenda.py
+from datetime import date, timedelta
+
+from odutech import database
+from odutech.models import Cliente
+from odutech.routes import _faixas_mes_dia, _proxima_ocorrencia
+
+
+def test_faixas_na_virada_do_ano_e_29_de_fevereiro():
+    assert _faixas_mes_dia(date(2025, 3, 1), 7) == [(301, 308)]
+    assert _faixas_mes_dia(date(2025, 12, 28), 7) == [(1228, 1231), (101, 104)]
+    assert _faixas_mes_dia(date(2025, 2, 21), 7) == [(221, 229)]  # 2025 não é bissexto: 29/02 cai em 28/02
+    assert _faixas_mes_dia(date(2024, 2, 21), 7) == [(221, 228)]
+    assert _faixas_mes_dia(date(2025, 6, 1), 365) == [(101, 1231)]
+
+
+def test_proxima_ocorrencia():
+    assert _proxima_ocorrencia(229, date(2025, 2, 1)) == date(2025, 2, 28)
+    assert _proxima_ocorrencia(229, date(2028, 2, 1)) == date(2028, 2, 29)
+    assert _proxima_ocorrencia(115, date(2025, 3, 1)) == date(2026, 1, 15)
+
+
+def _no_ano(d: date, ano: int) -> date:
+    return d.replace(year=ano) if (d.month, d.day) != (2, 29) else date(ano, 2, 28)
+
+
+def test_api_agenda_lista_aniversarios_e_iniciacoes_da_janela(app, usuario, cliente_http):
+    hoje = date.today()
+    em_tres, em_trinta = hoje + timedelta(days=3), hoje + timedelta(days=30)
+    with app.app_context():
+        clientes = [Cliente(nome='Aniversariante', data_nascimento=_no_ano(em_tres, 1990), nome_mae='Ana',
+                            data_iniciacao=_no_ano(em_trinta, 2010), id_usuario=usuario),
+                    Cliente(nome='Iniciado', data_nascimento=_no_ano(em_trinta, 1985), nome_mae='Ana',
+                            data_iniciacao=_no_ano(hoje, 2015), id_usuario=usuario)]
+        database.session.add_all(clientes)
+        database.session.commit()
+        ids = [c.id for c in clientes]
+
+    def eventos(dias):
+        dados = cliente_http.get(f'/api/agenda?dias={dias}').get_json()
+        return {(e['id_cliente'], e['tipo']): e for e in dados['eventos'] if e['id_cliente'] in ids}
+
+    semana = eventos(7)
+    assert set(semana) == {(ids[0], 'nascimento'), (ids[1], 'iniciacao')}
+    assert semana[(ids[0], 'nascimento')]['faltam_dias'] == 3
+    assert semana[(ids[0], 'nascimento')]['anos'] == em_tres.year - 1990
+    iniciacao = semana[(ids[1], 'iniciacao')]
+    assert (iniciacao['data'], iniciacao['faltam_dias']) == (hoje.isoformat(), 0)
+    assert len(eventos(30)) == 4
+    assert cliente_http.get('/api/agenda?dias=9999').get_json()['dias'] == 365
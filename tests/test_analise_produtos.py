@@ -0,0 +1,80 @@
+# tests/test_analise_produtos.py
+from datetime import date, datetime, timedelta
+
+from odutech import database
+from odutech.analise_produtos import calcular, desempenho
+from odutech.arquivo import arquivar
+from odutech.estoque import movimentar
+from odutech.models import Atendimento, AtendimentoArquivo, Cliente, Produto
+
+
+def _venda(id_usuario, id_cliente, id_produto, dias_atras, quantidade, valor):
+    database.session.add(Atendimento(
+        data_atendimento=datetime.combine(date.today() - timedelta(days=dias_atras), datetime.min.time()),
+        executor='Pai João', procedimentos='Venda', valor_total=valor, tipo_atendimento='outro',
+        id_usuario=id_usuario, id_cliente=id_cliente, id_produto=id_produto, quantidade_produto=quantidade))
+
+
+def _cenario(id_usuario):
+    cliente = Cliente(nome='Comprador', data_nascimento=date(1990, 1, 1), nome_mae='Ana', id_usuario=id_usuario)
+    database.session.add(cliente)
+    produtos = {}
+    for nome, estoque in (('Vela', 9), ('Guia', 100), ('Pemba', 0), ('Incenso', 4)):
+        produtos[nome] = Produto(nome=nome, preco=10.0, quantidade_estoque=estoque, id_usuario=id_usuario,
+                                 data_cadastro=datetime.now() - timedelta(days=800))
+        database.session.add(produtos[nome])
+    database.session.flush()
+    ids = {nome: p.id for nome, p in produtos.items()}
+    _venda(id_usuario, cliente.id, ids['Vela'], 5, 20, 200.0)      # na janela
+    _venda(id_usuario, cliente.id, ids['Vela'], 40, 10, 100.0)     # na janela
+    _venda(id_usuario, cliente.id, ids['Vela'], 200, 99, 990.0)    # fora da janela
+    _venda(id_usuario, cliente.id, ids['Guia'], 500, 3, 30.0)  # arquivadas abaixo
+    _venda(id_usuario, cliente.id, ids['Guia'], 450, 1, 10.0)
+    _venda(id_usuario, cliente.id, ids['Guia'], 60, 3, 30.0)
+    database.session.commit()
+    arquivar(id_usuario, meses=12)
+    assert AtendimentoArquivo.query.filter_by(id_usuario=id_usuario, id_produto=ids['Guia']).count() == 2
+    return ids
+
+
+def test_agrega_janela_e_historico_com_arquivo(app, usuario_vazio):
+    with app.app_context():
+        ids = _cenario(usuario_vazio)
+        relatorio = calcular(usuario_vazio, janela=90, alerta=30)
+        por_nome = {p['nome']: p for p in relatorio['produtos']}
+
+        vela = por_nome['Vela']
+        assert (vela['unidades'], vela['receita'], vela['vendas']) == (30, 300.0, 2)
+        assert vela['velocidade'] == 30 / 90
+        assert vela['dias_restantes'] == 9 / (30 / 90) and vela['status'] == 'baixo'
+        assert vela['ultima_venda'].date() == date.today() - timedelta(days=5)
+
+        guia = por_nome['Guia']
+        assert (guia['unidades'], guia['vendas'], guia['status']) == (3, 1, 'ok')
+
+        # sem vendas na janela: a última venda vem da tabela quente e, sem ela, do arquivo
+        relatorio = calcular(usuario_vazio, janela=30, alerta=30)
+        guia = {p['nome']: p for p in relatorio['produtos']}['Guia']
+        assert (guia['unidades'], guia['status']) == (0, 'parado')
+        assert guia['ultima_venda'].date() == date.today() - timedelta(days=60)
+        database.session.query(Atendimento).filter(Atendimento.id_produto == ids['Guia']).delete()
+        database.session.commit()
+        guia = {p['nome']: p for p in calcular(usuario_vazio, janela=30)['produtos']}['Guia']
+        assert guia['ultima_venda'].date() == date.today() - timedelta(days=450)
+
+        assert [p['nome'] for p in relatorio['produtos']][:1] == ['Pemba']  # sem estoque vem primeiro
+        assert relatorio['por_status']['sem_estoque'] == 1
+        assert {p['nome']: p['vendas'] for p in relatorio['produtos']}['Incenso'] == 0
+
+
+def test_cache_invalida_na_proxima_gravacao(app, usuario_vazio):
+    with app.app_context():
+        ids = _cenario(usuario_vazio)
+        primeiro = desempenho(usuario_vazio, janela=90)
+        assert desempenho(usuario_vazio, janela=90) is primeiro
+
+        movimentar(usuario_vazio, ids['Incenso'], 6, 'ajuste')
+        database.session.commit()
+        novo = desempenho(usuario_vazio, janela=90)
+        assert novo is not primeiro
+        assert {p['nome']: p['estoque'] for p in novo['produtos']}['Incenso'] == 10
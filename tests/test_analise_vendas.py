@@ -0,0 +1,87 @@
+# tests/test_analise_vendas.py
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from odutech import analise_vendas, database
+from odutech.analise_vendas import _colunas, agrupar, estatisticas_por_tipo, media_movel, serie
+from odutech.arquivo import arquivar
+from odutech.models import Atendimento, Cliente
+
+LINHAS = [  # (data, valor, tipo, forma, produto)
+    ('2024-01-01', 10.0, 'ebó', 'pix', 1),   # segunda-feira
+    ('2024-01-03', 20.0, 'Ebo', 'pix', 2),
+    ('2024-01-03', 5.0, 'buzios', 'dinheiro', None),
+    ('2024-01-09', 40.0, 'obrigação', None, 1),
+    ('2024-02-15', None, 'outro', 'pix', 1),  # valor nulo conta como 0
+]
+
+
+@pytest.fixture
+def dados():
+    return _colunas(LINHAS)
+
+
+def test_serie_por_dia_semana_e_mes_com_baldes_vazios(dados):
+    eixo, receita, contagem = serie(dados, 'dia', date(2024, 1, 1), date(2024, 1, 4))
+    assert [str(d) for d in eixo] == ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04']
+    assert receita.tolist() == [10.0, 0.0, 25.0, 0.0]
+    assert contagem.tolist() == [1, 0, 2, 0]
+
+    eixo, receita, contagem = serie(dados, 'semana', date(2024, 1, 3), date(2024, 1, 20))
+    assert [str(d) for d in eixo] == ['2024-01-01', '2024-01-08', '2024-01-15']  # segundas
+    assert receita.tolist() == [35.0, 40.0, 0.0] and contagem.tolist() == [3, 1, 0]
+
+    eixo, receita, contagem = serie(dados, 'mes')
+    assert [str(m) for m in eixo] == ['2024-01', '2024-02']
+    assert receita.tolist() == [75.0, 0.0] and contagem.tolist() == [4, 1]
+
+
+def test_serie_vazia(dados):
+    vazio = _colunas([])
+    assert all(a.size == 0 for a in serie(vazio, 'dia'))
+    assert all(a.size == 0 for a in serie(dados, 'dia', date(2024, 2, 1), date(2024, 1, 1)))
+
+
+def test_media_movel_com_janela_parcial_no_inicio():
+    assert media_movel([2, 4, 6, 8], 3).tolist() == [2.0, 3.0, 4.0, 6.0]
+    assert media_movel([5, 7], 10).tolist() == [5.0, 6.0]
+    assert media_movel([], 3).size == 0
+
+
+def test_agrupar_e_estatisticas_por_tipo(dados):
+    # ordenado pela soma: a venda sem forma de pagamento (40) vem antes das três no pix (30)
+    assert agrupar(dados['forma'], dados['valor']) == [('', 1, 40.0), ('pix', 3, 30.0), ('dinheiro', 1, 5.0)]
+    assert agrupar(np.array([], dtype=object), np.array([])) == []
+
+    estatisticas = estatisticas_por_tipo(dados)
+    assert estatisticas['ebó'] == {'quantidade': 2, 'valor_total': 30.0}   # 'ebó' e 'Ebo'
+    assert estatisticas['obrigacao'] == estatisticas['obrigação'] == {'quantidade': 1, 'valor_total': 40.0}
+    assert estatisticas['gbory'] == {'quantidade': 0, 'valor_total': 0.0}
+
+
+def test_resumo_do_banco_inclui_arquivo_e_ano_anterior(app, usuario_vazio):
+    with app.app_context():
+        cliente = Cliente(nome='Vendas', data_nascimento=date(1990, 1, 1), nome_mae='Ana', id_usuario=usuario_vazio)
+        database.session.add(cliente)
+        database.session.flush()
+        for data, valor, tipo in ((datetime(2020, 3, 5), 100.0, 'ebó'), (datetime(2020, 3, 20), 50.0, 'buzios'),
+                                  (datetime(2019, 3, 10), 60.0, 'ebó')):
+            database.session.add(Atendimento(data_atendimento=data, valor_total=valor, tipo_atendimento=tipo,
+                                             forma_pagamento='pix', executor='Pai João', procedimentos='x',
+                                             id_cliente=cliente.id, id_usuario=usuario_vazio))
+        database.session.commit()
+        arquivar(usuario_vazio, meses=12)  # tudo vai para o arquivo
+
+        r = analise_vendas.resumo(usuario_vazio, date(2020, 3, 1), date(2020, 3, 31), granularidade='semana', janela=2)
+        assert r['totais'] == {'receita': 150.0, 'atendimentos': 2, 'ticket_medio': 75.0,
+                               'atendimentos_por_dia': 2 / 31}
+        assert sum(p['receita'] for p in r['serie']) == 150.0
+        assert r['serie'][0]['periodo'] == '2020-02-24'
+        assert r['comparativo_anual']['receita_anterior'] == 60.0
+        assert r['comparativo_anual']['variacao_pct'] == 150.0
+        assert r['pagamentos'] == [{'forma': 'pix', 'atendimentos': 2, 'receita': 150.0, 'percentual': 100.0}]
+
+        so_ebo = analise_vendas.resumo(usuario_vazio, date(2020, 3, 1), date(2020, 3, 31), tipo='ebó')
+        assert so_ebo['totais']['receita'] == 100.0
@@ -0,0 +1,163 @@
+# tests/test_api.py
+import uuid
+from datetime import date, timedelta
+
+from odutech import database
+from odutech.models import Atendimento, Cliente, Produto, VinculoRitual
+
+
+def _cliente(nome=None, **campos):
+    # nascimento sorteado: nomes aleatórios ainda podem soar iguais (chave fonética + nascimento)
+    nascimento = date(1950, 1, 1) + timedelta(days=uuid.uuid4().int % 20000)
+    item = {'nome': nome or f'Cliente {uuid.uuid4().hex[:8]}', 'data_nascimento': nascimento.isoformat(),
+            'nome_mae': 'Rosa'}
+    item.update(campos)
+    return item
+
+
+def _atendimento(**campos):
+    item = {'data_atendimento': '2024-05-02', 'executor': 'Pai João', 'procedimentos': 'Consulta',
+            'valor_total': 50, 'forma_pagamento': 'pix', 'tipo_atendimento': 'consulta', 'quantidade_produto': 2}
+    item.update(campos)
+    return item
+
+
+def test_lote_cria_com_referencias_cruzadas(app, api):
+    resp = api('POST', '/api/v1/lote?campos_produtos=id,quantidade_estoque', json={
+        'clientes': [_cliente(ref='c1')],
+        'produtos': [{'ref': 7, 'nome': 'Vela', 'preco': 5, 'quantidade_estoque': 10}],
+        'atendimentos': [_atendimento(cliente_ref='c1', produto_ref=7)],
+    })
+    assert resp.status_code == 200, resp.get_json()
+    cliente, produto, atendimento = resp.get_json()['resultados']
+    assert [r['acao'] for r in (cliente, produto, atendimento)] == ['criado'] * 3
+    assert (cliente['ref'], produto['ref']) == ('c1', 7)
+    assert produto['quantidade_estoque'] == 8  # resposta montada depois do lote inteiro
+    with app.app_context():
+        gravado = database.session.get(Atendimento, atendimento['id'])
+        assert (gravado.id_cliente, gravado.id_produto) == (cliente['id'], produto['id'])
+        assert database.session.get(Produto, produto['id']).quantidade_estoque == 8
+
+
+def test_lote_atualiza_so_os_campos_enviados(app, api):
+    criado = api('POST', '/api/v1/clientes', json={'itens': [_cliente(telefone='1111')]}).get_json()['resultados'][0]
+    resp = api('POST', '/api/v1/clientes?campos=nome,telefone', json={'itens': [
+        {'id': criado['id'], 'telefone': '2222'}]})
+    assert resp.status_code == 200
+    assert resp.get_json()['resultados'][0]['acao'] == 'atualizado'
+    with app.app_context():
+        cliente = database.session.get(Cliente, criado['id'])
+        assert cliente.telefone == '2222' and cliente.nome_mae == 'Rosa'
+
+
+def test_lote_invalido_nao_grava_nada(app, usuario, api):
+    nome = f'Cliente {uuid.uuid4().hex[:8]}'
+    resp = api('POST', '/api/v1/lote', json={
+        'clientes': [_cliente(nome), _cliente(data_nascimento='ontem')],
+        'atendimentos': [_atendimento(cliente_ref='inexistente', id_produto=999999)],
+    })
+    assert resp.status_code == 422
+    erros = {(e['recurso'], e['indice']): e['erros'] for e in resp.get_json()['erros']}
+    assert set(erros) == {('clientes', 1), ('atendimentos', 0)}
+    assert set(erros[('atendimentos', 0)]) >= {'id_cliente', 'id_produto'}
+    with app.app_context():
+        assert Cliente.query.filter_by(id_usuario=usuario, nome=nome).count() == 0
+
+
+def test_ref_que_nao_e_texto_nem_numero_da_400(app, api):
+    for ref in ([1], {'a': 1}, 1.5, True):
+        resp = api('POST', '/api/v1/lote', json={'clientes': [_cliente(ref=ref)],
+                                                 'atendimentos': [_atendimento(cliente_ref=ref)]})
+        assert resp.status_code == 400, ref
+        assert [list(e['erros']) for e in resp.get_json()['erros']] == [['ref'], ['cliente_ref']]
+
+
+def test_erros_de_formato_do_lote(api):
+    assert api('POST', '/api/v1/lote', data='[]', content_type='application/json').status_code == 400
+    assert api('POST', '/api/v1/lote', json={'clientes': {'nome': 'x'}}).status_code == 400
+    assert api('POST', '/api/v1/clientes', json={'itens': [{'id': 999999, 'nome': 'x'}]}).status_code == 422
+    assert api('POST', '/api/v1/clientes?campos=senha', json={'itens': []}).status_code == 400
+    assert api('POST', '/api/v1/inexistente', json={'itens': []}).status_code == 404
+
+
+def test_cliente_duplicado_pede_confirmacao(app, usuario, api):
+    item = _cliente()
+    primeiro = api('POST', '/api/v1/clientes', json={'itens': [item]}).get_json()['resultados'][0]
+
+    resp = api('POST', '/api/v1/clientes', json={'itens': [dict(item)]})
+    assert resp.status_code == 409
+    assert resp.get_json()['possiveis_duplicados'] == [primeiro['id']]
+
+    resp = api('POST', '/api/v1/clientes', json={'itens': [dict(item, confirmar_duplicado=True)]})
+    assert resp.status_code == 200
+    assert resp.get_json()['resultados'][0]['possiveis_duplicados'] == [primeiro['id']]
+    with app.app_context():
+        assert Cliente.query.filter_by(id_usuario=usuario, nome=item['nome']).count() == 2
+
+
+def test_renomear_pela_api_refaz_vinculos_rituais(app, usuario, api):
+    sufixo = uuid.uuid4().hex[:8]
+    with app.app_context():
+        filho = Cliente(nome=f'Filho {sufixo}', data_nascimento=date(2000, 1, 1), nome_mae='Ana', id_usuario=usuario,
+                        navalha=f'Mãe Nova {sufixo}')
+        database.session.add(filho)
+        database.session.commit()
+        id_filho = filho.id
+
+    criado = api('POST', '/api/v1/clientes', json={'itens': [_cliente(f'Mae Velha {sufixo}')]}) \
+        .get_json()['resultados'][0]
+    with app.app_context():
+        assert VinculoRitual.query.filter_by(id_cliente=id_filho).count() == 0
+
+    assert api('POST', '/api/v1/clientes', json={'itens': [
+        {'id': criado['id'], 'nome': f'Mãe Nova {sufixo}'}]}).status_code == 200
+    with app.app_context():
+        vinculo = VinculoRitual.query.filter_by(id_cliente=id_filho).one()
+        assert (vinculo.papel, vinculo.id_cliente_ref) == ('navalha', criado['id'])
+
+
+def _sincronizar(api, desde):
+    """Todas as páginas de /sync a partir de `desde`: (seq final, alterações, exclusões)."""
+    alteracoes, exclusoes = {}, []
+    while True:
+        dados = api('GET', f'/api/v1/sync?since={desde}').get_json()
+        assert dados['seq'] >= desde
+        for recurso, itens in dados['alteracoes'].items():
+            alteracoes.setdefault(recurso, []).extend(itens)
+        exclusoes.extend(dados['exclusoes'])
+        desde = dados['seq']
+        if not dados['mais']:
+            return desde, alteracoes, exclusoes
+
+
+def test_sync_devolve_so_o_que_mudou_e_as_exclusoes(app, api, cliente_http):
+    desde, _, _ = _sincronizar(api, 0)
+    criado = api('POST', '/api/v1/clientes', json={'itens': [_cliente(telefone='1111')]}).get_json()['resultados'][0]
+    api('POST', '/api/v1/clientes', json={'itens': [{'id': criado['id'], 'telefone': '2222'}]})
+
+    seq, alteracoes, exclusoes = _sincronizar(api, desde)
+    assert [(c['id'], c['telefone']) for c in alteracoes['clientes']] == [(criado['id'], '2222')]
+    assert exclusoes == [] and seq > desde
+    assert _sincronizar(api, seq)[1:] == ({recurso: [] for recurso in alteracoes}, [])
+
+    assert cliente_http.post(f"/cliente/excluir/{criado['id']}").status_code == 302
+    _, alteracoes, exclusoes = _sincronizar(api, seq)
+    assert alteracoes['clientes'] == []
+    assert [(e['recurso'], e['id']) for e in exclusoes] == [('clientes', criado['id'])]
+
+
+def test_sync_paginado_nao_pula_alteracoes(app, api):
+    desde, _, _ = _sincronizar(api, 0)
+    produtos = api('POST', '/api/v1/produtos', json={'itens': [
+        {'nome': f'Produto {n}', 'preco': 1, 'quantidade_estoque': 1} for n in range(5)]}).get_json()['resultados']
+    clientes = api('POST', '/api/v1/clientes', json={'itens': [_cliente(), _cliente()]}).get_json()['resultados']
+
+    limite = app.config['API_LIMITE_SYNC']
+    app.config['API_LIMITE_SYNC'] = 2
+    try:
+        assert api('GET', f'/api/v1/sync?since={desde}').get_json()['mais'] is True
+        _, alteracoes, _ = _sincronizar(api, desde)
+    finally:
+        app.config['API_LIMITE_SYNC'] = limite
+    assert [p['id'] for p in alteracoes['produtos']] == [p['id'] for p in produtos]
+    assert [c['id'] for c in alteracoes['clientes']] == [c['id'] for c in clientes]
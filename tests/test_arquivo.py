@@ -0,0 +1,95 @@
+# tests/test_arquivo.py
+from datetime import date, datetime, timedelta
+
+from odutech import arquivo, database
+from odutech.models import Atendimento, AtendimentoArquivo, Cliente, ResumoCliente
+
+
+def _cliente(id_usuario):
+    cliente = Cliente(nome='Cliente Arquivo', data_nascimento=date(1975, 1, 1), nome_mae='Ana', id_usuario=id_usuario)
+    database.session.add(cliente)
+    database.session.flush()
+    return cliente.id
+
+
+def _atendimento(id_usuario, id_cliente, data, valor=10):
+    atendimento = Atendimento(data_atendimento=data, executor='Pai João', procedimentos=f'em {data:%Y-%m-%d}',
+                              valor_total=valor, tipo_atendimento='consulta',
+                              id_usuario=id_usuario, id_cliente=id_cliente)
+    database.session.add(atendimento)
+    return atendimento
+
+
+def test_data_corte_e_o_primeiro_dia_do_mes():
+    assert arquivo.data_corte(12, hoje=date(2024, 3, 15)) == datetime(2023, 3, 1)
+    assert arquivo.data_corte(2, hoje=date(2024, 1, 31)) == datetime(2023, 11, 1)
+
+
+def test_arquivar_move_so_meses_fechados(app, usuario_vazio):
+    recente = datetime.combine(date.today().replace(day=1), datetime.min.time())
+    with app.app_context():
+        id_cliente = _cliente(usuario_vazio)
+        for dias in range(5):
+            _atendimento(usuario_vazio, id_cliente, datetime(2020, 1, 10) + timedelta(days=dias))
+        _atendimento(usuario_vazio, id_cliente, recente, 50)
+        database.session.commit()
+        antes = database.session.get(ResumoCliente, id_cliente)
+        antes = (antes.total_atendimentos, antes.valor_total)
+
+        (usuario, movidos, restantes), = arquivo.arquivar(usuario_vazio, meses=12, lote=2)
+        assert (usuario.id, movidos, restantes) == (usuario_vazio, 5, 1)
+        assert AtendimentoArquivo.query.filter_by(id_usuario=usuario_vazio).count() == 5
+        assert arquivo.arquivar(usuario_vazio, meses=12)[0][1] == 0  # idempotente
+
+        database.session.expire_all()
+        resumo = database.session.get(ResumoCliente, id_cliente)
+        assert (resumo.total_atendimentos, resumo.valor_total) == antes  # o resumo já soma o arquivo
+
+
+def test_listas_e_contagens_juntam_as_duas_tabelas(app, usuario_vazio):
+    with app.app_context():
+        id_cliente = _cliente(usuario_vazio)
+        datas = [datetime(2020, 1, 1) + timedelta(days=d) for d in range(4)] + [datetime.now() - timedelta(minutes=1)]
+        for data in datas:
+            _atendimento(usuario_vazio, id_cliente, data)
+        database.session.commit()
+        arquivo.arquivar(usuario_vazio, meses=12)
+
+        todos = arquivo.listar(usuario_vazio, limite=None)
+        assert [a.data_atendimento for a in todos] == sorted(datas, reverse=True)
+        assert [type(a) for a in todos] == [Atendimento] + [AtendimentoArquivo] * 4
+        assert arquivo.contar(usuario_vazio) == 5
+        assert arquivo.contar(usuario_vazio, inicio=datetime(2020, 1, 2), fim=datetime(2020, 1, 4)) == 2
+        assert arquivo.contar(usuario_vazio, lambda m: [m.id_cliente == id_cliente + 1000]) == 0
+
+        pagina = arquivo.Paginacao(page=2, per_page=2, id_usuario=usuario_vazio)
+        assert (pagina.total, pagina.pages) == (5, 3)
+        assert [a.data_atendimento for a in pagina.items] == sorted(datas, reverse=True)[2:4]
+        assert arquivo.obter(usuario_vazio, todos[-1].id).arquivado
+
+
+def test_ficha_e_detalhe_mostram_arquivados(app, usuario, cliente_http):
+    with app.app_context():
+        id_cliente = _cliente(usuario)
+        antigo = _atendimento(usuario, id_cliente, datetime(2019, 6, 1))
+        database.session.commit()
+        id_antigo = antigo.id
+        arquivo.arquivar(usuario, meses=12)
+        assert database.session.get(AtendimentoArquivo, id_antigo) is not None
+
+    assert 'em 2019-06-01' in cliente_http.get(f'/cliente/{id_cliente}').get_data(as_text=True)
+    assert cliente_http.get(f'/atendimento/{id_antigo}').status_code == 200
+
+
+def test_id_novo_nao_repete_o_de_um_arquivado(app, usuario_vazio):
+    with app.app_context():
+        id_cliente = _cliente(usuario_vazio)
+        antigo = _atendimento(usuario_vazio, id_cliente, datetime(2020, 5, 5))  # o maior id da tabela quente
+        database.session.commit()
+        id_antigo = antigo.id
+        arquivo.arquivar(usuario_vazio, meses=12)
+
+        novo = _atendimento(usuario_vazio, id_cliente, datetime.now())
+        database.session.commit()
+        assert novo.id > id_antigo
+        assert arquivo.obter(usuario_vazio, id_antigo).procedimentos == 'em 2020-05-05'
@@ -0,0 +1,53 @@
+# tests/test_backup.py
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from odutech.backup import copiar_sqlite, ErroBackup
+
+
+@pytest.fixture
+def banco(tmp_path):
+    caminho = str(tmp_path / 'origem.db')
+    conn = sqlite3.connect(caminho)
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, dado TEXT)')
+    conn.executemany('INSERT INTO t (dado) VALUES (?)', [('x' * 500,) for _ in range(2000)])
+    conn.commit()
+    conn.close()
+    return caminho
+
+
+def test_copia_consistente(app, banco, tmp_path):
+    destino = str(tmp_path / 'copia.db')
+    copiar_sqlite(banco, destino, paginas=16, pausa=0)
+    assert sqlite3.connect(destino).execute('SELECT count(*) FROM t').fetchone()[0] == 2000
+
+
+def test_escrita_continua_desiste_sem_bloquear_escritores(app, banco, tmp_path):
+    reinicios, pausa_max = app.config['BACKUP_REINICIOS'], app.config['BACKUP_PAUSA_MAX']
+    app.config.update(BACKUP_REINICIOS=5, BACKUP_PAUSA_MAX=0.02)
+    parar = threading.Event()
+    esperas = []
+
+    def escrever():
+        conn = sqlite3.connect(banco, timeout=30)
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            conn.execute("INSERT INTO t (dado) VALUES ('y')")
+            conn.commit()
+            esperas.append(time.perf_counter() - inicio)
+            time.sleep(0.001)
+        conn.close()
+
+    escritor = threading.Thread(target=escrever)
+    escritor.start()
+    try:
+        with pytest.raises(ErroBackup):
+            copiar_sqlite(banco, str(tmp_path / 'copia.db'), paginas=1, pausa=0.002)
+    finally:
+        parar.set()
+        escritor.join()
+        app.config.update(BACKUP_REINICIOS=reinicios, BACKUP_PAUSA_MAX=pausa_max)
+    assert esperas and max(esperas) < 1.0
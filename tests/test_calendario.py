@@ -0,0 +1,48 @@
+# tests/test_calendario.py
+from datetime import date, datetime
+
+import pytest
+
+from odutech import database
+from odutech.models import Atendimento, Cliente, Usuario
+
+
+@pytest.fixture(scope='module')
+def fevereiros(app):
+    """Atendimentos em fevereiro de 1987 e de 1988 (anos que nenhum outro teste usa), uma vez por módulo."""
+    with app.app_context():
+        usuario = Usuario.query.filter_by(email='teste@exemplo.com').one().id
+        cliente = Cliente(nome='Cliente Calendário', data_nascimento=date(1960, 1, 1), nome_mae='Ana',
+                          id_usuario=usuario)
+        database.session.add(cliente)
+        database.session.flush()
+        for data, valor, procedimento in ((datetime(1987, 2, 3, 10), 30, 'fev87 a'),
+                                          (datetime(1987, 2, 3, 15), 20, 'fev87 b'),
+                                          (datetime(1987, 2, 28, 23, 59), 50, 'fev87 c'),
+                                          (datetime(1988, 2, 3), 99, 'fev88')):
+            database.session.add(Atendimento(data_atendimento=data, executor='Pai João', procedimentos=procedimento,
+                                             valor_total=valor, tipo_atendimento='consulta',
+                                             id_usuario=usuario, id_cliente=cliente.id))
+        database.session.commit()
+
+
+def test_filtro_de_mes_respeita_o_ano(cliente_http, fevereiros):
+    pagina = cliente_http.get('/atendimentos?ano=1987&mes=2').get_data(as_text=True)
+    assert all(p in pagina for p in ('fev87 a', 'fev87 b', 'fev87 c'))
+    assert 'fev88' not in pagina
+
+    pagina = cliente_http.get('/atendimentos?ano=1988').get_data(as_text=True)
+    assert 'fev88' in pagina and 'fev87' not in pagina
+
+
+def test_calendario_soma_por_dia(cliente_http, fevereiros):
+    dados = cliente_http.get('/api/atendimentos/calendario?ano=1987&mes=2').get_json()
+    assert (dados['ano'], dados['mes'], len(dados['dias'])) == (1987, 2, 28)
+    assert (dados['total_atendimentos'], dados['valor_total'], dados['maximo_dia']) == (3, 100, 2)
+    dias = {d['data']: d for d in dados['dias'] if d['atendimentos']}
+    assert {d: (v['atendimentos'], v['valor'], v['nivel']) for d, v in dias.items()} == {
+        '1987-02-03': (2, 50, 4), '1987-02-28': (1, 50, 2)}
+
+    assert cliente_http.get('/atendimentos/calendario?ano=1987&mes=2').status_code == 200
+    vazio = cliente_http.get('/api/atendimentos/calendario?ano=1986&mes=2').get_json()
+    assert vazio['total_atendimentos'] == 0 and {d['nivel'] for d in vazio['dias']} == {0}
@@ -0,0 +1,14 @@
+# tests/test_compressao.py
+import pytest
+
+
+@pytest.mark.parametrize('codificacao', ['identity', 'gzip', 'br'])
+def test_etag_fraca_revalida_com_qualquer_codificacao(cliente_http, id_cliente, codificacao):
+    cabecalhos = {'Accept-Encoding': codificacao}
+    primeira = cliente_http.get(f'/cliente/{id_cliente}', headers=cabecalhos)
+    assert primeira.status_code == 200
+    etag = primeira.headers['ETag']
+    assert etag.startswith('W/')
+
+    segunda = cliente_http.get(f'/cliente/{id_cliente}', headers={**cabecalhos, 'If-None-Match': etag})
+    assert segunda.status_code == 304
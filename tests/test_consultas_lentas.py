@@ -0,0 +1,60 @@
+# tests/test_consultas_lentas.py
+import json
+
+import pytest
+from sqlalchemy import text
+
+from odutech import database
+from odutech import consultas_lentas
+from odutech.models import Cliente
+
+
+@pytest.fixture
+def log(app, tmp_path):
+    arquivo = tmp_path / 'consultas_lentas.log'
+    limite = app.config['CONSULTAS_LENTAS_MS']
+    app.config['CONSULTAS_LENTAS_MS'] = 0  # tudo é "lento"
+    consultas_lentas.ativar(str(arquivo))
+    yield arquivo
+    consultas_lentas.desativar()
+    app.config['CONSULTAS_LENTAS_MS'] = limite
+
+
+def _registros(arquivo):
+    return [json.loads(linha) for linha in arquivo.read_text(encoding='utf-8').splitlines()]
+
+
+def test_registra_sql_parametros_redigidos_e_plano(app, usuario, log):
+    with app.app_context():
+        Cliente.query.filter(Cliente.id_usuario == usuario, Cliente.nome == 'Fulano').all()
+
+    [registro] = [r for r in _registros(log) if 'FROM cliente' in r['sql']]
+    assert registro['usuario'] is None and registro['ms'] >= 0
+    assert registro['parametros'] == [usuario, '<str:6>']
+    assert registro['plano'] and all(isinstance(p, str) for p in registro['plano'])
+
+
+def test_statement_com_erro_nao_afeta_os_seguintes(app, log):
+    with app.app_context():
+        conexao = database.session.connection()
+        for _ in range(3):
+            with pytest.raises(Exception):
+                conexao.execute(text('SELECT * FROM tabela_que_nao_existe'))
+            database.session.rollback()
+            conexao = database.session.connection()
+        assert not any(k.startswith('consultas_lentas') for k in conexao.info)
+        conexao.execute(text('SELECT 42'))
+
+    registros = _registros(log)
+    assert not any('tabela_que_nao_existe' in r['sql'] for r in registros)
+    assert any(r['sql'] == 'SELECT 42' for r in registros)
+
+
+def test_resumo_agrupa_pelo_sql_normalizado(app, log):
+    with app.app_context():
+        for ids in ([1, 2], [1, 2, 3]):
+            Cliente.query.filter(Cliente.id.in_(ids)).all()
+
+    [grupo] = [g for g in consultas_lentas.resumo(str(log), top=50) if 'cliente.id IN' in g['sql']]
+    assert grupo['vezes'] == 2 and 'IN (?, ...)' in grupo['sql']
+    assert grupo['medio_ms'] == grupo['total_ms'] / 2
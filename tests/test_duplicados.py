@@ -0,0 +1,95 @@
+# tests/test_duplicados.py
+from datetime import date, datetime
+
+from odutech import database
+from odutech.duplicados import encontrar_grupos, mesclar_grupo, mesclar_todos
+from odutech.linhagem import atualizar_linhagem
+from odutech.models import Atendimento, Cliente, ClienteDocumento, VinculoRitual
+
+NASCIMENTO = date(1992, 7, 14)
+
+
+def _cliente(id_usuario, nome, nome_mae='Marta', **campos):
+    cliente = Cliente(nome=nome, data_nascimento=NASCIMENTO, nome_mae=nome_mae, id_usuario=id_usuario, **campos)
+    database.session.add(cliente)
+    database.session.flush()
+    return cliente
+
+
+def _atendimento(id_usuario, id_cliente):
+    database.session.add(Atendimento(data_atendimento=datetime(2024, 3, 1), executor='Pai João',
+                                     procedimentos='Consulta', valor_total=30, tipo_atendimento='consulta',
+                                     id_usuario=id_usuario, id_cliente=id_cliente))
+
+
+def _grupos(id_usuario):
+    certos, parecidos = encontrar_grupos(id_usuario)
+    return ([sorted(c.nome for c in g) for g in certos], [sorted(c.nome for c in g) for g in parecidos])
+
+
+def test_so_nome_normalizado_igual_e_certo(app, usuario_vazio):
+    with app.app_context():
+        _cliente(usuario_vazio, 'José da Silva')
+        _cliente(usuario_vazio, 'Jose  da Silva')
+        _cliente(usuario_vazio, 'Jose da Silva', nome_mae='Ana')  # outra mãe: nem parecido
+        _cliente(usuario_vazio, 'Bruno Lima')
+        _cliente(usuario_vazio, 'Breno Lima')  # mesma chave fonética, mesmo nascimento
+        database.session.commit()
+
+        certos, parecidos = _grupos(usuario_vazio)
+        assert certos == [['Jose  da Silva', 'José da Silva']]
+        assert parecidos == [['Breno Lima', 'Bruno Lima']]
+
+
+def test_mesclar_todos_nao_junta_pessoas_diferentes(app, usuario_vazio):
+    with app.app_context():
+        bruno, breno = _cliente(usuario_vazio, 'Bruno Lima'), _cliente(usuario_vazio, 'Breno Lima')
+        ids = {bruno.id, breno.id}
+        database.session.commit()
+
+        [(_, certos, parecidos)] = mesclar_todos(usuario_vazio)
+        assert certos == [] and len(parecidos) == 1
+        assert {c.id for c in Cliente.query.filter_by(id_usuario=usuario_vazio)} == ids
+
+
+def test_mesclar_leva_atendimentos_documentos_e_vinculos(app, usuario_vazio):
+    with app.app_context():
+        principal = _cliente(usuario_vazio, 'Maria Aparecida', telefone='1111')
+        copia = _cliente(usuario_vazio, 'MARIA APARECIDA', email='maria@exemplo.com')
+        _atendimento(usuario_vazio, principal.id)
+        _atendimento(usuario_vazio, principal.id)
+        _atendimento(usuario_vazio, copia.id)
+        database.session.add(ClienteDocumento(filename_original='ficha.pdf', filename_stored='docs/ficha.pdf',
+                                              id_usuario=usuario_vazio, id_cliente=copia.id))
+        filho = _cliente(usuario_vazio, 'Filho de Santo', ojubona='Maria Aparecida')
+        atualizar_linhagem(filho)
+        assert filho.vinculos_rituais == []  # duas Marias: o nome não é único
+        ids = (principal.id, copia.id, filho.id)
+        database.session.commit()
+
+        mesclar_todos(usuario_vazio)
+        id_principal, id_copia, id_filho = ids
+        assert database.session.get(Cliente, id_copia) is None
+        assert Atendimento.query.filter_by(id_cliente=id_principal).count() == 3
+        assert ClienteDocumento.query.filter_by(id_cliente=id_principal).count() == 1
+        assert VinculoRitual.query.filter_by(id_cliente=id_filho).one().id_cliente_ref == id_principal
+        mesclado = database.session.get(Cliente, id_principal)
+        assert (mesclado.telefone, mesclado.email) == ('1111', 'maria@exemplo.com')
+
+
+def test_grupo_parecido_so_com_confirmacao(app, usuario_vazio):
+    with app.app_context():
+        bruno, breno = _cliente(usuario_vazio, 'Bruno Lima'), _cliente(usuario_vazio, 'Breno Lima')
+        _atendimento(usuario_vazio, breno.id)
+        afilhado = _cliente(usuario_vazio, 'Afilhado', nome_mae='Rosa', padrinho='breno lima')
+        atualizar_linhagem(afilhado)
+        ids = [bruno.id, breno.id, afilhado.id]
+        database.session.commit()
+
+        assert mesclar_grupo(usuario_vazio, ids[:2]) == [(ids[1], 'Breno Lima')]
+        assert {c.id for c in Cliente.query.filter_by(id_usuario=usuario_vazio)} == {ids[0], ids[2]}
+        assert Atendimento.query.filter_by(id_cliente=ids[0]).count() == 1
+        # quem citava a grafia do duplicado passa a citar (e apontar para) o principal
+        afilhado = database.session.get(Cliente, ids[2])
+        assert afilhado.padrinho == 'Bruno Lima'
+        assert VinculoRitual.query.filter_by(id_cliente=ids[2]).one().id_cliente_ref == ids[0]
@@ -0,0 +1,121 @@
+# tests/test_estoque.py
+import threading
+
+import pytest
+from sqlalchemy import func
+
+from odutech import database
+from odutech.estoque import movimentar, EstoqueInsuficiente
+from odutech.models import Produto, MovimentoEstoque
+
+ESTOQUE_INICIAL = 10
+THREADS = 24
+
+
+@pytest.fixture
+def id_produto(app, usuario):
+    with app.app_context():
+        produto = Produto(nome='Vela', preco=5.0, quantidade_estoque=0, id_usuario=usuario)
+        database.session.add(produto)
+        database.session.flush()
+        movimentar(usuario, produto.id, ESTOQUE_INICIAL, 'saldo_inicial')
+        database.session.commit()
+        return produto.id
+
+
+def _estado(id_produto):
+    estoque = database.session.get(Produto, id_produto).quantidade_estoque
+    razao = (database.session.query(func.sum(MovimentoEstoque.quantidade))
+             .filter(MovimentoEstoque.id_produto == id_produto).scalar())
+    return estoque, razao
+
+
+def test_vendas_concorrentes_sem_atualizacao_perdida(app, usuario, id_produto):
+    resultados = []
+    largada = threading.Barrier(THREADS)
+
+    def vender():
+        with app.app_context():
+            largada.wait()
+            try:
+                movimentar(usuario, id_produto, -1, 'venda')
+                database.session.commit()
+                resultados.append('ok')
+            except EstoqueInsuficiente:
+                database.session.rollback()
+                resultados.append('sem_estoque')
+            except Exception as e:
+                database.session.rollback()
+                resultados.append(repr(e))
+
+    threads = [threading.Thread(target=vender) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert resultados.count('ok') == ESTOQUE_INICIAL
+    assert resultados.count('sem_estoque') == THREADS - ESTOQUE_INICIAL
+    with app.app_context():
+        estoque, razao = _estado(id_produto)
+    assert estoque == 0
+    assert razao == 0  # saldo_inicial (+10) e dez vendas (-1)
+    with app.app_context():
+        vendas = (database.session.query(func.sum(MovimentoEstoque.quantidade))
+                  .filter(MovimentoEstoque.id_produto == id_produto, MovimentoEstoque.motivo == 'venda').scalar())
+    assert vendas == -ESTOQUE_INICIAL
+
+
+def _formulario(id_produto, **campos):
+    dados = {'nome': 'Vela', 'descricao': '', 'preco': '5.00', 'quantidade_estoque': str(ESTOQUE_INICIAL),
+             'estoque_original': str(ESTOQUE_INICIAL)}
+    dados.update(campos)
+    return dados
+
+
+def test_edicao_nao_desfaz_venda_feita_com_o_formulario_aberto(app, usuario, cliente_http, id_produto):
+    assert f'value="{ESTOQUE_INICIAL}"' in cliente_http.get(f'/produto/editar/{id_produto}').data.decode()
+    with app.app_context():  # venda entre abrir e salvar o formulário
+        movimentar(usuario, id_produto, -1, 'venda')
+        database.session.commit()
+
+    resp = cliente_http.post(f'/produto/editar/{id_produto}', data=_formulario(id_produto, nome='Vela branca'))
+    assert resp.status_code == 302
+    with app.app_context():
+        assert _estado(id_produto) == (ESTOQUE_INICIAL - 1, ESTOQUE_INICIAL - 1)
+        assert database.session.get(Produto, id_produto).nome == 'Vela branca'
+
+    # entrada de 5 unidades sobre o saldo visto: soma à venda, não sobrescreve
+    cliente_http.post(f'/produto/editar/{id_produto}', data=_formulario(
+        id_produto, quantidade_estoque=str(ESTOQUE_INICIAL + 4), estoque_original=str(ESTOQUE_INICIAL - 1)))
+    with app.app_context():
+        assert _estado(id_produto) == (ESTOQUE_INICIAL + 4, ESTOQUE_INICIAL + 4)
+
+
+def test_edicao_sem_saldo_original_e_recusada(app, cliente_http, id_produto):
+    resp = cliente_http.post(f'/produto/editar/{id_produto}', data=_formulario(id_produto, estoque_original='',
+                                                                                quantidade_estoque='3'))
+    assert resp.status_code == 302 and resp.headers['Location'].endswith(f'/produto/editar/{id_produto}')
+    with app.app_context():
+        assert _estado(id_produto) == (ESTOQUE_INICIAL, ESTOQUE_INICIAL)
+
+
+def test_api_ajusta_pelo_saldo_que_o_app_leu(app, usuario, api, id_produto):
+    with app.app_context():  # venda depois de o app ler o saldo
+        movimentar(usuario, id_produto, -1, 'venda')
+        database.session.commit()
+
+    resp = api('POST', '/api/v1/produtos', json={'itens': [
+        {'id': id_produto, 'quantidade_estoque': ESTOQUE_INICIAL + 5, 'estoque_original': ESTOQUE_INICIAL}]})
+    assert resp.status_code == 200, resp.get_json()
+    with app.app_context():
+        assert _estado(id_produto) == (ESTOQUE_INICIAL + 4, ESTOQUE_INICIAL + 4)
+
+    # sem quantidade_estoque o saldo não muda; com ela, sem o original, o item é recusado
+    assert api('POST', '/api/v1/produtos', json={'itens': [{'id': id_produto, 'nome': 'Vela azul'}]}).status_code == 200
+    resp = api('POST', '/api/v1/produtos', json={'itens': [{'id': id_produto, 'quantidade_estoque': 1}]})
+    assert resp.status_code == 422
+    assert resp.get_json()['erros'][0]['erros'] == {'estoque_original': ['Informe o saldo lido antes da alteração.']}
+    with app.app_context():
+        assert _estado(id_produto) == (ESTOQUE_INICIAL + 4, ESTOQUE_INICIAL + 4)
+        assert database.session.get(Produto, id_produto).nome == 'Vela azul'
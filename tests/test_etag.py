@@ -0,0 +1,15 @@
+# tests/test_etag.py
+
+
+def test_revalidacao_devolve_304(cliente_http, id_cliente):
+    etag = cliente_http.get(f'/cliente/{id_cliente}').headers['ETag']
+    assert cliente_http.get(f'/cliente/{id_cliente}', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_etag_com_limite_csrf_de_um_segundo(app, cliente_http, id_cliente):
+    limite = app.config.get('WTF_CSRF_TIME_LIMIT')
+    app.config['WTF_CSRF_TIME_LIMIT'] = 1
+    try:
+        assert cliente_http.get(f'/cliente/{id_cliente}').status_code == 200
+    finally:
+        app.config['WTF_CSRF_TIME_LIMIT'] = limite
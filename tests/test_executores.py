@@ -0,0 +1,68 @@
+# tests/test_executores.py
+from datetime import date, datetime
+
+from odutech import database, executores
+from odutech.models import Atendimento, Cliente, Executor, vincular_executores
+
+
+def _cliente(id_usuario):
+    cliente = Cliente(nome='Cliente Executores', data_nascimento=date(1980, 1, 1), nome_mae='Ana', id_usuario=id_usuario)
+    database.session.add(cliente)
+    database.session.flush()
+    return cliente.id
+
+
+def _atendimento(id_usuario, id_cliente, executor, data, valor, tipo='consulta'):
+    database.session.add(Atendimento(data_atendimento=data, executor=executor, procedimentos='Consulta',
+                                     valor_total=valor, tipo_atendimento=tipo,
+                                     id_usuario=id_usuario, id_cliente=id_cliente))
+
+
+def test_grafias_diferentes_viram_um_executor(app, usuario_vazio):
+    with app.app_context():
+        id_cliente = _cliente(usuario_vazio)
+        for grafia in ('Pai João', 'pai joao', '  PAI   JOÃO ', 'Mãe Maria'):
+            _atendimento(usuario_vazio, id_cliente, grafia, datetime(2024, 1, 1), 10)
+        database.session.commit()
+
+        assert executores.nomes(usuario_vazio) == ['Mãe Maria', 'Pai João']
+        atendimentos = Atendimento.query.filter_by(id_usuario=usuario_vazio).order_by(Atendimento.id).all()
+        assert len({a.id_executor for a in atendimentos[:3]}) == 1
+        assert atendimentos[1].executor == 'pai joao'  # o texto do atendimento fica como foi digitado
+
+
+def test_backfill_usa_a_grafia_mais_usada(app, usuario_vazio):
+    with app.app_context():
+        id_cliente = _cliente(usuario_vazio)
+        database.session.commit()
+        a = Atendimento.__table__
+        linhas = [dict(data_atendimento=datetime(2024, 1, 1), executor=grafia, procedimentos='x', valor_total=1,
+                       tipo_atendimento='consulta', id_usuario=usuario_vazio, id_cliente=id_cliente)
+                  for grafia in ('PAI JOAO', 'Pai João', 'Pai João', 'pai joão')]
+        database.session.execute(a.insert(), linhas)  # direto na tabela: sem id_executor, como num banco antigo
+
+        assert vincular_executores(database.session.connection(), usuario_vazio) == 4
+        database.session.commit()
+        assert [e.nome for e in Executor.query.filter_by(id_usuario=usuario_vazio)] == ['Pai João']
+        assert Atendimento.query.filter_by(id_usuario=usuario_vazio, id_executor=None).count() == 0
+        assert vincular_executores(database.session.connection(), usuario_vazio) == 0
+
+
+def test_estatisticas_por_executor_no_periodo(app, usuario_vazio):
+    with app.app_context():
+        id_cliente = _cliente(usuario_vazio)
+        _atendimento(usuario_vazio, id_cliente, 'Pai João', datetime(2024, 3, 1), 100, 'ebó')
+        _atendimento(usuario_vazio, id_cliente, 'pai joao', datetime(2024, 3, 31, 18), 50, 'consulta')
+        _atendimento(usuario_vazio, id_cliente, 'Pai João', datetime(2024, 3, 10), 50, 'consulta')
+        _atendimento(usuario_vazio, id_cliente, 'Mãe Maria', datetime(2024, 3, 15), 200, 'consulta')
+        _atendimento(usuario_vazio, id_cliente, 'Mãe Maria', datetime(2024, 4, 1), 999, 'consulta')  # fora
+        database.session.commit()
+
+        resultado = executores.estatisticas(usuario_vazio, date(2024, 3, 1), date(2024, 3, 31))
+        assert resultado['totais'] == {'atendimentos': 4, 'receita': 400, 'executores': 2}
+        joao, maria = resultado['executores']  # mesma receita: mais atendimentos primeiro
+        assert (maria['nome'], maria['atendimentos'], maria['participacao']) == ('Mãe Maria', 1, 0.5)
+        assert (joao['nome'], joao['atendimentos'], joao['receita'], joao['ticket_medio']) == ('Pai João', 3, 200, 200 / 3)
+        assert (joao['primeiro'], joao['ultimo']) == (datetime(2024, 3, 1), datetime(2024, 3, 31, 18))
+        assert joao['tipos'] == {'ebó': {'atendimentos': 1, 'receita': 100, 'percentual': 1 / 3},
+                                 'consulta': {'atendimentos': 2, 'receita': 100, 'percentual': 2 / 3}}
@@ -0,0 +1,60 @@
+# tests/test_linhagem.py
+from datetime import date
+
+from odutech import database
+from odutech.linhagem import atualizar_linhagem
+from odutech.models import Cliente, LinhagemFechamento, preencher_derivados
+
+
+def _ancestrais(id_cliente):
+    return {a for (a,) in database.session.query(LinhagemFechamento.id_ancestral_cliente)
+            .filter(LinhagemFechamento.id_descendente == id_cliente,
+                    LinhagemFechamento.id_ancestral_cliente.isnot(None))}
+
+
+def _criar(usuario, nome, **rituais):
+    cliente = Cliente(nome=nome, data_nascimento=date(1980, 5, 5), nome_mae='Rosa', id_usuario=usuario, **rituais)
+    database.session.add(cliente)
+    database.session.flush()
+    atualizar_linhagem(cliente)
+    database.session.commit()
+    return cliente.id
+
+
+def _id_por_nome(nome):
+    return Cliente.query.filter_by(nome=nome).one().id
+
+
+def test_cliente_novo_e_renomeado_atualizam_quem_cita_o_nome(app, usuario, cliente_http):
+    with app.app_context():
+        filho = _criar(usuario, 'Filho de Santo', navalha='Mãe Joana de Oxum')
+        neto = _criar(usuario, 'Neto de Santo', navalha='filho de santo')
+        assert _ancestrais(filho) == set()
+
+    resp = cliente_http.post('/cliente/novo', data={'nome': 'Mae Joana de Oxum', 'data_nascimento': '1950-01-01',
+                                                    'nome_mae': 'Benedita', 'confirmar_duplicado': '1'})
+    assert resp.status_code == 302
+    with app.app_context():
+        joana = _id_por_nome('Mae Joana de Oxum')
+        assert _ancestrais(filho) == {joana}
+        assert _ancestrais(neto) == {filho, joana}
+
+    resp = cliente_http.post(f'/cliente/editar/{joana}', data={'nome': 'Joana Ti Oxum', 'data_nascimento': '1950-01-01',
+                                                               'nome_mae': 'Benedita'})
+    assert resp.status_code == 302
+    with app.app_context():
+        assert _ancestrais(filho) == set()
+        assert _ancestrais(neto) == {filho}
+
+
+def test_nomes_rituais_normalizados_e_preenchidos_em_linhas_antigas(app, usuario):
+    with app.app_context():
+        id_cliente = _criar(usuario, 'Iaô Novo', navalha='  Pai  JOSÉ de Ogum', madrinha='')
+        cliente = database.session.get(Cliente, id_cliente)
+        assert (cliente.navalha_norm, cliente.madrinha_norm) == ('pai jose de ogum', None)
+
+        # linha gravada antes das colunas existirem
+        database.session.execute(Cliente.__table__.update().where(Cliente.id == id_cliente).values(navalha_norm=None))
+        database.session.commit()
+        preencher_derivados()
+        assert database.session.get(Cliente, id_cliente).navalha_norm == 'pai jose de ogum'
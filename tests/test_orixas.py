@@ -0,0 +1,36 @@
+# tests/test_orixas.py
+from odutech import database
+from odutech.models import Cliente, ClienteOrixa, preencher_derivados
+
+
+def test_orixas_assentados_normalizados_e_consultaveis(app, cliente_http, id_cliente):
+    resp = cliente_http.post(f'/cliente/{id_cliente}/rituais',
+                             data={'orixas_assentados_raw': 'oxossi,  Xangô , OXÓSSI, ,logun  ede'})
+    assert resp.status_code == 302
+    with app.app_context():
+        cliente = database.session.get(Cliente, id_cliente)
+        assert cliente.orixas_assentados_raw == 'Oxóssi, Xangô, Logun Ede'
+        assert sorted(o.orixa.chave for o in ClienteOrixa.query.filter_by(id_cliente=id_cliente)) == \
+            ['logun ede', 'oxossi', 'xango']
+
+    dados = cliente_http.get('/api/orixas/Oxóssi').get_json()
+    assert dados['orixa'] == {'chave': 'oxossi', 'nome': 'Oxóssi'}
+    assert id_cliente in [c['id'] for c in dados['clientes']]
+    contagens = {o['chave']: o['clientes'] for o in cliente_http.get('/api/orixas').get_json()['orixas']}
+    assert contagens['xango'] >= 1
+    assert cliente_http.get('/api/orixas/inexistente').status_code == 404
+
+    # regravar troca a lista (sem sobras da anterior)
+    cliente_http.post(f'/cliente/{id_cliente}/rituais', data={'orixas_assentados_raw': 'Xango'})
+    with app.app_context():
+        assert [o.orixa.chave for o in ClienteOrixa.query.filter_by(id_cliente=id_cliente)] == ['xango']
+    dados = cliente_http.get('/api/orixas/oxossi').get_json()
+    assert id_cliente not in [c['id'] for c in dados['clientes']]
+
+
+def test_backfill_de_clientes_anteriores_a_tabela(app, id_cliente):
+    with app.app_context():
+        database.session.get(Cliente, id_cliente).orixas_assentados_raw = 'iemanja, Oxum'
+        database.session.commit()
+        preencher_derivados()
+        assert sorted(o.orixa.nome for o in ClienteOrixa.query.filter_by(id_cliente=id_cliente)) == ['Iemanjá', 'Oxum']
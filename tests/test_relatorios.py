@@ -0,0 +1,109 @@
+# tests/test_relatorios.py
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from odutech import database, tarefas
+from odutech.models import Atendimento, Cliente, TarefaRelatorio
+
+MARCO_2021 = {'data_inicio': '2021-03-01', 'data_fim': '2021-03-31', 'tipo': 'ebó', 'granularidade': 'mes'}
+
+
+@pytest.fixture
+def atendimentos(app, usuario, id_cliente):
+    with app.app_context():
+        for i in range(6):
+            database.session.add(Atendimento(id_cliente=id_cliente, executor='Pai João', procedimentos=f'relatorio {i}',
+                                             valor_total=10.0, tipo_atendimento='ebó', id_usuario=usuario,
+                                             data_atendimento=datetime(2021, 3, 1) + timedelta(days=i)))
+        database.session.commit()
+
+
+@pytest.fixture
+def limites(app):
+    anteriores = {k: app.config[k] for k in ('RELATORIO_LIMITE_SINCRONO', 'RELATORIO_VENDAS_DETALHE')}
+    yield app.config
+    app.config.update(anteriores)
+
+
+def test_pagina_sincrona_mostra_detalhe_limitado(cliente_http, atendimentos, limites):
+    limites.update(RELATORIO_LIMITE_SINCRONO=10000, RELATORIO_VENDAS_DETALHE=2)
+    html = cliente_http.get('/relatorios/vendas?data_inicio=2021-03-01&data_fim=2021-03-31').data.decode()
+    assert 'relatorio 5' in html and 'relatorio 4' in html and 'relatorio 3' not in html
+    assert 'Exibindo as 2 vendas mais recentes de' in html
+
+
+def test_api_periodo_grande_vai_para_segundo_plano(cliente_http, atendimentos, limites):
+    url = '/api/relatorios/vendas?data_inicio=2021-03-01&data_fim=2021-03-31&granularidade=mes'
+    sincrona = cliente_http.get(url).get_json()
+
+    limites.update(RELATORIO_LIMITE_SINCRONO=3)
+    resp = cliente_http.get(url)
+    assert resp.status_code == 202
+    tarefa = resp.get_json()['url']
+    for _ in range(100):
+        if cliente_http.get(tarefa).get_json()['status'] == 'concluido':
+            break
+        time.sleep(0.05)
+    resp = cliente_http.get(url)
+    assert resp.status_code == 200
+    assert resp.get_json()['totais'] == sincrona['totais']
+    assert sincrona['totais']['atendimentos'] >= 6
+
+
+def _atendimento(id_usuario, id_cliente, data, tipo='ebó'):
+    atendimento = Atendimento(id_cliente=id_cliente, executor='Pai João', procedimentos='versao', valor_total=10.0,
+                              tipo_atendimento=tipo, id_usuario=id_usuario, data_atendimento=data)
+    database.session.add(atendimento)
+    database.session.commit()
+    return atendimento
+
+
+def test_versao_so_muda_com_atendimentos_do_filtro(app, usuario_vazio):
+    with app.app_context():
+        cliente = Cliente(nome='Versao', data_nascimento=datetime(1990, 1, 1).date(), nome_mae='Ana',
+                          id_usuario=usuario_vazio)
+        database.session.add(cliente)
+        database.session.commit()
+        dentro = _atendimento(usuario_vazio, cliente.id, datetime(2021, 3, 10))
+        chave = tarefas.chave_relatorio(usuario_vazio, MARCO_2021)
+
+        _atendimento(usuario_vazio, cliente.id, datetime(2021, 4, 1))                # fora do período
+        _atendimento(usuario_vazio, cliente.id, datetime(2021, 3, 11), tipo='outro')  # fora do tipo
+        assert tarefas.chave_relatorio(usuario_vazio, MARCO_2021) == chave
+
+        dentro.valor_total = 20.0
+        database.session.commit()
+        editado = tarefas.chave_relatorio(usuario_vazio, MARCO_2021)
+        assert editado != chave
+
+        database.session.delete(dentro)
+        database.session.commit()
+        assert tarefas.chave_relatorio(usuario_vazio, MARCO_2021) not in (chave, editado)
+
+
+def test_tarefa_nova_apaga_as_que_nao_serao_usadas(app, usuario_vazio):
+    agora = datetime.utcnow()
+    with app.app_context():
+        for chave, parametros, status, criado, alterado in (
+                ('versao-antiga', json.dumps(MARCO_2021, sort_keys=True), 'concluido', agora, agora),
+                ('travada', '{"p": 1}', 'executando', agora, agora - timedelta(hours=1)),
+                ('vencida', '{"p": 2}', 'concluido', agora - timedelta(days=30), agora - timedelta(days=30)),
+                ('outros-filtros', '{"p": 3}', 'concluido', agora, agora)):
+            database.session.add(TarefaRelatorio(chave=chave, parametros=parametros, status=status, criado_em=criado,
+                                                 atualizado_em=alterado, id_usuario=usuario_vazio))
+        database.session.commit()
+
+        nova = tarefas.obter_ou_agendar(usuario_vazio, dict(reversed(MARCO_2021.items())))
+        id_nova = nova.id
+        assert json.loads(nova.parametros) == MARCO_2021
+        assert {t.chave for t in TarefaRelatorio.query.filter_by(id_usuario=usuario_vazio)} == \
+            {'outros-filtros', nova.chave}
+        for _ in range(100):
+            database.session.expire_all()
+            if database.session.get(TarefaRelatorio, id_nova).status in ('concluido', 'erro'):
+                break
+            time.sleep(0.05)
+        assert database.session.get(TarefaRelatorio, id_nova).status == 'concluido'
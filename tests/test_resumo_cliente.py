@@ -0,0 +1,57 @@
+# tests/test_resumo_cliente.py
+import re
+from datetime import datetime, timedelta
+
+from odutech import database
+from odutech.models import Atendimento, ResumoCliente
+from odutech.routes import HISTORICO_POR_PAGINA
+
+_DETALHES = re.compile(r'href="/atendimento/\d+"')
+
+
+def _atendimento(id_usuario, id_cliente, data, valor, tipo='consulta'):
+    atendimento = Atendimento(data_atendimento=data, executor='Pai João', procedimentos='Consulta',
+                              valor_total=valor, tipo_atendimento=tipo, id_usuario=id_usuario, id_cliente=id_cliente)
+    database.session.add(atendimento)
+    return atendimento
+
+
+def test_resumo_acompanha_inclusao_edicao_e_exclusao(app, usuario, id_cliente):
+    with app.app_context():
+        assert database.session.get(ResumoCliente, id_cliente).total_atendimentos == 0
+        _atendimento(usuario, id_cliente, datetime(2024, 5, 1), 50, 'ebó')
+        antigo = _atendimento(usuario, id_cliente, datetime(2024, 1, 1), 30)  # fora de ordem: não vira o último
+        database.session.commit()
+
+        resumo = database.session.get(ResumoCliente, id_cliente)
+        assert (resumo.total_atendimentos, resumo.valor_total, resumo.ticket_medio) == (2, 80, 40)
+        assert (resumo.ultimo_atendimento, resumo.ultimo_tipo) == (datetime(2024, 5, 1), 'ebó')
+
+        antigo.valor_total, antigo.data_atendimento = 70, datetime(2024, 6, 1)
+        database.session.commit()
+        database.session.expire_all()
+        resumo = database.session.get(ResumoCliente, id_cliente)
+        assert (resumo.valor_total, resumo.ultimo_atendimento, resumo.ultimo_tipo) == \
+            (120, datetime(2024, 6, 1), 'consulta')
+
+        database.session.delete(antigo)
+        database.session.commit()
+        database.session.expire_all()
+        resumo = database.session.get(ResumoCliente, id_cliente)
+        assert (resumo.total_atendimentos, resumo.valor_total, resumo.ultimo_tipo) == (1, 50, 'ebó')
+
+
+def test_ficha_mostra_uma_pagina_e_carrega_o_resto(app, usuario, id_cliente, cliente_http):
+    total = HISTORICO_POR_PAGINA + 5
+    with app.app_context():
+        for i in range(total):
+            _atendimento(usuario, id_cliente, datetime(2024, 1, 1) + timedelta(days=i), 10)
+        database.session.commit()
+
+    ficha = cliente_http.get(f'/cliente/{id_cliente}').get_data(as_text=True)
+    assert len(_DETALHES.findall(ficha)) == HISTORICO_POR_PAGINA
+    assert f'/cliente/{id_cliente}/historico?page=2' in ficha
+
+    resto = cliente_http.get(f'/cliente/{id_cliente}/historico?page=2').get_data(as_text=True)
+    assert len(_DETALHES.findall(resto)) == 5
+    assert 'historico?page=3' not in resto
@@ -0,0 +1,25 @@
+# tests/test_saude.py
+from odutech import saude
+
+
+def test_healthz_nao_depende_do_aquecimento(app):
+    resp = app.test_client().get('/healthz')
+    assert (resp.status_code, resp.get_json()) == (200, {'status': 'ok'})
+
+
+def test_readyz_aquece_e_fica_pronto(app):
+    resp = app.test_client().get('/readyz')
+    assert resp.status_code == 200, resp.get_json()
+    corpo = resp.get_json()
+    assert corpo['status'] == 'ok' and corpo['aquecido'] and corpo['banco'] and corpo['volume_uploads']
+    assert saude.aquecer()['templates'] == len(app.jinja_env.list_templates(extensions=['html']))
+
+
+def test_readyz_503_sem_volume_gravavel(app, tmp_path, monkeypatch):
+    saude.aquecer()
+    monkeypatch.setitem(app.config, 'UPLOADS_ROOT', str(tmp_path / 'nao-existe'))
+    resp = app.test_client().get('/readyz')
+    assert resp.status_code == 503
+    corpo = resp.get_json()
+    assert (corpo['status'], corpo['banco'], corpo['volume_uploads']) == ('indisponivel', True, False)
+    assert corpo['erro_volume']
@@ -0,0 +1,71 @@
+# tests/test_shards.py
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+
+from odutech import database, shards
+from odutech.models import Atendimento, AtendimentoArquivo, Cliente, Usuario, atendimentos_com_arquivo
+from odutech.shards import _tabela, caminho_shard, como_usuario, dividir_banco
+
+
+@pytest.fixture
+def sharding(app, tmp_path):
+    anteriores = {k: app.config[k] for k in ('SHARDING', 'SHARD_DIR')}
+    app.config.update(SHARDING=True, SHARD_DIR=str(tmp_path))
+    yield tmp_path
+    app.config.update(anteriores)
+    for caminho in [c for c in shards._engines if c.startswith(str(tmp_path))]:
+        shards._descartar_engine(caminho)
+
+
+def _clientes_no_arquivo(caminho, id_usuario):
+    engine = create_engine(f'sqlite:///{caminho}')
+    try:
+        with engine.connect() as conn:
+            return [n for (n,) in conn.execute(text('SELECT nome FROM cliente WHERE id_usuario = :u ORDER BY id'),
+                                               {'u': id_usuario})]
+    finally:
+        engine.dispose()
+
+
+def test_tabela_de_cada_tipo_de_consulta():
+    assert _tabela(Cliente.__mapper__, None).name == 'cliente'
+    assert _tabela(None, select(Cliente.id).join(Atendimento, Atendimento.id_cliente == Cliente.id)).name == 'cliente'
+    assert _tabela(None, select(func.count()).select_from(atendimentos_com_arquivo())).name == 'atendimento'
+    assert _tabela(None, AtendimentoArquivo.__table__.delete()).name == 'atendimento_arquivo'
+    assert _tabela(None, text('SELECT 1')) is None
+
+
+def test_dados_do_usuario_vao_para_o_shard(app, usuario_vazio, sharding):
+    with app.app_context():
+        with como_usuario(usuario_vazio):
+            database.session.add(Cliente(nome='No Shard', data_nascimento=date(1990, 1, 1), nome_mae='Ana',
+                                         id_usuario=usuario_vazio))
+            database.session.commit()
+            assert [c.nome for c in Cliente.query.filter_by(id_usuario=usuario_vazio)] == ['No Shard']
+            assert database.session.get(Usuario, usuario_vazio) is not None  # tabela central: banco principal
+        assert Cliente.query.filter_by(id_usuario=usuario_vazio).count() == 0  # sem usuário ativo: principal
+    assert _clientes_no_arquivo(sharding / f'usuario_{usuario_vazio}.db', usuario_vazio) == ['No Shard']
+
+
+def test_request_logado_usa_o_shard_do_usuario(app, usuario, cliente_http, sharding):
+    resp = cliente_http.post('/cliente/novo', data={'nome': 'Cliente do Request', 'data_nascimento': '1991-01-01',
+                                                    'nome_mae': 'Rosa', 'confirmar_duplicado': '1'})
+    assert resp.status_code == 302
+    with app.app_context():
+        assert _clientes_no_arquivo(caminho_shard(usuario), usuario) == ['Cliente do Request']
+        assert Cliente.query.filter_by(nome='Cliente do Request').count() == 0
+
+
+def test_dividir_banco_copia_as_linhas_de_cada_usuario(app, usuario_vazio, sharding):
+    with app.app_context():
+        database.session.add(Cliente(nome='Antes da Divisão', data_nascimento=date(1990, 1, 1), nome_mae='Ana',
+                                     id_usuario=usuario_vazio))
+        database.session.commit()
+        relatorio = dict((u.id, copiadas) for u, copiadas in dividir_banco())
+        assert relatorio[usuario_vazio]['cliente'] == 1
+        assert _clientes_no_arquivo(caminho_shard(usuario_vazio), usuario_vazio) == ['Antes da Divisão']
+        # já com dados: pulado, a menos que substituir=True
+        assert dict((u.id, c) for u, c in dividir_banco())[usuario_vazio] is None
+        assert dict((u.id, c) for u, c in dividir_banco(substituir=True))[usuario_vazio]['cliente'] == 1
@@ -0,0 +1,38 @@
+# tests/test_textos.py
+from datetime import date
+
+from flask_bcrypt import generate_password_hash
+
+from odutech import database
+from odutech.models import Cliente, ClienteDocumento, Usuario, usuario_fts
+from odutech.textos import buscar, gravar
+
+
+def _documento(id_usuario, conteudo):
+    cliente = Cliente(nome='Cliente Documento', data_nascimento=date(1991, 2, 3), nome_mae='Ana', id_usuario=id_usuario)
+    database.session.add(cliente)
+    database.session.flush()
+    doc = ClienteDocumento(filename_original='ficha.txt', filename_stored='docs/ficha.txt', mimetype='text/plain',
+                           id_usuario=id_usuario, id_cliente=cliente.id)
+    database.session.add(doc)
+    database.session.flush()
+    gravar(doc, 'indexado', conteudo)
+    database.session.commit()
+    return doc.id
+
+
+def test_busca_so_ve_documentos_do_usuario(app, usuario):
+    with app.app_context():
+        outro = Usuario(username='outra casa', email='outra@exemplo.com',
+                        senha=generate_password_hash('senha123').decode('utf-8'))
+        database.session.add(outro)
+        database.session.commit()
+        meu = _documento(usuario, 'Obrigação de Oxóssi, sete anos')
+        alheio = _documento(outro.id, f'Obrigação de Oxóssi, um ano {usuario_fts(usuario)}')
+
+        assert [r['documento'].id for r in buscar(usuario, 'obrigacao oxossi')] == [meu]
+        assert [r['documento'].id for r in buscar(outro.id, 'obrigação')] == [alheio]
+        # termos só casam com o texto: o token de usuário não vira resultado
+        assert [r['documento'].id for r in buscar(outro.id, usuario_fts(usuario))] == [alheio]
+        assert buscar(usuario, usuario_fts(usuario)) == []
+